@@ -1,17 +1,42 @@
-from flask import Flask, render_template, request, jsonify, redirect
+from flask import Flask, render_template, request, jsonify, redirect, Response
 import sqlite3
 import os
+import hashlib
 import json
 import sys
-import threading
-import time
-import websocket
-import math
+import queue
+import re
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
+from indicators import ATR_METHODS, atr, live_channel, live_channels, regression_bands
+from candle_store import candle_store, iso_to_ms, ms_to_dt
+from migrations import migrate, start_backfill
+from rollups import Rollups, TIMEFRAMES, MINUTE_MS, ROLLUP_UPSERT, init_rollup_table, rollup_rows, tail_bars
+from sqlite_writer import SQLiteWriter
+from binance_stream import BinanceStreamClient
+from backfill import GapFiller, kline_symbols
+from price_board import PRICE_STALE_AFTER, PriceBoard, PriceConflator, is_stale, now_ms, quote_age
+from partitions import PricePartitions, delete_symbol_rows, read_page, table_names
+from retention import Compactor
+from archive import ARCHIVE_DIR, CandleArchive, resample
+from signals import bucket_signals, candle_signal, read_signals, signal_time
+
 app = Flask(__name__)
 DB_PATH = "/data/prices.db"
+
+# Бары 5m/15m/1h/4h, обновляемые потоком @kline_1m
+rollups = Rollups()
+
+# M1-свечи — в дневных партициях prices_YYYYMMDD; старые дни удаляет компакция
+price_partitions = PricePartitions(DB_PATH)
+
+# Единственный писатель свечей в SQLite (пакетные транзакции);
+# недостающие партиции он заводит сам, до записи пачки
+db_writer = SQLiteWriter(DB_PATH, prepare=price_partitions.prepare)
+# закрытые дни уходят в колоночный архив до удаления из SQLite (см. archive.py)
+candle_archive = CandleArchive(ARCHIVE_DIR)
+compactor = Compactor(DB_PATH, price_partitions, archive=candle_archive)
 # === МОДУЛЬ 2: Интерфейсные маршруты и конфигурация канала ===
 
 # Загрузка настроек канала из JSON-файла
@@ -75,6 +100,7 @@ def api_symbols():
         c.execute("INSERT OR IGNORE INTO symbols (name) VALUES (?)", (symbol,))
         conn.commit()
         conn.close()
+        binance.refresh()  # подписка на новую пару без переподключения
         return jsonify({"success": True})
 
 # Удаление символа и его свечей
@@ -84,9 +110,15 @@ def delete_symbol(symbol):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("DELETE FROM symbols WHERE name = ?", (symbol,))
-    c.execute("DELETE FROM prices WHERE symbol = ?", (symbol.lower(),))
+    delete_symbol_rows(conn, symbol)
+    c.execute("DELETE FROM rollups WHERE symbol = ?", (symbol.lower(),))
     conn.commit()
     conn.close()
+    candle_store.drop(symbol)
+    rollups.drop(symbol)
+    latest_price.drop(symbol.lower())
+    price_conflator.drop(symbol.lower())
+    binance.refresh()  # UNSUBSCRIBE по удалённой паре
     return jsonify({"success": True})
 
 # Очистка только свечей для пары
@@ -94,15 +126,31 @@ def delete_symbol(symbol):
 def clear_prices(symbol):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("DELETE FROM prices WHERE symbol = ?", (symbol.lower(),))
+    delete_symbol_rows(conn, symbol)
+    c.execute("DELETE FROM rollups WHERE symbol = ?", (symbol.lower(),))
     conn.commit()
     conn.close()
+    candle_store.drop(symbol)
+    rollups.drop(symbol)
     return jsonify({"success": True})
 # === МОДУЛЬ 4: Приём сигналов через webhook ===
 
 from flask import request, jsonify
-import psycopg2
 from datetime import datetime
+from pg_pool import pg, pg_connection
+from pg_writer import PGBatchWriter
+
+# Сигналы пишутся пачками в фоне: webhook только проверяет сообщение, ставит его
+# в очередь и сразу отвечает 200 — TradingView не ждёт соединения с PostgreSQL.
+# Повтор (symbol, action, минута) отбрасывается ещё до очереди.
+SIGNALS_FLUSH_DELAY = 0.25
+SIGNAL_SYMBOL_RE = re.compile(r"^[A-Z0-9]{2,30}$")
+
+signals_writer = PGBatchWriter(
+    "signals", ("symbol", "action", "type", "timestamp"),
+    conflict=("symbol", "action", "timestamp"),
+    flush_delay=SIGNALS_FLUSH_DELAY, max_rows=1000, dedupe=True,
+)
 
 # Маршрут обработки POST-запроса от TradingView и других источников
 @app.route("/webhook", methods=["POST"])
@@ -125,6 +173,8 @@ def webhook():
         action = parts[0].upper()
         raw_symbol = parts[1].upper()
         symbol = raw_symbol.replace(".P", "")  # Удаляем возможный суффикс .P
+        if not SIGNAL_SYMBOL_RE.match(symbol):
+            return jsonify({"status": "invalid symbol"}), 400
 
         # 3. Определение типа сигнала
         if action in ["BUY", "SELL", "BUYORDER", "SELLORDER"]:
@@ -137,35 +187,72 @@ def webhook():
         # 4. Фиксация текущего времени (UTC) — обрезка до минут
         timestamp = datetime.utcnow().replace(second=0, microsecond=0)
 
-        # 5. Запись сигнала в PostgreSQL
-        conn = psycopg2.connect(
-            dbname=os.environ.get("PG_NAME"),
-            user=os.environ.get("PG_USER"),
-            password=os.environ.get("PG_PASSWORD"),
-            host=os.environ.get("PG_HOST"),
-            port=os.environ.get("PG_PORT", 5432)
-        )
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO signals (symbol, action, type, timestamp)
-            VALUES (%s, %s, %s, %s)
-        """, (symbol, action, signal_type, timestamp))
-        conn.commit()
-        conn.close()
-
-        print(f"✅ Сигнал записан: {symbol} | {action} | {signal_type} | {timestamp}")
-        return jsonify({"status": "success"}), 200
+        # 5. В очередь записи в PostgreSQL (signals_writer, пачкой в фоне)
+        queued = signals_writer.add((symbol, action, signal_type, timestamp))
+        return jsonify({"status": "success", "duplicate": not queued}), 200
 
     except Exception as e:
         print("❌ Ошибка при обработке webhook:", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 # === МОДУЛЬ 5: API свечей + сигнал + расчёт канала на каждую свечу ===
 
+# ?since=<ts в мс или "YYYY-MM-DD HH:MM"> — только свечи новее курсора,
+# ?limit=N — не больше N последних. Ответ несёт ETag: неизменившийся опрос
+# с If-None-Match получает 304 без тела и без пересчёта канала.
 @app.route("/api/candles/<symbol>")
 def api_candles(symbol):
     interval = request.args.get("interval", "1m")
-    if interval not in ["1m", "5m"]:
-        return jsonify([])
+    try:
+        since = parse_cursor(request.args.get("since"))
+        limit = request.args.get("limit", type=int)
+    except ValueError:
+        return jsonify({"error": "invalid since"}), 400
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "invalid limit"}), 400
+
+    etag = candles_etag(symbol, interval, since, limit)
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_candle_rows(symbol, interval, since=since, limit=limit))
+    if etag:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Курсор since: epoch ms или время свечи в формате поля "time"
+def parse_cursor(value):
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    return iso_to_ms(value)
+
+# ETag по состоянию данных: последний бар, число баров, сигналы и настройки канала
+def candles_etag(symbol, interval, since, limit):
+    if interval == "1m":
+        version = candle_store.version(symbol)
+    elif interval in TIMEFRAMES:
+        version = rollups.version(interval, symbol)
+    else:
+        return None
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*), MAX(id) FROM signals WHERE symbol = ?", (symbol.upper(),))
+        signals_version = c.fetchone()
+        conn.close()
+    except Exception as e:
+        print("Ошибка чтения из БД:", e)
+        return None
+    config = load_channel_config()
+    key = f"{symbol.lower()}|{interval}|{since}|{limit}|{version}|{signals_version}|{config.get('length', 50)}|{config.get('deviation', 2.0)}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+# Свечи с сигналом и каналом, от новых к старым
+def build_candle_rows(symbol, interval, since=None, limit=None):
+    if interval != "1m" and interval not in TIMEFRAMES:
+        return []
 
     try:
         config = load_channel_config()
@@ -174,97 +261,49 @@ def api_candles(symbol):
 
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
-        c.execute("SELECT timestamp, open, high, low, close FROM prices WHERE symbol = ? ORDER BY timestamp ASC", (symbol.lower(),))
-        rows = c.fetchall()
-        c.execute("SELECT timestamp, action FROM signals WHERE symbol = ?", (symbol.upper(),))
-        signal_rows = [(datetime.fromisoformat(row[0]), row[1].upper()) for row in c.fetchall()]
+        signal_rows = read_signals(conn, symbol)
         conn.close()
     except Exception as e:
         print("Ошибка чтения из БД:", e)
-        return jsonify([])
-
-    from collections import defaultdict
-
-    prices_map = []
-    for ts_str, o, h, l, c_ in rows:
-        try:
-            ts = datetime.fromisoformat(ts_str)
-        except:
-            continue
-        prices_map.append((ts, float(o), float(h), float(l), float(c_)))
-
-    candles_raw = []
-    if interval == "5m":
-        grouped = defaultdict(list)
-        for ts, o, h, l, c_ in prices_map:
-            minute = (ts.minute // 5) * 5
-            ts_bin = ts.replace(minute=minute, second=0, microsecond=0)
-            grouped[ts_bin].append((o, h, l, c_))
-        for ts in sorted(grouped.keys()):
-            bucket = grouped[ts]
-            if not bucket:
-                continue
-            o = bucket[0][0]
-            h = max(x[1] for x in bucket)
-            l = min(x[2] for x in bucket)
-            c_ = bucket[-1][3]
-            candles_raw.append((ts, o, h, l, c_))
+        return []
+
+    # M1 — из кэша в памяти, старшие таймфреймы — готовые бары из rollups.
+    # Перед курсором берём length-1 свечей, чтобы окно канала было полным.
+    cursor = since + 1 if since is not None else None
+    pad = max(length - 1, 0) if cursor is not None or limit is not None else 0
+    if interval == "1m":
+        rows = candle_store.rows(symbol, since=cursor, limit=limit, pad=pad)
     else:
-        for ts, o, h, l, c_ in prices_map:
-            ts_clean = ts.replace(second=0, microsecond=0)
-            candles_raw.append((ts_clean, o, h, l, c_))
+        rows = rollups.rows(interval, symbol, since=cursor, limit=limit, pad=pad)
+    candles_raw = [(ms_to_dt(ts), o, h, l, c_) for ts, o, h, l, c_ in rows]
 
-    group_minutes = 5 if interval == "5m" else 1
+    group_minutes = TIMEFRAMES[interval] // MINUTE_MS if interval != "1m" else 1
     group = {}
 
-    for i in range(len(candles_raw)):
-        ts, o, h, l, c_ = candles_raw[i]
-        key = ts.replace(second=0, microsecond=0)
+    # канал по всей выборке — одним вызовом NumPy (см. indicators.py)
+    lowers, mids, uppers = regression_bands([row[4] for row in candles_raw], length, deviation)
 
-        orders = []
-        zones = []
-        for st, act in signal_rows:
-            if key <= st < key + timedelta(minutes=group_minutes):
-                if "ORDER" in act:
-                    orders.append((st, act))
-                elif "ZONE" in act:
-                    zones.append((st, act))
-
-        signal_text = ""
-        signal_type = ""
-
-        if interval == "5m":
-            if orders and (not zones or orders[0][0] < zones[0][0]):
-                signal_text = orders[0][1] + " (-)"
-            elif zones and (not orders or zones[0][0] < orders[0][0]):
-                signal_text = orders[0][1] if orders else ""
-                signal_type = zones[-1][1]
-            elif zones and orders:
-                signal_text = orders[0][1] + " (-)"
-                signal_type = zones[-1][1]
-
-        # расчёт канала
-        window = candles_raw[max(0, i - length + 1): i + 1]
-        if not window:
-            continue
-        avg_x = sum(range(len(window))) / len(window)
-        avg_y = sum([row[4] for row in window]) / len(window)
-        cov_xy = sum([(i - avg_x) * (row[4] - avg_y) for i, row in enumerate(window)])
-        var_x = sum([(i - avg_x) ** 2 for i in range(len(window))])
-        slope = cov_xy / var_x if var_x else 0
-        intercept = avg_y - slope * avg_x
+    # свечи разгона в ответ не попадают
+    first = 0
+    if pad:
+        first = len(rows)
+        while first > 0 and (cursor is None or rows[first - 1][0] >= cursor):
+            first -= 1
+        if limit is not None:
+            first = max(first, len(rows) - limit)
+
+    # сигналы раскладываются по началу своего интервала один раз (порядок
+    # внутри корзины — как в выборке), дальше на свечу — один поиск в словаре
+    signal_buckets = bucket_signals(signal_rows, group_minutes) if interval != "1m" else {}
 
-        expected = [intercept + slope * i for i in range(len(window))]
-        std = (sum([(window[i][4] - expected[i]) ** 2 for i in range(len(window))]) / len(window)) ** 0.5
-        upper = expected[-1] + deviation * std
-        lower = expected[-1] - deviation * std
-        mid = expected[-1]
+    for i in range(first, len(candles_raw)):
+        ts, o, h, l, c_ = candles_raw[i]
+        key = ts.replace(second=0, microsecond=0)
 
-        width_percent = round((upper - lower) / mid * 100, 2) if mid else 0
-        angle_rad = math.atan(slope)
-        angle_deg = round(math.degrees(angle_rad), 1)
+        orders, zones = signal_buckets.get(key, ((), ()))
+        signal_text, signal_type = candle_signal(orders, zones)
 
-        direction = "вверх" if angle_deg > 2 else "вниз" if angle_deg < -2 else "флет"
+        lower, mid, upper = lowers[i], mids[i], uppers[i]
 
         group[key] = {
             "time": key.strftime("%Y-%m-%d %H:%M"),
@@ -276,8 +315,7 @@ def api_candles(symbol):
             "channel": f"{lower:.5f} / {mid:.5f} / {upper:.5f}",
         }
 
-    result = list(reversed(list(group.values())))
-    return jsonify(result)
+    return list(reversed(list(group.values())))
 
 # === МОДУЛЬ 6: Инициализация БД и поток Binance WebSocket ===
 
@@ -291,64 +329,51 @@ def init_db():
     conn.commit()
     conn.close()
 
-# Поток для получения 1-минутных свечей от Binance
-def fetch_kline_stream():
-    def on_message(ws, msg):
-        try:
-            data = json.loads(msg)
-            k = data['data']['k']
-            if not k['x']:
-                return
-            symbol = data['data']['s'].lower()
-            close = k['c']
-            print(f"📦 Получено: {symbol} @ {close}")
-            sys.stdout.flush()
-
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute("INSERT INTO prices (symbol, timestamp, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?)", (
-                symbol,
-                datetime.utcfromtimestamp(k['t'] // 1000).isoformat(),
-                float(k['o']), float(k['h']), float(k['l']), float(k['c'])
-            ))
-            conn.commit()
-            conn.close()
-            print(f"✅ Записано: {symbol} {k['t']} {k['c']}")
-            sys.stdout.flush()
-        except Exception as e:
-            print("❌ Ошибка записи свечи:", e)
-            sys.stdout.flush()
-
-    def run():
-        while True:
-            try:
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                c.execute("SELECT name FROM symbols")
-                symbols = [row[0].lower() for row in c.fetchall()]
-                conn.close()
-                if not symbols:
-                    print("⚠️ Нет пар для подписки. Ждём...")
-                    time.sleep(5)
-                    continue
-                streams = [f"{s}@kline_1m" for s in symbols]
-                url = "wss://fstream.binance.com/stream?streams=" + "/".join(streams)
-                print("🔁 Подписка на:", streams)
-                sys.stdout.flush()
-                ws = websocket.WebSocketApp(url, on_message=on_message)
-                ws.run_forever()
-            except Exception as e:
-                print("❌ Ошибка WebSocket:", e)
-                time.sleep(5)
-
-    threading.Thread(target=run, daemon=True).start()
+# Обработчик закрытых 1-минутных свечей от Binance (событие "kline")
+def on_kline(event):
+    try:
+        k = event.kline
+        if not k.closed:
+            return
+        symbol = event.symbol.lower()
+        print(f"📦 Получено: {symbol} @ {k.close}")
+        sys.stdout.flush()
+
+        events = store_candle(symbol, k.open_time, k.open, k.high, k.low, k.close)
+        print(f"📝 В очереди: {symbol} {k.open_time} {k.close}")
+        sys.stdout.flush()
+
+        # закрытие 5m-свечи — подписчикам SSE
+        for tf, bar, closed, complete in events:
+            if tf == "5m" and closed and live_hub.has_subscribers(symbol):
+                push_closed_candle(symbol, bar[0])
+    except Exception as e:
+        print("❌ Ошибка записи свечи:", e)
+        sys.stdout.flush()
+# Закрытая M1-свеча → кэш, rollups и очередь записи SQLite (см. sqlite_writer.py)
+def store_candle(symbol, open_time, o, h, l, c):
+    candle_store.append(symbol, open_time, o, h, l, c)
+    events = rollups.update(symbol, open_time, o, h, l, c)
+    db_writer.put(price_partitions.insert_sql(open_time), (
+        symbol,
+        datetime.utcfromtimestamp(open_time // 1000).isoformat(),
+        open_time,
+        o, h, l, c
+    ))
+    db_writer.put_many(ROLLUP_UPSERT, rollup_rows(symbol, events))
+    return events
+
+# Свечи, пропущенные за время обрыва, — тем же путём, что и живые (см. backfill.py)
+def store_backfill(symbol, rows):
+    for open_time, _close_time, o, h, l, c in rows:
+        store_candle(symbol, open_time, o, h, l, c)
+
+gap_filler = GapFiller(candle_store.last_ts, store_backfill)
+
 # === МОДУЛЬ 7: Debug — intercept через mid и avgX ===
 
 @app.route("/debug/<symbol>")
 def debug_channel(symbol):
-    from collections import defaultdict
-    from math import sqrt, atan, degrees
-    from datetime import datetime
     from zoneinfo import ZoneInfo
 
     interval = request.args.get("interval", "5m")
@@ -359,42 +384,21 @@ def debug_channel(symbol):
         config = load_channel_config()
         length = config.get("length", 50)
         deviation = config.get("deviation", 2.0)
-
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT timestamp, open, high, low, close FROM prices WHERE symbol = ? ORDER BY timestamp ASC", (symbol.lower(),))
-        rows = c.fetchall()
-        conn.close()
+        rows = channel_bars([symbol], length - 1)[symbol.lower()]
     except Exception as e:
         return f"<h3>Ошибка БД: {e}</h3>"
 
-    # 📊 Группировка данных по 5-минутным интервалам
-    grouped = defaultdict(list)
-    for ts_str, o, h, l, c_ in rows:
-        try:
-            ts = datetime.fromisoformat(ts_str)
-        except:
-            continue
-        minute = (ts.minute // 5) * 5
-        ts_bin = ts.replace(minute=minute, second=0, microsecond=0)
-        grouped[ts_bin].append((float(o), float(h), float(l), float(c_)))
-
-    candles = []
-    for ts in sorted(grouped.keys()):
-        bucket = grouped[ts]
-        if not bucket:
-            continue
-        o = bucket[0][0]
-        h = max(x[1] for x in bucket)
-        l = min(x[2] for x in bucket)
-        c_ = bucket[-1][3]
-        candles.append((ts, {"open": o, "high": h, "low": l, "close": c_}))
+    # 📊 Последние 5-минутные свечи (см. channel_bars)
+    candles = [
+        (ms_to_dt(ts), {"open": o, "high": h, "low": l, "close": c_})
+        for ts, o, h, l, c_ in rows
+    ]
 
     if len(candles) < length - 1:
         return "<h3>Недостаточно данных</h3>"
 
     closes = [c[1]["close"] for c in candles[-(length - 1):]]
-    current_price = latest_price.get(symbol.lower())
+    current_price = latest_price.price(symbol.lower())
     if not current_price:
         return "<h3>Нет текущей цены</h3>"
     closes.append(current_price)
@@ -402,37 +406,16 @@ def debug_channel(symbol):
     lows = [c[1]["low"] for c in candles[-(length - 1):]]
     highs = [c[1]["high"] for c in candles[-(length - 1):]]
 
-    x = list(range(length))
-    avgX = sum(x) / length
-    mid = sum(closes) / length
-
-    # 📐 Slope по реальным значениям (для построения канала)
-    covXY = sum((x[i] - avgX) * (closes[i] - mid) for i in range(length))
-    varX = sum((x[i] - avgX) ** 2 for i in range(length))
-    slope = covXY / varX
-    intercept = mid - slope * avgX
-
-    # 📊 StdDev и границы канала
-    dev = 0.0
-    for i in range(length):
-        expected = slope * i + intercept
-        dev += (closes[i] - expected) ** 2
-    stdDev = sqrt(dev / length)
-
-    y_start = intercept
-    y_end = intercept + slope * (length - 1)
-    center = (y_start + y_end) / 2
-    upper = center + deviation * stdDev
-    lower = center - deviation * stdDev
-    width_percent = round((upper - lower) / center * 100, 2)
-
-    # 🔁 Угол на нормализованных данных
-    base = closes[0] if closes[0] != 0 else 1
-    norm_closes = [c / base for c in closes]
-    norm_mid = sum(norm_closes) / length
-    norm_covXY = sum((x[i] - avgX) * (norm_closes[i] - norm_mid) for i in range(length))
-    norm_slope = norm_covXY / varX
-    angle_deg = round(degrees(atan(norm_slope)), 2)
+    # 📐 Канал и угол (см. indicators.py)
+    ch = live_channel(closes[:-1], current_price, length, deviation)
+    slope = ch["slope"]
+    intercept = ch["intercept"]
+    stdDev = ch["std"]
+    center = ch["center"]
+    upper = ch["upper"]
+    lower = ch["lower"]
+    width_percent = ch["width_percent"]
+    angle_deg = ch["angle"]
 
     # 📋 Подготовка таблицы
     rows_html = ""
@@ -488,78 +471,217 @@ def debug_channel(symbol):
     </html>
     """
 # === МОДУЛЬ 8: Поток Binance @trade — хранение текущих цен в latest_price ===
-latest_price = {}
+# Табло цен: цена + время события/приёма + счётчик сделок (см. price_board.py)
+latest_price = PriceBoard()
+
+# Источник текущей цены: trade (каждая сделка), aggTrade (агрегированные сделки)
+# или bookTicker (середина лучших bid/ask)
+PRICE_STREAMS = ("trade", "aggTrade", "bookTicker")
+PRICE_STREAM = os.environ.get("PRICE_STREAM", "trade")
+if PRICE_STREAM not in PRICE_STREAMS:
+    print(f"⚠️ PRICE_STREAM={PRICE_STREAM} не поддерживается, используется trade")
+    PRICE_STREAM = "trade"
+
+def publish_price(symbol, price, event_ms, ticks):
+    latest_price.update(symbol, price, event_ms, ticks)
+    live_hub.price_changed(symbol, price)
+
+# Сделки схлопываются: в табло — не чаще PRICE_CONFLATE_MS на символ
+price_conflator = PriceConflator(publish_price)
+
+# Обработчик сделок (события "trade" и "aggTrade")
+def on_trade(event):
+    try:
+        price_conflator.tick(event.symbol.lower(), event.price, event.event_ms)
+    except Exception as e:
+        print("Ошибка обработки trade-сообщения:", e)
 
-def fetch_trade_stream():
-    def on_message(ws, msg):
-        try:
-            data = json.loads(msg)
-            trade = data['data']
-            symbol = trade['s'].lower()
-            price = float(trade['p'])
-            latest_price[symbol] = price
-        except Exception as e:
-            print("Ошибка обработки trade-сообщения:", e)
-
-    def run():
-        while True:
-            try:
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                c.execute("SELECT name FROM symbols")
-                symbols = [row[0].lower() for row in c.fetchall()]
-                conn.close()
-                if not symbols:
-                    print("⚠️ Нет пар для подписки на @trade")
-                    time.sleep(5)
-                    continue
-                streams = [f"{s}@trade" for s in symbols]
-                url = "wss://fstream.binance.com/stream?streams=" + "/".join(streams)
-                print("🔁 Подписка на @trade:", streams)
-                sys.stdout.flush()
-                ws = websocket.WebSocketApp(url, on_message=on_message)
-                ws.run_forever()
-            except Exception as e:
-                print("❌ Ошибка WebSocket (@trade):", e)
-                time.sleep(5)
-
-    threading.Thread(target=run, daemon=True).start()
+# Обработчик лучших цен стакана (событие "bookTicker")
+def on_book_ticker(event):
+    try:
+        price_conflator.tick(event.symbol.lower(), (event.bid + event.ask) / 2, event.event_ms)
+    except Exception as e:
+        print("Ошибка обработки bookTicker-сообщения:", e)
+
+# Список потоков Binance по таблице symbols: @kline_1m и поток цены (PRICE_STREAM) на каждую пару
+def load_stream_names():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT name FROM symbols")
+    symbols = [row[0].lower() for row in c.fetchall()]
+    conn.close()
+    if not symbols:
+        print("⚠️ Нет пар для подписки. Ждём...")
+    else:
+        print(f"🔁 Подписка на @kline_1m и @{PRICE_STREAM}: {len(symbols)} пар")
+    sys.stdout.flush()
+    return [f"{s}@kline_1m" for s in symbols] + [f"{s}@{PRICE_STREAM}" for s in symbols]
+
+# Один asyncio-клиент на оба вида потоков (см. binance_stream.py)
+# перед подпиской каждого шарда — дозаполнение пропущенных минут по его символам
+binance = BinanceStreamClient(
+    streams_provider=load_stream_names,
+    on_connect=lambda streams: gap_filler.fill(kline_symbols(streams)),
+)
+binance.on("kline", on_kline)
+binance.on("trade", on_trade)
+binance.on("aggTrade", on_trade)
+binance.on("bookTicker", on_book_ticker)
+
+def start_binance_streams():
+    price_conflator.start()
+    binance.start_in_thread()
 # === МОДУЛЬ 9: Просмотр текущих цен из latest_price ===
 
+# ?max_age=N — порог устаревания в секундах (по умолчанию PRICE_STALE_AFTER),
+# ?fresh=1 — устаревшие цены не показывать вовсе
+def price_board_rows(max_age, fresh):
+    now = now_ms()
+    rows = []
+    for symbol, quote in sorted(latest_price.snapshot().items()):
+        stale = is_stale(quote, max_age, now)
+        if stale and fresh:
+            continue
+        rows.append({
+            "symbol": symbol.upper(),
+            "price": quote.price,
+            "event_time": datetime.utcfromtimestamp(quote.event_ms / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+            "received_time": datetime.utcfromtimestamp(quote.recv_ms / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+            "age": round(quote_age(quote, now), 1),
+            "ticks": quote.ticks,
+            "stale": stale,
+        })
+    return rows
+
 @app.route("/latest-prices")
 def latest_prices():
+    max_age = request.args.get("max_age", PRICE_STALE_AFTER, type=float)
+    fresh = request.args.get("fresh") == "1"
     rows = []
-    for symbol, price in sorted(latest_price.items()):
-        rows.append(f"<tr><td>{symbol.upper()}</td><td>{price}</td></tr>")
+    for row in price_board_rows(max_age, fresh):
+        style = " class='stale'" if row["stale"] else ""
+        rows.append(
+            f"<tr{style}><td>{row['symbol']}</td><td>{row['price']}</td><td>{row['event_time']}</td>"
+            f"<td>{row['received_time']}</td><td>{row['age']}</td><td>{row['ticks']}</td></tr>"
+        )
     html = f"""
     <html>
     <head>
         <title>Текущие цены из потока @trade</title>
         <style>
-            table {{ font-family: sans-serif; border-collapse: collapse; width: 400px; }}
+            table {{ font-family: sans-serif; border-collapse: collapse; width: 900px; }}
             th, td {{ border: 1px solid #aaa; padding: 6px; text-align: right; }}
             th {{ background-color: #eee; }}
+            tr.stale td {{ color: #b00; background-color: #fff0f0; }}
         </style>
     </head>
     <body>
         <h2>Текущие цены (из latest_price)</h2>
+        <p>Устаревшие (старше {max_age:g} с) выделены красным.</p>
         <table>
-            <thead><tr><th>Символ</th><th>Цена</th></tr></thead>
-            <tbody>{"".join(rows) if rows else "<tr><td colspan='2'>Нет данных</td></tr>"}</tbody>
+            <thead><tr><th>Символ</th><th>Цена</th><th>Время события (UTC)</th><th>Получено (UTC)</th><th>Возраст, с</th><th>Сделок</th></tr></thead>
+            <tbody>{"".join(rows) if rows else "<tr><td colspan='6'>Нет данных</td></tr>"}</tbody>
         </table>
     </body>
     </html>
     """
     return html
+
+@app.route("/api/latest-prices")
+def api_latest_prices():
+    max_age = request.args.get("max_age", PRICE_STALE_AFTER, type=float)
+    fresh = request.args.get("fresh") == "1"
+    return jsonify(price_board_rows(max_age, fresh))
+# Состояние очереди записи SQLite: глубина, размер пачек, время сброса
+@app.route("/api/ingest-stats")
+def ingest_stats():
+    return jsonify({
+        "sqlite_writer": db_writer.stats(),
+        "signals_writer": signals_writer.stats(),
+        "pg_pool": pg.stats(),
+        "binance": binance.stats,
+        "binance_shards": binance.shard_stats(),
+        "price_conflation": dict(price_conflator.stats, stream=PRICE_STREAM),
+        "gap_fill": gap_filler.stats(),
+        "compaction": compactor.stats(),
+        "live_hub": dict(live_hub.stats, subscribers=live_hub.subscriber_count()),
+    })
 # === МОДУЛЬ 10: API live-channel — расчёт по логике TV (49 свечей + latest_price) ===
 
 @app.route("/api/live-channel/<symbol>")
 def api_live_channel(symbol):
-    from collections import defaultdict
-    from math import sqrt, atan, degrees
-    from datetime import datetime, timedelta
+    return jsonify(compute_live_channel(symbol))
+
+# Все символы одним ответом: ?symbols=btcusdt,ethusdt или без параметра — все пары
+@app.route("/api/live-channel")
+def api_live_channels():
+    symbols = request.args.get("symbols")
+    if symbols:
+        symbols = [s.strip().lower() for s in symbols.split(",") if s.strip()]
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT name FROM symbols")
+        symbols = [row[0].lower() for row in c.fetchall()]
+        conn.close()
+    return jsonify(compute_live_channels(symbols))
+
+# Расчёт live-канала символа (общий для /api/live-channel и SSE-потока)
+def compute_live_channel(symbol):
+    return compute_live_channels([symbol])[symbol.lower()]
+
+# Последние `count` 5m-баров каждого символа: из rollups в памяти, а если кэш
+# символа короче окна (холодный старт, малый CANDLE_RETENTION) — хвостом из
+# SQLite (rollups.tail_bars). Ни один путь не читает историю символа целиком.
+def channel_bars(symbols, count):
+    bars = {}
+    conn = None
+    try:
+        for symbol in symbols:
+            symbol = symbol.lower()
+            rows = rollups.rows("5m", symbol, limit=count)
+            if len(rows) < count:
+                if conn is None:
+                    conn = sqlite3.connect(DB_PATH)
+                tail = tail_bars(conn, symbol, TIMEFRAMES["5m"], count)
+                if len(tail) > len(rows):
+                    rows = tail
+            bars[symbol] = rows
+    finally:
+        if conn is not None:
+            conn.close()
+    return bars
+
+# Первый сигнал текущего интервала по каждому символу: один запрос на все символы.
+# Обе ветки идут по индексу (symbol, ts): интервал по ts и строки без ts
+# (миграция не закончена) — только у запрошенных символов.
+def current_signals(symbols, start, end):
+    wanted = sorted({s.upper() for s in symbols})
+    if not wanted:
+        return {}
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    start_ms = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    end_ms = int(end.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    marks = ", ".join("?" * len(wanted))
+    c.execute(f"""
+        SELECT id, symbol, timestamp, ts, action FROM signals WHERE symbol IN ({marks}) AND ts >= ? AND ts < ?
+        UNION ALL
+        SELECT id, symbol, timestamp, ts, action FROM signals WHERE symbol IN ({marks}) AND ts IS NULL
+        ORDER BY id
+    """, (*wanted, start_ms, end_ms, *wanted))
+    signals = {}
+    for _id, symbol, ts_str, ts, action in c.fetchall():
+        st = signal_time(ts_str, ts)
+        if symbol not in signals and st is not None and start <= st < end:
+            signals[symbol] = action.upper()
+    conn.close()
+    return {symbol.lower(): action for symbol, action in signals.items()}
 
-    symbol = symbol.lower()
+# Каналы всех символов одним проходом: окна (49 свечей + текущая цена) собираются
+# в одну матрицу и считаются одним вызовом indicators.live_channels
+def compute_live_channels(symbols):
+    symbols = [s.lower() for s in symbols]
     interval_minutes = 5
     now = datetime.utcnow()
     start_minute = now.minute - now.minute % interval_minutes
@@ -569,114 +691,73 @@ def api_live_channel(symbol):
         config = load_channel_config()
         length = config.get("length", 50)
         deviation = config.get("deviation", 2.0)
-
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT timestamp, open, high, low, close FROM prices WHERE symbol = ? ORDER BY timestamp ASC", (symbol,))
-        rows = c.fetchall()
-        c.execute("SELECT timestamp, action FROM signals WHERE symbol = ?", (symbol.upper(),))
-        signal_rows = [(datetime.fromisoformat(r[0]), r[1].upper()) for r in c.fetchall()]
-        conn.close()
+        signals = current_signals(symbols, current_start, current_start + timedelta(minutes=interval_minutes))
+        bars = channel_bars(symbols, length - 1)
     except Exception as e:
-        return jsonify({"error": f"Ошибка БД: {str(e)}"})
-
-    # 📊 Группировка в 5-минутные свечи
-    grouped = defaultdict(list)
-    for ts_str, o, h, l, c_ in rows:
-        try:
-            ts = datetime.fromisoformat(ts_str)
-        except:
+        return {symbol: {"error": f"Ошибка БД: {str(e)}"} for symbol in symbols}
+
+    result = {}
+    ready = []
+    windows = []
+    prices = latest_price.snapshot()
+    now_at = now_ms()
+    for symbol in symbols:
+        # 📈 Последние 5-минутные свечи (см. channel_bars)
+        rows = bars[symbol]
+        if len(rows) < length - 1:
+            result[symbol] = {"error": "Недостаточно данных"}
             continue
-        minute = (ts.minute // interval_minutes) * interval_minutes
-        key = ts.replace(minute=minute, second=0, microsecond=0)
-        grouped[key].append((float(o), float(h), float(l), float(c_)))
-
-    # 📈 Построение списка свечей
-    candles = []
-    for ts in sorted(grouped.keys()):
-        bucket = grouped[ts]
-        if bucket:
-            o = bucket[0][0]
-            h = max(x[1] for x in bucket)
-            l = min(x[2] for x in bucket)
-            c_ = bucket[-1][3]
-            candles.append((ts, {"open": o, "high": h, "low": l, "close": c_}))
-
-    if len(candles) < length - 1:
-        return jsonify({"error": "Недостаточно данных"})
 
-    # 📉 Текущая цена
-    current_price = latest_price.get(symbol)
-    if not current_price:
-        return jsonify({"error": "Нет текущей цены"})
+        # 📉 Текущая цена
+        quote = prices.get(symbol)
+        if quote is None or not quote.price:
+            result[symbol] = {"error": "Нет текущей цены"}
+            continue
+        current_price = quote.price
 
-    # 📊 Реальные цены (для построения канала)
-    closes = [c[1]["close"] for c in candles[-(length - 1):]]
-    closes.append(current_price)
+        # 📊 Реальные цены (для построения канала): 49 закрытых свечей + текущая
+        windows.append([row[4] for row in rows] + [current_price])
+        ready.append((symbol, rows[-1][1] if rows else current_price, quote))
 
-    x = list(range(length))
-    avgX = sum(x) / length
-    mid = sum(closes) / length
-    covXY = sum((x[i] - avgX) * (closes[i] - mid) for i in range(length))
-    varX = sum((x[i] - avgX) ** 2 for i in range(length))
-    slope = covXY / varX
-    intercept = mid - slope * avgX
-
-    # 📏 Ширина и отклонения
-    dev = 0.0
-    for i in range(length):
-        expected = slope * i + intercept
-        dev += (closes[i] - expected) ** 2
-    stdDev = sqrt(dev / length)
-
-    y_start = intercept
-    y_end = intercept + slope * (length - 1)
-    center = (y_start + y_end) / 2
-    upper = center + deviation * stdDev
-    lower = center - deviation * stdDev
-    width_percent = round((upper - lower) / center * 100, 2)
-
-    # 🧠 Вставка нормализованных данных ТОЛЬКО для расчёта угла
-    base_price = closes[0] if closes[0] != 0 else 1
-    norm_closes = [c / base_price for c in closes]
-    norm_mid = sum(norm_closes) / length
-    norm_covXY = sum((x[i] - avgX) * (norm_closes[i] - norm_mid) for i in range(length))
-    norm_varX = sum((x[i] - avgX) ** 2 for i in range(length))
-    norm_slope = norm_covXY / norm_varX
-    angle_deg = round(degrees(atan(norm_slope)), 2)
-
-    # 🧭 Направление канала
-    if angle_deg > 0.01:
-        direction = "восходящий ↗️"
-        color = "green"
-    elif angle_deg < -0.01:
-        direction = "нисходящий ↘️"
-        color = "red"
-    else:
-        direction = "флет ➡️"
-        color = "black"
+    if not ready:
+        return result
 
-    # 📍 Актуальный сигнал
-    signal = ""
-    for st, act in signal_rows:
-        if current_start <= st < current_start + timedelta(minutes=interval_minutes):
-            signal = act
-            break
+    channels = live_channels(windows, deviation)
 
     # 🕓 Локальное время
     local_time = now.replace(tzinfo=timezone.utc).astimezone(ZoneInfo("Europe/Kyiv"))
 
-    return jsonify({
-        "time": now.strftime("%Y-%m-%d %H:%M:%S"),
-        "local_time": local_time.strftime("%Y-%m-%d %H:%M:%S"),
-        "open_price": round(candles[-1][1]["open"], 5),
-        "current_price": round(current_price, 5),
-        "direction": direction,
-        "direction_color": color,
-        "angle": angle_deg,
-        "width_percent": width_percent,
-        "signal": signal
-    })
+    for i, (symbol, open_price, quote) in enumerate(ready):
+        angle_deg = round(float(channels["angle"][i]), 2)
+
+        # 🧭 Направление канала
+        if angle_deg > 0.01:
+            direction = "восходящий ↗️"
+            color = "green"
+        elif angle_deg < -0.01:
+            direction = "нисходящий ↘️"
+            color = "red"
+        else:
+            direction = "флет ➡️"
+            color = "black"
+
+        result[symbol] = {
+            "time": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "local_time": local_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "open_price": round(open_price, 5),
+            "current_price": round(quote.price, 5),
+            # возраст цены по времени приёма; stale — старше PRICE_STALE_AFTER
+            "price_age": round(quote_age(quote, now_at), 1),
+            "stale": is_stale(quote, PRICE_STALE_AFTER, now_at),
+            "direction": direction,
+            "direction_color": color,
+            "angle": angle_deg,
+            "width_percent": round(float(channels["width_percent"][i]), 2),
+            # 📍 Актуальный сигнал
+            "signal": signals.get(symbol, ""),
+        }
+
+    return result
 # === МОДУЛЬ 11: Инициализация структуры БД (таблицы) ===
 
 def init_db():
@@ -714,6 +795,9 @@ def init_db():
         )
     """)
 
+    # Бары старших таймфреймов (5m/15m/1h/4h), см. rollups.py
+    init_rollup_table(c)
+
     # Таблица сделок
     c.execute("""
         CREATE TABLE IF NOT EXISTS trades (
@@ -756,6 +840,9 @@ def init_db():
 
     conn.commit()
     conn.close()
+
+    # Колонки ts (epoch ms) и индексы (symbol, ts); старые строки заполняются в фоне
+    migrate(DB_PATH)
 # === МОДУЛЬ 12: API + интерфейс просмотра содержимого таблиц БД ===
 
 # HTML-интерфейс для просмотра базы данных
@@ -763,52 +850,136 @@ def init_db():
 def view_db():
     return render_template("db.html")
 
-# API для загрузки данных из таблицы с фильтрацией и пагинацией
+DB_TABLES = {"symbols", "signals", "prices", "trades", "trade_exits"}
+DB_PAGE_MAX = 500
+# exact / prefix идут по индексу, если он есть на поле; contains — полный просмотр
+DB_MATCH_MODES = ("exact", "prefix", "contains")
+
+# Колонки таблицы и поле курсора: id, иначе первичный ключ, иначе rowid
+def db_table_columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    info = c.fetchall()
+    columns = [row[1] for row in info]
+    if "id" in columns:
+        return columns, "id"
+    pk = [row[1] for row in info if row[5] == 1]
+    return columns, (pk[0] if pk else "rowid")
+
+# Условие фильтра без WHERE. Регистр значения не важен (как у прежнего LIKE):
+# сравнение с вариантами как введено / нижний / верхний — каждый по индексу.
+def db_filter(field, value, match):
+    if match == "contains":
+        return f"{field} LIKE ?", [f"%{value}%"]
+    variants = list(dict.fromkeys((value, value.lower(), value.upper())))
+    if match == "exact":
+        return f"{field} IN ({', '.join('?' * len(variants))})", variants
+    # prefix: диапазон [value, value с увеличенным последним символом)
+    parts, params = [], []
+    for v in variants:
+        parts.append(f"({field} >= ? AND {field} < ?)")
+        params.extend([v, v[:-1] + chr(ord(v[-1]) + 1)])
+    return "(" + " OR ".join(parts) + ")", params
+
+# Курсор prices — "ts:id" последней строки, остальных таблиц — значение ключа
+def parse_db_cursor(value, table):
+    if not value:
+        return None
+    if table == "prices":
+        ts, row_id = value.split(":")
+        return int(ts), int(row_id)
+    return int(value) if value.lstrip("-").isdigit() else value
+
+# API для загрузки данных из таблицы: фильтр и keyset-пагинация от новых к старым.
+# ?field=&value=&match=exact|prefix|contains&limit=&before_id=
+# Следующая страница — before_id из заголовка X-Next-Before-Id (нет — конец).
+# Стоимость страницы не зависит от глубины: WHERE key < курсор по индексу, без OFFSET.
 @app.route("/api/db/<table>")
 def api_db_table(table):
-    # Параметры запроса
+    if table not in DB_TABLES:
+        return jsonify({"error": "Недопустимая таблица"}), 400
+
     field = request.args.get("field")
     value = request.args.get("value")
-    offset = int(request.args.get("offset", 0))
-    limit = int(request.args.get("limit", 50))
-
-    allowed_tables = {"symbols", "signals", "prices", "trades", "trade_exits"}
-    if table not in allowed_tables:
-        return jsonify({"error": "Недопустимая таблица"}), 400
+    match = request.args.get("match", "exact")
+    if match not in DB_MATCH_MODES:
+        return jsonify({"error": f"match: одно из {', '.join(DB_MATCH_MODES)}"}), 400
 
     try:
+        limit = max(1, min(int(request.args.get("limit", 50)), DB_PAGE_MAX))
         conn = sqlite3.connect(DB_PATH)
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
 
-        # Проверяем наличие колонки id
-        c.execute(f"PRAGMA table_info({table})")
-        columns = [row[1] for row in c.fetchall()]
-        order_column = "id" if "id" in columns else "rowid"
-
-        # Формируем запрос
-        query = f"SELECT * FROM {table}"
-        params = []
+        columns, key = db_table_columns(c, table)
+        if field and field not in columns:
+            conn.close()
+            return jsonify({"error": f"Нет поля {field} в {table}"}), 400
+        try:
+            before = parse_db_cursor(request.args.get("before_id"), table)
+        except ValueError:
+            conn.close()
+            return jsonify({"error": "Недопустимый before_id"}), 400
 
-        if field and value:
-            query += f" WHERE {field} LIKE ?"
-            params.append(f"%{value}%")
+        where, params = db_filter(field, value, match) if field and value else ("", [])
 
-        query += f" ORDER BY {order_column} DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        if table == "prices":
+            # дневные партиции и наследная таблица, курсор (ts, id)
+            rows = read_page(conn, where, params, before, limit)
+            next_cursor = f"{rows[-1]['ts']}:{rows[-1]['id']}" if len(rows) == limit else None
+        else:
+            conditions = [where] if where else []
+            if before is not None:
+                conditions.append(f"{key} < ?")
+                params.append(before)
+            query = f"SELECT {'rowid, ' if key == 'rowid' else ''}* FROM {table}"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += f" ORDER BY {key} DESC LIMIT ?"
+            c.execute(query, params + [limit])
+            rows = c.fetchall()
+            next_cursor = str(rows[-1][key]) if len(rows) == limit else None
 
-        c.execute(query, params)
-        rows = [dict(row) for row in c.fetchall()]
         conn.close()
+        response = jsonify([dict(row) for row in rows])
+        if next_cursor is not None:
+            response.headers["X-Next-Before-Id"] = next_cursor
+        return response
 
-        return jsonify(rows)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+# Примерное число строк без COUNT(*): sqlite_stat1 после ANALYZE,
+# иначе разница MAX/MIN(rowid) — два шага по B-дереву на таблицу
+def approx_rows(c, table):
+    try:
+        c.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,))
+        row = c.fetchone()
+        if row:
+            return int(row[0].split()[0])
+    except sqlite3.OperationalError:
+        pass  # ANALYZE ещё не запускали
+    c.execute(f"SELECT MAX(rowid) - MIN(rowid) + 1 FROM {table}")
+    return c.fetchone()[0] or 0
+
+@app.route("/api/db/<table>/count")
+def api_db_count(table):
+    if table not in DB_TABLES:
+        return jsonify({"error": "Недопустимая таблица"}), 400
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        tables = table_names(conn) if table == "prices" else [table]
+        rows = sum(approx_rows(c, name) for name in tables)
+        conn.close()
+        return jsonify({"table": table, "rows": rows, "approximate": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 # === МОДУЛЬ 13: Расчёт ATR по свечам candles_5m ===
 
 from flask import request
-import psycopg2
+
+# Свечей на разгон RMA/EMA, в периодах
+ATR_WARMUP = 10
 
 @app.route("/api/atr/<symbol>")
 def api_atr(symbol):
@@ -816,28 +987,27 @@ def api_atr(symbol):
         # Чтение параметров запроса
         interval = request.args.get("interval", "5m")
         period = int(request.args.get("period", 14))
+        method = request.args.get("method", "sma").lower()
 
         if interval != "5m":
             return jsonify({"error": "Поддерживается только interval=5m"}), 400
-
-        # Подключение к PostgreSQL
-        conn = psycopg2.connect(
-            dbname=os.environ.get("PG_NAME"),
-            user=os.environ.get("PG_USER"),
-            password=os.environ.get("PG_PASSWORD"),
-            host=os.environ.get("PG_HOST"),
-            port=os.environ.get("PG_PORT", 5432)
-        )
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT timestamp, high, low, close
-            FROM candles_5m
-            WHERE symbol = %s
-            ORDER BY timestamp DESC
-            LIMIT %s
-        """, (symbol.upper(), period + 1))
-        rows = cur.fetchall()
-        conn.close()
+        if method not in ATR_METHODS:
+            return jsonify({"error": f"method: одно из {', '.join(ATR_METHODS)}"}), 400
+
+        # RMA/EMA зависят от всей истории — берём запас на разгон сглаживания
+        depth = period + 1 if method == "sma" else period * ATR_WARMUP + 1
+
+        # Чтение из PostgreSQL через общий пул
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT timestamp, high, low, close
+                FROM candles_5m
+                WHERE symbol = %s
+                ORDER BY timestamp DESC
+                LIMIT %s
+            """, (symbol.upper(), depth))
+            rows = cur.fetchall()
 
         if len(rows) <= period:
             return jsonify({"error": "Недостаточно данных для расчёта"}), 400
@@ -845,35 +1015,120 @@ def api_atr(symbol):
         # Обратный порядок: от старых к новым
         rows.reverse()
 
-        # Расчёт True Range (TR)
-        tr_list = []
-        for i in range(1, len(rows)):
-            high = float(rows[i][1])
-            low = float(rows[i][2])
-            prev_close = float(rows[i-1][3])
-            tr = max(
-                high - low,
-                abs(high - prev_close),
-                abs(low - prev_close)
-            )
-            tr_list.append(tr)
-
-        # Расчёт ATR как SMA (по умолчанию)
-        atr = sum(tr_list[-period:]) / period
+        highs = [float(r[1]) for r in rows]
+        lows = [float(r[2]) for r in rows]
+        closes = [float(r[3]) for r in rows]
+        atr_value = float(atr(highs, lows, closes, period, method)[-1])
 
         return jsonify({
             "symbol": symbol.upper(),
             "interval": interval,
             "period": period,
-            "atr": round(atr, 6)
+            "method": method,
+            "atr": round(atr_value, 6)
         })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+# === МОДУЛЬ 14: Push live-канала и закрытых свечей через SSE ===
+
+from flask import stream_with_context
+from live_hub import LiveHub
+
+SSE_KEEPALIVE = 15  # секунд между ping-комментариями
+
+# Один расчёт канала на символ при изменении цены — для всех вкладок сразу
+live_hub = LiveHub(compute_live_channel)
+
+# Строка закрытой 5m-свечи в формате /api/candles. Строится в потоке LiveHub:
+# on_kline работает в цикле событий Binance и не должен ждать расчётов.
+# Выборка — от закрытого бара (плюс свечи разгона канала); за ним уже может
+# быть открыт следующий бар, поэтому нужная строка ищется по времени.
+def closed_candle_row(symbol, ts_ms):
+    key = ms_to_dt(ts_ms).strftime("%Y-%m-%d %H:%M")
+    for row in build_candle_rows(symbol, "5m", since=ts_ms - 1):
+        if row["time"] == key:
+            return row
+    return None
+
+def push_closed_candle(symbol, ts_ms):
+    live_hub.defer(symbol, "candle", lambda: closed_candle_row(symbol, ts_ms))
+
+def sse_format(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# События: "live" — как /api/live-channel, "candle" — закрытая 5m-свеча
+@app.route("/api/live-stream/<symbol>")
+def api_live_stream(symbol):
+    symbol = symbol.lower()
+
+    def events():
+        q = live_hub.subscribe(symbol)
+        try:
+            snapshot = live_hub.snapshot(symbol)
+            if snapshot:
+                yield sse_format("live", snapshot)
+            while True:
+                try:
+                    event, data = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield sse_format(event, data)
+        finally:
+            live_hub.unsubscribe(symbol, q)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# === МОДУЛЬ 15: История из колоночного архива M1 (archive.py) ===
+
+HISTORY_MAX_BARS = 5000
+
+# Свечи за период без SQLite: срез mmap-колонок и ресемплинг NumPy.
+# ?interval=1m|5m|15m|1h|4h&start=&end= (epoch ms или "YYYY-MM-DD HH:MM", UTC)
+# &limit= — последние N баров периода. Порядок — от новых к старым, как /api/candles.
+@app.route("/api/history/<symbol>")
+def api_history(symbol):
+    interval = request.args.get("interval", "5m")
+    if interval != "1m" and interval not in TIMEFRAMES:
+        return jsonify({"error": "Недопустимый interval"}), 400
+    try:
+        start = parse_cursor(request.args.get("start"))
+        end = parse_cursor(request.args.get("end"))
+        limit = min(int(request.args.get("limit", HISTORY_MAX_BARS)), HISTORY_MAX_BARS)
+    except ValueError:
+        return jsonify({"error": "start/end: epoch ms или YYYY-MM-DD HH:MM, limit: целое"}), 400
+    # только символы, у которых есть архив: имя идёт в путь к файлам
+    symbol = symbol.lower()
+    if symbol not in candle_archive.symbols():
+        return jsonify({"error": "Нет архива для символа"}), 404
+
+    candles = candle_archive.open(symbol).range(start, end)
+    if interval != "1m":
+        candles = resample(candles, TIMEFRAMES[interval])
+    tail = slice(max(0, len(candles.ts) - limit), None)
+    ts, o, h, l, c_ = (column[tail].tolist() for column in candles)
+    return jsonify([
+        {"time": ms_to_dt(t).strftime("%Y-%m-%d %H:%M"), "open": o[i], "high": h[i], "low": l[i], "close": c_[i]}
+        for i, t in reversed(list(enumerate(ts)))
+    ])
+
 # Запуск сервера + инициализация
 if __name__ == "__main__":
     init_db()
-    fetch_kline_stream()
-    fetch_trade_stream()  # ← Добавь ЭТУ строку
+    price_partitions.load().premake(now_ms())
+    db_writer.start()
+    signals_writer.ensure_unique().start()
+    start_backfill(DB_PATH)
+    candle_store.warm_from_sqlite(DB_PATH)
+    rollups.warm_from_sqlite(DB_PATH, candle_store)
+    # после прогрева: перенос наследных строк не должен идти во время чтения кэша
+    compactor.start()
+    live_hub.start()
+    start_binance_streams()
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,282 @@
+# === Колоночный архив M1-свечей: файлы на символ, чтение через mmap + NumPy ===
+#
+# Закрытые дневные партиции prices (partitions.py) выгружаются сюда компакцией
+# (retention.py) и остаются доступны после удаления сырых M1 из SQLite.
+#
+#     <ARCHIVE_DIR>/<symbol>/
+#         header    — 40 байт: магия, версия, число строк, первый и последний ts
+#         index     — по 24 байта на выгруженный день: (начало дня, первая строка, строк)
+#         ts.i8     — время открытия, int64 little-endian, по возрастанию
+#         open.f8 / high.f8 / low.f8 / close.f8 — float64 little-endian
+#     <ARCHIVE_DIR>/exported — выгруженные партиции, по строке "имя\tстрок"
+#
+# Файлы только дописываются. Граница фиксации — header: он переписывается
+# атомарно (os.replace) после колонок и индекса, поэтому читатель не видит
+# недописанный хвост, а следующая запись его обрезает.
+#
+# Чтение — np.memmap без копирования: срез по времени — searchsorted по ts,
+# колонки — представления над отображённым файлом.
+#
+#     candles = candle_archive.open("btcusdt").range(start_ms, end_ms)
+#     bars = resample(candles, TIMEFRAMES["5m"])
+#     atr(bars.high, bars.low, bars.close, 14)
+
+import argparse
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from partitions import DAY_MS, list_partitions
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "/data/archive")
+# Партиция выгружается, когда после её дня прошло ещё столько полных дней
+# (дозаполнение пропусков дописывает не дальше суток назад, см. backfill.py)
+ARCHIVE_AFTER_DAYS = 1
+# Сколько символов держать отображёнными одновременно (давно не читанные закрываются)
+ARCHIVE_MAX_OPEN = 64
+# Имя символа — оно же имя каталога: без разделителей пути и точек
+SYMBOL_RE = re.compile(r"^[a-z0-9]+$")
+
+MAGIC = b"TSMARCH\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sIIqqq")  # магия, версия, резерв, строк, первый ts, последний ts
+INDEX_ENTRY = struct.Struct("<qqq")  # начало дня, первая строка, строк
+COLUMNS = (("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"))
+
+# Колонки свечей: np.ndarray одинаковой длины (из архива — представления над mmap)
+Candles = namedtuple("Candles", "ts open high low close")
+
+
+def empty_candles():
+    return Candles(*(np.empty(0, dtype=dtype) for _name, dtype in COLUMNS))
+
+
+# Бары таймфрейма из M1 (как rollups.aggregate, но векторно): первый open,
+# max high, min low, последний close в каждом интервале tf_ms
+def resample(candles, tf_ms):
+    ts = candles.ts
+    if len(ts) == 0:
+        return empty_candles()
+    buckets = ts - ts % tf_ms
+    edges = np.flatnonzero(buckets[1:] != buckets[:-1]) + 1
+    starts = np.concatenate(([0], edges))
+    ends = np.concatenate((edges - 1, [len(ts) - 1]))
+    return Candles(
+        buckets[starts],
+        candles.open[starts],
+        np.maximum.reduceat(candles.high, starts),
+        np.minimum.reduceat(candles.low, starts),
+        candles.close[ends],
+    )
+
+
+class SymbolArchive:
+    def __init__(self, path):
+        self.path = path
+        self.rows, self.first_ts, self.last_ts = read_header(path)
+        self._columns = {}
+        for name, dtype in COLUMNS:
+            if self.rows:
+                self._columns[name] = np.memmap(os.path.join(path, f"{name}.{dtype[-2:]}"), dtype=dtype, mode="r", shape=(self.rows,))
+            else:
+                self._columns[name] = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return self.rows
+
+    def candles(self):
+        return Candles(*(self._columns[name] for name, _dtype in COLUMNS))
+
+    # Свечи с start <= ts < end — представления без копирования
+    def range(self, start=None, end=None):
+        ts = self._columns["ts"]
+        i = int(np.searchsorted(ts, start, "left")) if start is not None else 0
+        j = int(np.searchsorted(ts, end, "left")) if end is not None else self.rows
+        return Candles(*(self._columns[name][i:j] for name, _dtype in COLUMNS))
+
+    # [(начало дня, первая строка, строк)] по выгруженным дням
+    def index(self):
+        return read_index(self.path, self.rows)
+
+    # Отпустить отображения. Принудительно mmap не закрывается: срезы, уже
+    # отданные читателям, ссылаются на него; отображение снимется, когда
+    # соберут последний такой срез.
+    def close(self):
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        self.rows = 0
+
+
+def read_header(path):
+    try:
+        with open(os.path.join(path, "header"), "rb") as f:
+            magic, version, _reserved, rows, first_ts, last_ts = HEADER.unpack(f.read(HEADER.size))
+    except FileNotFoundError:
+        return 0, None, None
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: не архив свечей или неизвестная версия {version}")
+    return rows, (first_ts if rows else None), (last_ts if rows else None)
+
+
+def read_index(path, rows):
+    entries = []
+    try:
+        with open(os.path.join(path, "index"), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return entries
+    for offset in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+        entry = INDEX_ENTRY.unpack_from(data, offset)
+        if entry[1] + entry[2] <= rows:  # записи после последней фиксации не видны
+            entries.append(entry)
+    return entries
+
+
+class CandleArchive:
+    def __init__(self, root=ARCHIVE_DIR, max_open=ARCHIVE_MAX_OPEN):
+        self.root = root
+        self.max_open = max_open
+        # symbol -> (версия файла заголовка, SymbolArchive), от давно читанных к недавним
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, symbol):
+        if not SYMBOL_RE.match(symbol.lower()):
+            raise ValueError(f"Недопустимое имя символа: {symbol!r}")
+        return os.path.join(self.root, symbol.lower())
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, name, "header")))
+
+    # Архив символа; переоткрывается, если после прошлого открытия что-то дописано
+    def open(self, symbol):
+        path = self._path(symbol)
+        try:
+            st = os.stat(os.path.join(path, "header"))
+            mtime = (st.st_ino, st.st_mtime_ns)  # заголовок заменяется через os.replace
+        except FileNotFoundError:
+            mtime = None
+        key = symbol.lower()
+        with self._lock:
+            cached = self._open.get(key)
+            if cached and cached[0] == mtime:
+                self._open.move_to_end(key)
+                return cached[1]
+            archive = SymbolArchive(path)
+            self._open[key] = (mtime, archive)
+            self._open.move_to_end(key)
+            while len(self._open) > self.max_open:
+                _key, (_mtime, evicted) = self._open.popitem(last=False)
+                evicted.close()
+            return archive
+
+    # Дописать свечи дня (по возрастанию ts). Свечи не новее уже архивных
+    # отбрасываются — файл только дописывается. Возвращает число записанных.
+    def append(self, symbol, day_start, ts, o, h, l, c):
+        path = self._path(symbol)
+        os.makedirs(path, exist_ok=True)
+        rows, first_ts, last_ts = read_header(path)
+        ts = np.asarray(ts, dtype="<i8")
+        keep = np.ones(len(ts), dtype=bool)
+        if len(ts):
+            keep[:-1] = ts[1:] != ts[:-1]  # повторы минуты — последняя запись
+        if last_ts is not None:
+            keep &= ts > last_ts
+        columns = [ts[keep]] + [np.asarray(col, dtype="<f8")[keep] for col in (o, h, l, c)]
+        added = len(columns[0])
+        if not added:
+            return 0
+
+        for (name, dtype), values in zip(COLUMNS, columns):
+            with open(os.path.join(path, f"{name}.{dtype[-2:]}"), "ab") as f:
+                f.truncate(rows * 8)  # недописанный хвост прошлой записи
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        entries = read_index(path, rows)
+        with open(os.path.join(path, "index"), "ab") as f:
+            f.truncate(len(entries) * INDEX_ENTRY.size)
+            f.write(INDEX_ENTRY.pack(day_start, rows, added))
+
+        header = HEADER.pack(MAGIC, VERSION, 0, rows + added,
+                             first_ts if first_ts is not None else int(columns[0][0]), int(columns[0][-1]))
+        tmp = os.path.join(path, "header.tmp")
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, "header"))
+        return added
+
+    def exported(self):
+        try:
+            with open(os.path.join(self.root, "exported")) as f:
+                return {line.split("\t")[0] for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    # Выгрузка одной закрытой партиции prices_YYYYMMDD: все символы дня
+    def export_partition(self, conn, name, day_start):
+        c = conn.cursor()
+        c.execute(f"SELECT symbol, ts, open, high, low, close FROM {name} ORDER BY symbol, ts")
+        by_symbol = {}
+        for symbol, *row in c.fetchall():
+            by_symbol.setdefault(symbol, []).append(row)
+        written = 0
+        for symbol, rows in by_symbol.items():
+            ts, o, h, l, c_ = zip(*rows)
+            written += self.append(symbol, day_start, ts, o, h, l, c_)
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, "exported"), "a") as f:
+            f.write(f"{name}\t{written}\n")
+        return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Колоночный архив M1-свечей")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="выгрузить закрытые дневные партиции из SQLite")
+    p.add_argument("--db", default="/data/prices.db")
+
+    p = sub.add_parser("info", help="строки и диапазон времени по символам")
+    p.add_argument("symbols", nargs="*")
+
+    p = sub.add_parser("scan", help="полный проход по архиву символа (скорость чтения)")
+    p.add_argument("symbol")
+    p.add_argument("--tf", type=int, default=5, help="минут в баре для ресемплинга")
+
+    args = parser.parse_args()
+    archive = CandleArchive(args.dir)
+    if args.command == "export":
+        conn = sqlite3.connect(args.db)
+        done = archive.exported()
+        today = int(time.time() * 1000) // DAY_MS * DAY_MS
+        for start, name in list_partitions(conn):
+            if name not in done and start + DAY_MS * (1 + ARCHIVE_AFTER_DAYS) <= today:
+                print(f"{name}: {archive.export_partition(conn, name, start)} свечей", flush=True)
+        conn.close()
+    elif args.command == "info":
+        for symbol in args.symbols or archive.symbols():
+            a = archive.open(symbol)
+            print(f"{symbol}: {len(a)} свечей, {a.first_ts} … {a.last_ts}, дней {len(a.index())}")
+    else:
+        started = time.perf_counter()
+        candles = archive.open(args.symbol).candles()
+        bars = resample(candles, args.tf * 60_000)
+        mean = float(candles.close.mean()) if len(candles.ts) else 0.0
+        elapsed = time.perf_counter() - started
+        print(f"{len(candles.ts)} свечей → {len(bars.ts)} баров {args.tf}m за {elapsed * 1000:.1f} ms "
+              f"({len(candles.ts) / max(elapsed, 1e-9) / 1e6:.1f} млн свечей/с), средний close {mean:.4f}")
+
+
+if __name__ == "__main__":
+    main()
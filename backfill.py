@@ -0,0 +1,232 @@
+# === Дозаполнение пропущенных M1-свечей через REST /fapi/v1/klines ===
+#
+# Пока сокет лежал (или процесс был остановлен), минуты закрывались без нас.
+# Перед подпиской соединения GapFiller берёт по каждому символу время последней
+# сохранённой свечи, скачивает недостающие закрытые свечи параллельными запросами
+# по KLINES_LIMIT штук и отдаёт их одним списком на символ (пакетная запись —
+# на стороне вызывающего).
+#
+#     filler = GapFiller(last_open_time=candle_store.last_ts, on_candles=store_backfill)
+#     filler.fill(["btcusdt", "ethusdt"])
+#
+# Для проверок без Binance — MockKlinesServer (python backfill.py mock) и
+# BINANCE_REST_URL=http://127.0.0.1:<порт>.
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BINANCE_REST_URL = os.environ.get("BINANCE_REST_URL", "https://fapi.binance.com")
+KLINES_PATH = "/fapi/v1/klines"
+# Максимум свечей в одном ответе /fapi/v1/klines
+KLINES_LIMIT = 1500
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", 4))
+# Глубже этого (в минутах) не дозаполняем — дальше история считается потерянной
+BACKFILL_MAX_MINUTES = int(os.environ.get("BACKFILL_MAX_MINUTES", 24 * 60))
+BACKFILL_TIMEOUT = 10
+MINUTE_MS = 60_000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+# Символы из имён потоков соединения: "btcusdt@kline_1m" → "btcusdt"
+def kline_symbols(streams):
+    return sorted({s.split("@")[0] for s in streams if s.endswith("@kline_1m")})
+
+
+# Закрытые свечи [start_ms, end_ms] одним запросом: [(open_time, close_time, o, h, l, c)]
+def fetch_klines(symbol, start_ms, end_ms, rest_url=BINANCE_REST_URL):
+    query = urllib.parse.urlencode({
+        "symbol": symbol.upper(), "interval": "1m",
+        "startTime": start_ms, "endTime": end_ms, "limit": KLINES_LIMIT,
+    })
+    with urllib.request.urlopen(f"{rest_url.rstrip('/')}{KLINES_PATH}?{query}", timeout=BACKFILL_TIMEOUT) as resp:
+        data = json.load(resp)
+    closed_before = now_ms()
+    return [
+        (int(k[0]), int(k[6]), float(k[1]), float(k[2]), float(k[3]), float(k[4]))
+        for k in data
+        if int(k[6]) < closed_before
+    ]
+
+
+class GapFiller:
+    def __init__(self, last_open_time, on_candles, rest_url=BINANCE_REST_URL,
+                 workers=BACKFILL_WORKERS, max_minutes=BACKFILL_MAX_MINUTES):
+        # last_open_time(symbol) -> open_time последней сохранённой свечи (ms) или None
+        self.last_open_time = last_open_time
+        # on_candles(symbol, rows) — rows по возрастанию open_time
+        self.on_candles = on_candles
+        self.rest_url = rest_url
+        self.workers = workers
+        self.max_minutes = max_minutes
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0, "candles": 0, "requests": 0, "errors": 0,
+            "last_symbols": 0, "last_candles": 0, "last_duration_ms": 0.0,
+            "last_rate": 0.0, "last_run_at": None,
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    # Диапазоны запросов по всем символам: [(symbol, start, end)].
+    # filled — уже отданное в этом запуске (запись может быть ещё в буфере писателя)
+    def _plan(self, symbols, until, filled):
+        plan = []
+        for symbol in symbols:
+            last = self.last_open_time(symbol)
+            if symbol in filled:
+                last = max(last or 0, filled[symbol])
+            if last is None:
+                continue  # истории нет — дозаполнять нечего
+            start = max(last + MINUTE_MS, until - self.max_minutes * MINUTE_MS)
+            while start < until:
+                end = min(start + KLINES_LIMIT * MINUTE_MS, until)
+                plan.append((symbol, start, end - 1))
+                start = end
+        return plan
+
+    # Дозаполнить пропуски до последней закрытой минуты. Если за время
+    # дозаполнения закрылась ещё минута — повторить для неё.
+    def fill(self, symbols):
+        started = time.perf_counter()
+        total = 0
+        filled = {}
+        while True:
+            until = now_ms() // MINUTE_MS * MINUTE_MS  # open_time текущей, ещё открытой минуты
+            plan = self._plan(symbols, until, filled)
+            if not plan:
+                break
+            total += self._fill_plan(plan, filled)
+            if now_ms() // MINUTE_MS * MINUTE_MS == until:
+                break
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            s = self._stats
+            s["runs"] += 1
+            s["candles"] += total
+            s["last_symbols"] = len(symbols)
+            s["last_candles"] = total
+            s["last_duration_ms"] = round(elapsed * 1000, 1)
+            s["last_rate"] = round(total / elapsed, 1) if elapsed > 0 else 0.0
+            s["last_run_at"] = now_ms()
+        if total:
+            print(f"🩹 Дозаполнено {total} свечей по {len(symbols)} символам за {elapsed:.2f} с", flush=True)
+        return total
+
+    def _fill_plan(self, plan, filled):
+        rows = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(fetch_klines, symbol, start, end, self.rest_url): symbol for symbol, start, end in plan}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                with self._lock:
+                    self._stats["requests"] += 1
+                try:
+                    rows.setdefault(symbol, []).extend(future.result())
+                except Exception as e:
+                    with self._lock:
+                        self._stats["errors"] += 1
+                    print(f"❌ Ошибка REST klines {symbol}:", e, flush=True)
+
+        total = 0
+        for symbol, candles in rows.items():
+            if not candles:
+                continue
+            candles.sort()
+            self.on_candles(symbol, candles)
+            filled[symbol] = candles[-1][0]
+            total += len(candles)
+        return total
+
+
+# === Локальная замена REST Binance для проверок и бенчмарков ===
+
+class MockKlinesServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path != KLINES_PATH:
+                    self.send_error(404)
+                    return
+                params = dict(urllib.parse.parse_qsl(url.query))
+                body = json.dumps(server.klines(params)).encode()
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+
+    # Детерминированные свечи в формате Binance: цена зависит только от символа и минуты
+    @staticmethod
+    def klines(params):
+        symbol = params["symbol"]
+        limit = min(int(params.get("limit", 500)), KLINES_LIMIT)
+        start = int(params["startTime"]) // MINUTE_MS * MINUTE_MS
+        if start < int(params["startTime"]):
+            start += MINUTE_MS
+        end = min(int(params.get("endTime", now_ms())), now_ms())
+        base = 100 + sum(map(ord, symbol)) % 100
+        result = []
+        for t in range(start, end + 1, MINUTE_MS):
+            if len(result) >= limit:
+                break
+            o = base + math.sin(t / MINUTE_MS / 30)
+            c = base + math.sin((t + MINUTE_MS) / MINUTE_MS / 30)
+            result.append([t, f"{o:.4f}", f"{max(o, c) + 0.05:.4f}", f"{min(o, c) - 0.05:.4f}", f"{c:.4f}",
+                           "100", t + MINUTE_MS - 1, "10000", 50, "50", "5000", "0"])
+        return result
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_in_thread(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дозаполнение M1-свечей через REST")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("mock", help="локальный сервер /fapi/v1/klines")
+    p.add_argument("--port", type=int, default=8766)
+    p.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунд")
+    args = parser.parse_args()
+
+    server = MockKlinesServer(port=args.port, latency=args.latency)
+    print(f"▶️ BINANCE_REST_URL={server.url}", flush=True)
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+# === Бенчмарки путей чтения/записи ===
+#
+# Запуск: python bench.py <сценарий> [параметры]
+#   schema — чтение свечей символа и /api/candles до и после миграции ts + индексов (migrations.py)
+#   decode — разбор кадров Binance бэкендами decoder.py (msgspec / orjson / json)
+#   ingest — запись (replay.py) через локальный сервер в путь приёма app.py:
+#            сообщений/с и задержка от отправки кадра до фиксации свечи в SQLite
+#   backfill — дозаполнение пропусков (backfill.py) с локальной заглушкой REST
+#   tail   — 5m-бары для live-канала при разной длине истории: полная выборка
+#            с группировкой (старый путь) против хвоста (rollups.tail_bars) и кэша
+#   archive — длинная история символа: SQLite-кортежи против mmap-архива (archive.py)
+
+import argparse
+import json
+import os
+import threading
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import archive
+import backfill
+import decoder
+import migrations
+import replay
+from binance_stream import BinanceStreamClient
+from candle_store import CandleStore
+from indicators import atr
+from price_board import PriceBoard, PriceConflator
+from rollups import ROLLUP_UPSERT, TIMEFRAMES, Rollups, aggregate, init_rollup_table, rollup_rows, tail_bars
+from sqlite_writer import SQLiteWriter
+
+
+def timed(fn, repeat=5):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None or elapsed < best else best
+    return best, result
+
+
+# Таблица prices в исходной схеме: TEXT timestamp, без индексов
+def build_prices_db(path, rows, symbols):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE symbols (name TEXT PRIMARY KEY)")
+    c.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, action TEXT, timestamp TEXT)")
+    c.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, open REAL, high REAL, low REAL, close REAL)")
+    names = [f"sym{i}usdt" for i in range(symbols)]
+    c.executemany("INSERT INTO symbols (name) VALUES (?)", [(n.upper(),) for n in names])
+
+    start = 1_700_000_000 - 1_700_000_000 % 60
+    per_symbol = rows // symbols
+    batch = []
+    # как в живом потоке: все символы закрывают одну и ту же минуту
+    for m in range(per_symbol):
+        ts = datetime.utcfromtimestamp(start + m * 60).isoformat()
+        for n in names:
+            p = 100 + random.random()
+            batch.append((n, ts, p, p + 0.5, p - 0.5, p))
+        if len(batch) >= 50000:
+            c.executemany("INSERT INTO prices (symbol, timestamp, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        c.executemany("INSERT INTO prices (symbol, timestamp, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+    return names
+
+
+def bench_schema(args):
+    path = os.path.join(tempfile.mkdtemp(), "prices.db")
+    print(f"Создаём {args.rows} строк, {args.symbols} символов: {path}")
+    names = build_prices_db(path, args.rows, args.symbols)
+    symbol = names[len(names) // 2]
+    conn = sqlite3.connect(path)
+
+    # до: полный скан + сортировка строк + fromisoformat (как было в /api/candles)
+    def before():
+        c = conn.cursor()
+        c.execute("SELECT timestamp, open, high, low, close FROM prices WHERE symbol = ? ORDER BY timestamp ASC", (symbol,))
+        return [(datetime.fromisoformat(ts), o, h, l, c_) for ts, o, h, l, c_ in c.fetchall()]
+
+    # /api/candles после: выборка по индексу → кэш свечей → ответ Flask (канал, сигналы, JSON).
+    # app импортируется здесь: ему нужен psycopg2.
+    import app as app_module
+    app_module.DB_PATH = path
+    client = app_module.app.test_client()
+    config = app_module.load_channel_config()
+
+    # /api/candles до: та же выборка + канал по формулам на каждую свечу
+    def api_before():
+        rows = legacy_candle_rows(before(), config.get("length", 50), config.get("deviation", 2.0))
+        return json.dumps(rows)
+
+    def api_after():
+        store = CandleStore()
+        store.load(symbol, after())
+        app_module.candle_store = store
+        response = client.get(f"/api/candles/{symbol}?interval=1m")
+        assert response.status_code == 200
+        return response.data
+
+    t_before, rows_before = timed(before)
+    t_api_before, body_before = timed(api_before)
+
+    started = time.perf_counter()
+    migrations.migrate(path)
+    t_migrate = time.perf_counter() - started
+    started = time.perf_counter()
+    migrations.BACKFILL_PAUSE = 0
+    migrations.run_backfill(path)
+    t_backfill = time.perf_counter() - started
+
+    # после: диапазон по покрывающему индексу (symbol, ts), целые ms без парсинга
+    def after():
+        c = conn.cursor()
+        c.execute("SELECT ts, open, high, low, close FROM prices WHERE symbol = ? ORDER BY ts ASC", (symbol,))
+        return c.fetchall()
+
+    t_after, rows_after = timed(after)
+    t_api_after, body_after = timed(api_after)
+    body_before, body_after = json.loads(body_before), json.loads(body_after)
+    # кэш держит не всю историю: сравниваем пересечение (новые свечи)
+    assert body_after == body_before[:len(body_after)]
+
+    # последние 250 свечей (хвост для канала)
+    def tail():
+        c = conn.cursor()
+        c.execute("SELECT ts, open, high, low, close FROM prices WHERE symbol = ? ORDER BY ts DESC LIMIT 250", (symbol,))
+        return c.fetchall()
+
+    t_tail, _ = timed(tail)
+    conn.close()
+
+    print(f"строк по символу:        {len(rows_before)} / {len(rows_after)}, свечей в ответе {len(body_after)}")
+    print(f"миграция (DDL+индексы):  {t_migrate * 1000:.0f} ms")
+    print(f"backfill ts:             {t_backfill * 1000:.0f} ms")
+    print(f"чтение символа, до:      {t_before * 1000:.1f} ms")
+    print(f"чтение символа, после:   {t_after * 1000:.1f} ms")
+    print(f"/api/candles, до:        {t_api_before * 1000:.1f} ms")
+    print(f"/api/candles, после:     {t_api_after * 1000:.1f} ms")
+    print(f"хвост 250 свечей, после: {t_tail * 1000:.2f} ms")
+
+
+# Исходный расчёт /api/candles (interval=1m, сигналов у M1 нет): окно канала — на каждую свечу
+def legacy_candle_rows(candles, length, deviation):
+    group = {}
+    for i in range(len(candles)):
+        ts, o, h, l, c_ = candles[i]
+        key = ts.replace(second=0, microsecond=0)
+
+        window = candles[max(0, i - length + 1): i + 1]
+        avg_x = sum(range(len(window))) / len(window)
+        avg_y = sum([row[4] for row in window]) / len(window)
+        cov_xy = sum([(j - avg_x) * (row[4] - avg_y) for j, row in enumerate(window)])
+        var_x = sum([(j - avg_x) ** 2 for j in range(len(window))])
+        slope = cov_xy / var_x if var_x else 0
+        intercept = avg_y - slope * avg_x
+        expected = [intercept + slope * j for j in range(len(window))]
+        std = (sum([(window[j][4] - expected[j]) ** 2 for j in range(len(window))]) / len(window)) ** 0.5
+        upper = expected[-1] + deviation * std
+        lower = expected[-1] - deviation * std
+        mid = expected[-1]
+
+        group[key] = {
+            "time": key.strftime("%Y-%m-%d %H:%M"),
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c_,
+            "signal": "",
+            "channel": f"{lower:.5f} / {mid:.5f} / {upper:.5f}",
+        }
+    return list(reversed(list(group.values())))
+
+
+# Запись в формате replay.py: за каждую минуту — сделки по всем символам,
+# затем закрытие M1-свечи каждого символа. [(время ms, поток, кадр)]
+def synthetic_recording(minutes, symbols=50, trades_per_minute=20):
+    names = [f"SYM{i}USDT" for i in range(symbols)]
+    start = 1_700_000_000_000 - 1_700_000_000_000 % 60000
+    frames = []
+    for m in range(minutes):
+        open_time = start + m * 60000
+        for i in range(trades_per_minute * symbols):
+            s = names[i % symbols]
+            ts = open_time + i * 60000 // (trades_per_minute * symbols)
+            data = {"e": "trade", "E": ts, "T": ts, "s": s, "t": ts, "p": f"{100 + random.random():.4f}",
+                    "q": "0.013", "X": "MARKET", "m": i % 2 == 0}
+            frames.append((ts, f"{s.lower()}@trade", data))
+        for s in names:
+            p = f"{100 + random.random():.4f}"
+            ts = open_time + 60000
+            data = {"e": "kline", "E": ts, "s": s, "k": {
+                "t": open_time, "T": open_time + 59999, "s": s, "i": "1m", "f": 100, "L": 200,
+                "o": p, "c": p, "h": p, "l": p, "v": "1200.5", "n": 100, "x": True,
+                "q": "120000.1", "V": "600.2", "Q": "60000.3", "B": "0"}}
+            frames.append((ts, f"{s.lower()}@kline_1m", data))
+    return [(ts, stream, json.dumps({"stream": stream, "data": data}, separators=(",", ":"))) for ts, stream, data in frames]
+
+
+def bench_decode(args):
+    if args.frames:
+        frames = replay.load_recording(args.frames)
+    else:
+        frames = synthetic_recording(max(1, args.count // 1050))
+    raw = [frame.encode() for _ts, _stream, frame in frames]
+    print(f"Кадров: {len(raw)}, средний размер {sum(map(len, raw)) // len(raw)} байт")
+
+    def run(dec):
+        def fn():
+            decode = dec.decode
+            for frame in raw:
+                decode(frame)
+        return fn
+
+    baseline = None
+    for name in ("json", "orjson", "msgspec"):
+        if name not in decoder.available_decoders():
+            print(f"{name:8} недоступен")
+            continue
+        best, _ = timed(run(decoder.make_decoder(name)), repeat=args.repeat)
+        per_frame = best / len(raw) * 1e6
+        baseline = baseline or per_frame
+        print(f"{name:8} {per_frame:6.2f} µs/кадр  {len(raw) / best:10.0f} кадров/с  x{baseline / per_frame:.1f}")
+
+
+PRICES_INSERT = "INSERT INTO prices (symbol, timestamp, ts, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def bench_ingest(args):
+    frames = replay.load_recording(args.recording) if args.recording else synthetic_recording(args.minutes, args.symbols)
+    streams = sorted({stream for _ts, stream, _raw in frames})
+
+    # закрытые свечи: кадр → (символ, open_time), чтобы отметить момент отправки
+    closed = {}
+    for _ts, stream, raw in frames:
+        data = json.loads(raw)["data"]
+        if data.get("e") == "kline" and data["k"]["x"]:
+            closed[raw] = (data["s"].lower(), int(data["k"]["t"]))
+    sent_at = {}
+    latencies = []
+    done = threading.Event()
+
+    def on_send(raw):
+        key = closed.get(raw)
+        if key is not None:
+            sent_at[key] = time.perf_counter()
+
+    def on_flush(batch):
+        now = time.perf_counter()
+        for sql, params in batch:
+            if sql == PRICES_INSERT:
+                started = sent_at.get((params[0], params[2]))
+                if started is not None:
+                    latencies.append((now - started) * 1000)
+        if len(latencies) >= len(closed):
+            done.set()
+
+    path = os.path.join(tempfile.mkdtemp(), "prices.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, ts INTEGER, open REAL, high REAL, low REAL, close REAL)")
+    init_rollup_table(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    # тот же путь, что on_kline / on_trade в app.py
+    store = CandleStore()
+    rollups = Rollups()
+    writer = SQLiteWriter(path, on_flush=on_flush).start()
+    board = PriceBoard()
+    conflator = PriceConflator(lambda s, p, e, t: board.update(s, p, e, t)).start()
+
+    def on_kline(event):
+        k = event.kline
+        if not k.closed:
+            return
+        symbol = event.symbol.lower()
+        store.append(symbol, k.open_time, k.open, k.high, k.low, k.close)
+        events = rollups.update(symbol, k.open_time, k.open, k.high, k.low, k.close)
+        writer.put(PRICES_INSERT, (
+            symbol, datetime.utcfromtimestamp(k.open_time // 1000).isoformat(), k.open_time,
+            k.open, k.high, k.low, k.close,
+        ))
+        writer.put_many(ROLLUP_UPSERT, rollup_rows(symbol, events))
+
+    def on_trade(event):
+        conflator.tick(event.symbol.lower(), event.price, event.event_ms)
+
+    server = replay.ReplayServer(frames, speed=args.speed, port=0, on_send=on_send)
+    server.start_in_thread()
+    client = BinanceStreamClient(base_url=server.url, streams_provider=lambda: streams)
+    client.on("kline", on_kline).on("trade", on_trade).on("aggTrade", on_trade)
+
+    print(f"Кадров: {len(frames)}, потоков: {len(streams)}, закрытых свечей: {len(closed)}, скорость x{args.speed or 'max'}")
+    started = time.perf_counter()
+    client.start_in_thread()
+    while client.stats["messages"] + client.stats["decode_errors"] < len(frames):
+        if time.perf_counter() - started > args.timeout:
+            print("⚠️ таймаут: получены не все кадры")
+            break
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    done.wait(timeout=max(args.timeout - elapsed, 1))
+
+    print(f"декодер:                 {client.decoder.name}")
+    print(f"сообщений:               {client.stats['messages']} за {elapsed:.2f} с")
+    print(f"пропускная способность:  {client.stats['messages'] / elapsed:.0f} сообщений/с")
+    print(f"ошибок разбора/обработки: {client.stats['decode_errors']} / {client.stats['handler_errors']}")
+    print(f"схлопнуто сделок:        {conflator.stats['coalesced']}")
+    print(f"свечей в SQLite:         {len(latencies)} из {len(closed)}")
+    if latencies:
+        print(f"задержка записи свечи:   p50 {percentile(latencies, 0.5):.1f} ms, "
+              f"p95 {percentile(latencies, 0.95):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, "
+              f"max {max(latencies):.1f} ms")
+    print(f"писатель SQLite:         {writer.stats()}")
+
+
+def bench_backfill(args):
+    server = backfill.MockKlinesServer(latency=args.latency).start_in_thread()
+    names = [f"sym{i}usdt" for i in range(args.symbols)]
+    now = backfill.now_ms() // backfill.MINUTE_MS * backfill.MINUTE_MS
+    print(f"Пропуск {args.gap} минут × {args.symbols} символов, задержка REST {args.latency * 1000:.0f} ms")
+
+    for workers in sorted({1, args.workers}):
+        path = os.path.join(tempfile.mkdtemp(), "prices.db")
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, ts INTEGER, open REAL, high REAL, low REAL, close REAL)")
+        last = {name: now - (args.gap + 1) * backfill.MINUTE_MS for name in names}
+
+        # пакетная запись: одна executemany на символ
+        def on_candles(symbol, rows):
+            with conn:
+                conn.executemany(PRICES_INSERT, [
+                    (symbol, datetime.utcfromtimestamp(t // 1000).isoformat(), t, o, h, l, c)
+                    for t, _close, o, h, l, c in rows
+                ])
+            last[symbol] = rows[-1][0]
+
+        filler = backfill.GapFiller(last.get, on_candles, rest_url=server.url, workers=workers)
+        filler.fill(names)
+        stats = filler.stats()
+        stored = conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        conn.close()
+        print(f"потоков {workers}: {stats['last_candles']} свечей ({stored} в SQLite), "
+              f"{stats['requests']} запросов, {stats['last_duration_ms']:.0f} ms, {stats['last_rate']:.0f} свечей/с")
+    server.stop()
+
+
+def bench_tail(args):
+    tf_ms = TIMEFRAMES["5m"]
+    count = args.length - 1
+    symbols = [f"sym{i}usdt" for i in range(args.symbols)]
+    symbol = symbols[0]
+    end = 1_700_000_000_000 - 1_700_000_000_000 % tf_ms
+    print(f"Окно {count} баров 5m, {args.symbols} символов, лучшее из {args.repeat}")
+    print(f"{'дней':>5} {'строк':>9} {'полная история':>15} {'хвост SQLite':>13} {'кэш rollups':>12}")
+
+    for days in sorted(int(d) for d in args.days.split(",")):
+        minutes = days * 24 * 60
+        path = os.path.join(tempfile.mkdtemp(), "prices.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE symbols (name TEXT PRIMARY KEY)")
+        conn.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, action TEXT, timestamp TEXT, ts INTEGER)")
+        conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, ts INTEGER, open REAL, high REAL, low REAL, close REAL)")
+        batch = []
+        for m in range(minutes):
+            t = end - (minutes - m) * 60000
+            iso = datetime.utcfromtimestamp(t // 1000).isoformat()
+            for name in symbols:
+                p = 100 + random.random()
+                batch.append((name, iso, t, p, p + 0.5, p - 0.5, p))
+            if len(batch) >= 50000:
+                conn.executemany(PRICES_INSERT, batch)
+                batch = []
+        if batch:
+            conn.executemany(PRICES_INSERT, batch)
+        conn.commit()
+        migrations.migrate(path)
+
+        # старый путь /api/live-channel: вся история символа + группировка в 5m
+        def full():
+            c = conn.cursor()
+            c.execute("SELECT ts, open, high, low, close FROM prices WHERE symbol = ? ORDER BY ts ASC", (symbol,))
+            return aggregate(c.fetchall(), tf_ms)[-count:]
+
+        def tail():
+            return tail_bars(conn, symbol, tf_ms, count)
+
+        rollups = Rollups({"5m": tf_ms})
+        rollups.stores["5m"].load(symbol, full())
+
+        def memory():
+            return rollups.rows("5m", symbol, limit=count)
+
+        t_full, bars_full = timed(full, args.repeat)
+        t_tail, bars_tail = timed(tail, args.repeat)
+        t_memory, _ = timed(memory, args.repeat)
+        assert bars_tail == bars_full, "хвост расходится с полной выборкой"
+        conn.close()
+        print(f"{days:>5} {minutes:>9} {t_full * 1000:>12.2f} ms {t_tail * 1000:>10.3f} ms {t_memory * 1000:>9.3f} ms")
+
+
+def bench_archive(args):
+    tf_ms = TIMEFRAMES["5m"]
+    minutes = args.days * 24 * 60
+    root = tempfile.mkdtemp()
+    path = os.path.join(root, "prices.db")
+    end = 1_700_000_000_000 - 1_700_000_000_000 % archive.DAY_MS
+    ts = end - np.arange(minutes, 0, -1, dtype=np.int64) * 60000
+    close = 100 + np.cumsum(np.random.standard_normal(minutes)) * 0.01
+    high, low = close + 0.5, close - 0.5
+    print(f"История: {minutes} M1-свечей ({args.days} дней), лучшее из {args.repeat}")
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, ts INTEGER, open REAL, high REAL, low REAL, close REAL)")
+    conn.executemany(PRICES_INSERT, (
+        ("btcusdt", "", t, c, h, l, c) for t, c, h, l in zip(ts.tolist(), close.tolist(), high.tolist(), low.tolist())
+    ))
+    conn.execute("CREATE INDEX idx_prices_symbol_ts ON prices (symbol, ts, open, high, low, close)")
+    conn.commit()
+
+    store = archive.CandleArchive(os.path.join(root, "archive"))
+    started = time.perf_counter()
+    for day in range(0, minutes, 1440):
+        part = slice(day, day + 1440)
+        store.append("btcusdt", int(ts[day]), ts[part], close[part], high[part], low[part], close[part])
+    print(f"выгрузка в архив:        {(time.perf_counter() - started) * 1000:.0f} ms, {args.days} дней")
+
+    # одинаковая работа: 5m-бары + ATR(14) по всей истории
+    def work(candles):
+        bars = archive.resample(candles, tf_ms)
+        return len(bars.ts), float(atr(bars.high, bars.low, bars.close, 14)[-1])
+
+    def sqlite_path():
+        c = conn.cursor()
+        c.execute("SELECT ts, open, high, low, close FROM prices WHERE symbol = ? ORDER BY ts", ("btcusdt",))
+        rows = c.fetchall()
+        columns = list(zip(*rows))
+        return work(archive.Candles(np.array(columns[0], dtype=np.int64), *(np.array(col, dtype=float) for col in columns[1:])))
+
+    def archive_cold():
+        return work(archive.CandleArchive(store.root).open("btcusdt").candles())
+
+    def archive_warm():
+        return work(store.open("btcusdt").candles())
+
+    results = {}
+    for name, fn in (("SQLite → кортежи → NumPy", sqlite_path), ("архив, открытие + mmap", archive_cold), ("архив, уже открыт", archive_warm)):
+        best, result = timed(fn, args.repeat)
+        results[name] = result
+        print(f"{name:26} {best * 1000:8.1f} ms  {minutes / best / 1e6:7.1f} млн свечей/с")
+    assert len(set(results.values())) == 1, results
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки trade-symbols-manager")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    p = sub.add_parser("schema", help="чтение prices до/после миграции ts + индексов")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--symbols", type=int, default=200)
+    p.set_defaults(func=bench_schema)
+
+    p = sub.add_parser("decode", help="разбор кадров Binance: msgspec / orjson / json")
+    p.add_argument("--frames", help="файл записи replay.py record (или JSON-кадр на строку)")
+    p.add_argument("--count", type=int, default=200_000, help="примерное число синтетических кадров без --frames")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser("ingest", help="запись → локальный replay-сервер → путь приёма → SQLite")
+    p.add_argument("--recording", help="файл replay.py record (по умолчанию — синтетическая запись)")
+    p.add_argument("--minutes", type=int, default=30, help="минут синтетической записи")
+    p.add_argument("--symbols", type=int, default=50, help="символов в синтетической записи")
+    p.add_argument("--speed", type=float, default=0, help="ускорение воспроизведения; 0 — максимум")
+    p.add_argument("--timeout", type=float, default=120)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("backfill", help="дозаполнение пропусков через заглушку REST klines")
+    p.add_argument("--symbols", type=int, default=50)
+    p.add_argument("--gap", type=int, default=600, help="минут пропуска на символ")
+    p.add_argument("--workers", type=int, default=backfill.BACKFILL_WORKERS)
+    p.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки, секунд")
+    p.set_defaults(func=bench_backfill)
+
+    p = sub.add_parser("tail", help="бары live-канала: полная история против хвоста по индексу")
+    p.add_argument("--days", default="1,7,30,90", help="длины истории символа в днях")
+    p.add_argument("--symbols", type=int, default=4)
+    p.add_argument("--length", type=int, default=50, help="длина канала (окно — length-1 баров)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_tail)
+
+    p = sub.add_parser("archive", help="длинная история: SQLite против колоночного архива")
+    p.add_argument("--days", type=int, default=1460)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_archive)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# === Клиент Binance combined streams на asyncio ===
+#
+# Один event loop (в отдельном потоке или в основном) держит все подписки
+# @kline_1m / @trade по минимально возможному числу сокетов: до
+# MAX_STREAMS_PER_CONNECTION потоков на соединение. Подписка идёт кадром
+# SUBSCRIBE, а не через ?streams= в URL. Разобранные события раздаются
+# обработчикам, зарегистрированным через on("kline", fn) / on("trade", fn).
+# Кадры разбирает decoder.py (msgspec/orjson/json): обработчик получает
+# типизированное событие (KlineEvent, TradeEvent, ...), а не dict.
+#
+# Потоки раскладываются по шардам (STREAM_SHARD_SIZE на соединение). При смене
+# набора символов затрагиваются только шарды, где что-то изменилось: в их живые
+# соединения уходят SUBSCRIBE/UNSUBSCRIBE только на разницу, без переподключения.
+# Лишние полупустые шарды сливаются. Скорость сообщений по шардам — в shard_stats().
+#
+# Список символов перечитывается раз в SYMBOL_WATCH_INTERVAL и сразу по refresh()
+# (например, после POST /api/symbols).
+#
+# on_connect(streams) вызывается в пуле потоков после каждого подключения шарда,
+# до SUBSCRIBE — например, дозаполнить пропущенные за время обрыва свечи
+# (backfill.py), пока живые данные ещё не пошли.
+#
+#     client = BinanceStreamClient()
+#     client.on("kline", handle_kline)
+#     client.set_streams(["btcusdt@kline_1m", "btcusdt@trade"])
+#     client.start_in_thread()
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+import websockets
+
+from decoder import make_decoder
+
+BINANCE_WS_URL = os.environ.get("BINANCE_WS_URL", "wss://fstream.binance.com")
+# Лимит Binance Futures — 200 потоков на одно соединение
+MAX_STREAMS_PER_CONNECTION = 200
+# Размер шарда (потоков на соединение), не больше лимита Binance
+STREAM_SHARD_SIZE = min(int(os.environ.get("STREAM_SHARD_SIZE", MAX_STREAMS_PER_CONNECTION)), MAX_STREAMS_PER_CONNECTION)
+# Период пересчёта скорости сообщений по шардам, секунд
+RATE_INTERVAL = 10
+# Очередь между сокетами и обработчиками: когда она полна, чтение сокетов
+# приостанавливается (единственная точка настройки backpressure)
+EVENT_QUEUE_SIZE = int(os.environ.get("STREAM_EVENT_QUEUE", 10000))
+RECONNECT_DELAY = 5
+# Как часто перечитывать список символов (streams_provider), секунд
+SYMBOL_WATCH_INTERVAL = int(os.environ.get("SYMBOL_WATCH_INTERVAL", 30))
+
+
+# Символ в имени потока — в нижнем регистре, тип потока регистрозависим
+# ("BTCUSDT@aggTrade" → "btcusdt@aggTrade")
+def normalize_stream(stream):
+    symbol, _, kind = stream.partition("@")
+    return f"{symbol.lower()}@{kind}"
+
+
+class StreamConnection:
+    def __init__(self, client, conn_id, streams):
+        self.client = client
+        self.conn_id = conn_id
+        self.streams = set(streams)
+        self.ws = None
+        self.task = None
+        self._req_id = 0
+        self.messages = 0
+        self.rate = 0.0
+        self._rate_mark = 0
+
+    async def _send(self, method, params):
+        if not params or self.ws is None:
+            return
+        self._req_id += 1
+        await self.ws.send(json.dumps({"method": method, "params": sorted(params), "id": self._req_id}))
+
+    # Разница между старым и текущим составом — в живое соединение.
+    # Если соединения сейчас нет, актуальный состав уйдёт при переподключении.
+    async def update_subscriptions(self, old):
+        added = self.streams - old
+        removed = old - self.streams
+        if self.ws is None:
+            return
+        try:
+            await self._send("UNSUBSCRIBE", removed)
+            await self._send("SUBSCRIBE", added)
+            print(f"♻️ [ws#{self.conn_id}] +{len(added)} / -{len(removed)} потоков без переподключения", flush=True)
+        except Exception as e:
+            print(f"❌ [ws#{self.conn_id}] ошибка SUBSCRIBE/UNSUBSCRIBE:", e, flush=True)
+
+    async def run(self):
+        url = self.client.base_url.rstrip("/") + "/stream"
+        while True:
+            ws = None
+            try:
+                async with websockets.connect(url, max_queue=1024, ping_interval=None) as ws:
+                    self.ws = ws
+                    print(f"🟢 [ws#{self.conn_id}] подключено, потоков: {len(self.streams)}", flush=True)
+                    await self.client._before_subscribe(set(self.streams))
+                    await self._send("SUBSCRIBE", set(self.streams))
+                    async for raw in ws:
+                        self.messages += 1
+                        await self.client._queue.put(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ [ws#{self.conn_id}] ошибка WebSocket:", e, flush=True)
+            finally:
+                if self.ws is ws:
+                    self.ws = None
+            print(f"🔌 [ws#{self.conn_id}] соединение закрыто, переподключение через {RECONNECT_DELAY} с", flush=True)
+            self.client._on_reconnect()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+class BinanceStreamClient:
+    def __init__(self, base_url=BINANCE_WS_URL, max_streams=STREAM_SHARD_SIZE,
+                 streams_provider=None, decoder=None, on_connect=None):
+        self.base_url = base_url
+        self.on_connect = on_connect
+        self.decoder = decoder or make_decoder()
+        self.max_streams = max_streams
+        # вызывается при переподключении, чтобы перечитать список символов
+        self.streams_provider = streams_provider
+        self._handlers = {}
+        self._streams = set()
+        self._connections = []
+        self._next_conn_id = 0
+        self._loop = None
+        self._queue = None
+        self._reload_pending = False
+        # refresh пришёл во время перечитывания — повторить его после завершения
+        self._reload_dirty = False
+        self.stats = {"messages": 0, "handler_errors": 0, "decode_errors": 0, "dispatch_errors": 0, "decoder": self.decoder.name}
+
+    def on(self, kind, handler):
+        self._handlers.setdefault(kind, []).append(handler)
+        return self
+
+    # Полный набор потоков ("btcusdt@kline_1m", ...). Можно вызывать из любого потока.
+    def set_streams(self, streams):
+        streams = {normalize_stream(s) for s in streams}
+        if self._loop is None:
+            self._streams = streams
+        else:
+            self._loop.call_soon_threadsafe(self._apply_streams, streams)
+
+    # Раскладка потоков по шардам с минимальными перемещениями:
+    # удалённые уходят из своих шардов, новые досыпаются в наименее загруженные,
+    # пустые шарды закрываются, лишний полупустой шард расформировывается.
+    def _apply_streams(self, streams):
+        self._streams = streams
+        before = {conn: set(conn.streams) for conn in self._connections}
+
+        for conn in self._connections:
+            conn.streams &= streams
+        assigned = set().union(*(conn.streams for conn in self._connections)) if self._connections else set()
+        self._connections = [conn for conn in self._connections if conn.streams]
+
+        needed = -(-len(streams) // self.max_streams)  # ceil
+        while len(self._connections) > needed:
+            smallest = min(self._connections, key=lambda conn: len(conn.streams))
+            self._connections.remove(smallest)
+            assigned -= smallest.streams
+
+        for stream in sorted(streams - assigned):
+            free = [conn for conn in self._connections if len(conn.streams) < self.max_streams]
+            if free:
+                min(free, key=lambda conn: len(conn.streams)).streams.add(stream)
+            else:
+                self._connections.append(self._new_shard({stream}))
+
+        # сначала подписки на новых местах, потом закрытие расформированных шардов
+        for conn in self._connections:
+            if conn.task is None:
+                conn.task = self._loop.create_task(conn.run())
+            elif conn.streams != before.get(conn, conn.streams):
+                self._loop.create_task(conn.update_subscriptions(before[conn]))
+        for conn in before:
+            if conn not in self._connections:
+                conn.task.cancel()
+                print(f"🧹 [ws#{conn.conn_id}] шард закрыт", flush=True)
+
+    async def _before_subscribe(self, streams):
+        if self.on_connect is None:
+            return
+        try:
+            await self._loop.run_in_executor(None, self.on_connect, streams)
+        except Exception as e:
+            print("❌ Ошибка on_connect:", e, flush=True)
+
+    def _new_shard(self, streams):
+        self._next_conn_id += 1
+        return StreamConnection(self, self._next_conn_id, streams)
+
+    # Скорость сообщений по шардам за последний RATE_INTERVAL
+    async def _rate_monitor(self):
+        while True:
+            await asyncio.sleep(RATE_INTERVAL)
+            for conn in self._connections:
+                conn.rate = (conn.messages - conn._rate_mark) / RATE_INTERVAL
+                conn._rate_mark = conn.messages
+
+    def shard_stats(self):
+        return [
+            {
+                "shard": conn.conn_id,
+                "streams": len(conn.streams),
+                "connected": conn.ws is not None,
+                "messages": conn.messages,
+                "msg_per_sec": round(conn.rate, 1),
+            }
+            for conn in sorted(list(self._connections), key=lambda conn: -conn.rate)
+        ]
+
+    # После обрыва (и по refresh) перечитываем список символов
+    # (флаги меняются только в потоке loop)
+    def _on_reconnect(self):
+        if self.streams_provider is None:
+            return
+        if self._reload_pending:
+            self._reload_dirty = True  # список мог измениться после начала чтения
+            return
+        self._reload_pending = True
+        self._loop.run_in_executor(None, self._reload_streams)
+
+    def _reload_streams(self):
+        try:
+            self.set_streams(self.streams_provider())
+        except Exception as e:
+            print("❌ Ошибка загрузки списка потоков:", e, flush=True)
+        finally:
+            # после _apply_streams из set_streams: call_soon_threadsafe сохраняет порядок
+            self._loop.call_soon_threadsafe(self._reload_done)
+
+    def _reload_done(self):
+        self._reload_pending = False
+        if self._reload_dirty:
+            self._reload_dirty = False
+            self._on_reconnect()
+
+    def _dispatch(self, raw):
+        try:
+            decoded = self.decoder.decode(raw)
+        except ValueError:
+            self.stats["decode_errors"] += 1
+            return
+        if decoded is None:
+            return  # ответы на SUBSCRIBE: {"result": null, "id": 1}
+        kind, event = decoded
+        self.stats["messages"] += 1
+        for handler in self._handlers.get(kind, ()):
+            try:
+                handler(event)
+            except Exception as e:
+                self.stats["handler_errors"] += 1
+                print(f"❌ Ошибка обработчика {kind}:", e, flush=True)
+
+    # Перечитать список символов сейчас (потокобезопасно, например из Flask)
+    def refresh(self):
+        if self._loop is not None and self.streams_provider is not None:
+            self._loop.call_soon_threadsafe(self._on_reconnect)
+
+    # Периодическая сверка набора символов; пока символов нет — чаще
+    async def _symbol_watch(self):
+        while True:
+            await asyncio.sleep(SYMBOL_WATCH_INTERVAL if self._streams else RECONNECT_DELAY)
+            if self.streams_provider is not None and not self._reload_pending:
+                self._reload_pending = True
+                await self._loop.run_in_executor(None, self._reload_streams)
+
+    # Ошибка на одном кадре не должна останавливать разбор остальных:
+    # без этой задачи приём данных встаёт молча
+    async def _dispatcher(self):
+        while True:
+            raw = await self._queue.get()
+            try:
+                self._dispatch(raw)
+            except Exception as e:
+                self.stats["dispatch_errors"] += 1
+                print(f"❌ Ошибка разбора кадра ({str(raw)[:200]}):", repr(e), flush=True)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        if not self._streams and self.streams_provider is not None:
+            try:
+                self._streams = {normalize_stream(s) for s in await self._loop.run_in_executor(None, self.streams_provider)}
+            except Exception as e:
+                print("❌ Ошибка загрузки списка потоков:", e, flush=True)
+        self._apply_streams(set(self._streams))
+        self._loop.create_task(self._symbol_watch())
+        self._loop.create_task(self._rate_monitor())
+        await self._dispatcher()
+
+    # Для Flask и воркеров: весь клиент в одном фоновом потоке
+    def start_in_thread(self):
+        thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+        thread.start()
+        # ждём, пока loop поднимется, чтобы set_streams сразу шёл в него
+        while self._loop is None and thread.is_alive():
+            time.sleep(0.01)
+        return thread
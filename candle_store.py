@@ -0,0 +1,180 @@
+# === Хранилище M1-свечей в памяти процесса ===
+#
+# На каждый символ — колонки array: время открытия (epoch ms, int64) и OHLC (float64).
+# Прогревается один раз из SQLite при старте, дальше пополняется потоком @kline_1m.
+# Эндпоинты читают срезы из памяти вместо полного SELECT по таблице prices.
+
+import os
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+from migrations import backfill_done
+from partitions import read_tail
+
+# Сколько последних свечей держать на символ (по умолчанию — 30 дней M1)
+CANDLE_RETENTION = int(os.environ.get("CANDLE_RETENTION", 30 * 24 * 60))
+
+
+# ISO-строка из таблицы prices (UTC без зоны) → epoch ms
+def iso_to_ms(ts_str):
+    dt = datetime.fromisoformat(ts_str)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+# epoch ms → naive datetime в UTC (как и в остальном коде)
+def ms_to_dt(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+class SymbolCandles:
+    __slots__ = ("ts", "open", "high", "low", "close")
+
+    def __init__(self):
+        self.ts = array("q")
+        self.open = array("d")
+        self.high = array("d")
+        self.low = array("d")
+        self.close = array("d")
+
+    def __len__(self):
+        return len(self.ts)
+
+    def put(self, ts, o, h, l, c):
+        n = len(self.ts)
+        if n == 0 or ts > self.ts[-1]:
+            self.ts.append(ts)
+            self.open.append(o)
+            self.high.append(h)
+            self.low.append(l)
+            self.close.append(c)
+            return
+        # повтор или опоздавшая свеча — вставка/замена по месту
+        i = bisect_left(self.ts, ts)
+        if i < n and self.ts[i] == ts:
+            self.open[i], self.high[i], self.low[i], self.close[i] = o, h, l, c
+        else:
+            self.ts.insert(i, ts)
+            self.open.insert(i, o)
+            self.high.insert(i, h)
+            self.low.insert(i, l)
+            self.close.insert(i, c)
+
+    def trim(self, keep):
+        extra = len(self.ts) - keep
+        if extra > 0:
+            for col in (self.ts, self.open, self.high, self.low, self.close):
+                del col[:extra]
+
+
+class CandleStore:
+    def __init__(self, retention=CANDLE_RETENTION):
+        self.retention = retention
+        # обрезаем пачкой, а не на каждой свече: del array[:k] — это memmove
+        self._slack = max(1, retention // 20)
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def append(self, symbol, ts, o, h, l, c):
+        symbol = symbol.lower()
+        with self._lock:
+            candles = self._data.get(symbol)
+            if candles is None:
+                candles = self._data[symbol] = SymbolCandles()
+            candles.put(int(ts), float(o), float(h), float(l), float(c))
+            if len(candles) > self.retention + self._slack:
+                candles.trim(self.retention)
+
+    # Полная замена ряда символа готовыми свечами (ts по возрастанию)
+    def load(self, symbol, rows):
+        candles = SymbolCandles()
+        for ts, o, h, l, c in rows[-self.retention:]:
+            candles.put(int(ts), float(o), float(h), float(l), float(c))
+        with self._lock:
+            self._data[symbol.lower()] = candles
+
+    # Список (ts_ms, open, high, low, close), от старых к новым.
+    # since — только свечи с ts >= since; limit — только последние limit штук.
+    # pad — сколько свечей захватить перед `since`/`limit` (разгон для канала)
+    def rows(self, symbol, since=None, limit=None, pad=0):
+        with self._lock:
+            candles = self._data.get(symbol.lower())
+            if candles is None:
+                return []
+            start = bisect_left(candles.ts, since) if since is not None else 0
+            end = len(candles)
+            if limit is not None:
+                start = max(start, end - limit)
+            start = max(0, start - pad)
+            return list(zip(
+                candles.ts[start:end],
+                candles.open[start:end],
+                candles.high[start:end],
+                candles.low[start:end],
+                candles.close[start:end],
+            ))
+
+    def last_ts(self, symbol):
+        with self._lock:
+            candles = self._data.get(symbol.lower())
+            return candles.ts[-1] if candles else None
+
+    # Версия данных символа для ETag: (число свечей, ts и close последней)
+    def version(self, symbol):
+        with self._lock:
+            candles = self._data.get(symbol.lower())
+            if not candles:
+                return (0, None, None)
+            return (len(candles), candles.ts[-1], candles.close[-1])
+
+    def symbols(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def drop(self, symbol):
+        with self._lock:
+            self._data.pop(symbol.lower(), None)
+
+    # Прогрев из SQLite: последние `retention` свечей каждого символа
+    def warm_from_sqlite(self, db_path):
+        conn = sqlite3.connect(db_path)
+        c = conn.cursor()
+        c.execute("SELECT name FROM symbols")
+        symbols = [row[0].lower() for row in c.fetchall()]
+        # пока миграция ts не закончилась — старый путь через строки timestamp
+        use_ts = backfill_done(conn)
+        total = 0
+        for symbol in symbols:
+            # M1 по дневным партициям и наследной таблице (см. partitions.py)
+            rows = read_tail(conn, symbol, self.retention)
+            if not use_ts:
+                # наследные строки, у которых ts ещё не заполнен, — по timestamp
+                c.execute(
+                    "SELECT timestamp, open, high, low, close FROM prices WHERE symbol = ? AND ts IS NULL ORDER BY timestamp DESC LIMIT ?",
+                    (symbol, self.retention)
+                )
+                for ts, o, h, l, c_ in c.fetchall():
+                    try:
+                        rows.append((iso_to_ms(ts), o, h, l, c_))
+                    except (TypeError, ValueError):
+                        continue
+                rows = sorted((row for row in rows if row[0] is not None), key=lambda row: row[0])
+            candles = SymbolCandles()
+            for ts, o, h, l, c_ in rows[-self.retention:]:
+                try:
+                    candles.put(int(ts), float(o), float(h), float(l), float(c_))
+                except (TypeError, ValueError):
+                    continue
+            with self._lock:
+                self._data[symbol] = candles
+            total += len(candles)
+        conn.close()
+        print(f"🧠 Кэш свечей прогрет: {len(symbols)} символов, {total} свечей")
+
+
+# Общий экземпляр на процесс
+candle_store = CandleStore()
@@ -0,0 +1,189 @@
+# === Разбор кадров Binance combined streams в типизированные события ===
+#
+# Кадр {"stream": "...", "data": {...}} превращается в (тип, событие), где событие —
+# KlineEvent / TradeEvent / AggTradeEvent / BookTickerEvent с уже числовыми
+# полями (цены — float, время — int ms). Обработчики работают с атрибутами:
+#
+#     def on_trade(event):
+#         latest_price.update(event.symbol.lower(), event.price, event.event_ms)
+#
+# Бэкенд выбирается STREAM_DECODER (auto | msgspec | orjson | json):
+#   msgspec — разбор сразу в структуры (строки-цены → float внутри C-кода);
+#   orjson  — быстрый разбор в dict + преобразование;
+#   json    — стандартная библиотека, работает везде.
+# auto — первый доступный из перечисленных. Неизвестные типы событий
+# отдаются как есть (dict) под своим "e".
+
+import json
+import os
+from collections import namedtuple
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_DECODER = os.environ.get("STREAM_DECODER", "auto")
+
+if msgspec is not None:
+    class KlineBar(msgspec.Struct, kw_only=True):
+        open_time: int = msgspec.field(name="t")
+        close_time: int = msgspec.field(name="T")
+        interval: str = msgspec.field(name="i", default="")
+        open: float = msgspec.field(name="o")
+        high: float = msgspec.field(name="h")
+        low: float = msgspec.field(name="l")
+        close: float = msgspec.field(name="c")
+        volume: float = msgspec.field(name="v", default=0.0)
+        closed: bool = msgspec.field(name="x")
+
+    class KlineEvent(msgspec.Struct, kw_only=True, tag_field="e", tag="kline"):
+        symbol: str = msgspec.field(name="s")
+        event_ms: int = msgspec.field(name="E", default=0)
+        kline: KlineBar = msgspec.field(name="k")
+
+    class TradeEvent(msgspec.Struct, kw_only=True, tag_field="e", tag="trade"):
+        symbol: str = msgspec.field(name="s")
+        price: float = msgspec.field(name="p")
+        quantity: float = msgspec.field(name="q", default=0.0)
+        event_ms: int = msgspec.field(name="E", default=0)
+        trade_ms: int = msgspec.field(name="T", default=0)
+
+    class AggTradeEvent(TradeEvent, tag="aggTrade"):
+        pass
+
+    class BookTickerEvent(msgspec.Struct, kw_only=True, tag_field="e", tag="bookTicker"):
+        symbol: str = msgspec.field(name="s")
+        bid: float = msgspec.field(name="b")
+        ask: float = msgspec.field(name="a")
+        bid_qty: float = msgspec.field(name="B", default=0.0)
+        ask_qty: float = msgspec.field(name="A", default=0.0)
+        event_ms: int = msgspec.field(name="E", default=0)
+
+    class Frame(msgspec.Struct):
+        stream: str = ""
+        data: KlineEvent | TradeEvent | AggTradeEvent | BookTickerEvent | None = None
+else:
+    KlineBar = namedtuple("KlineBar", "open_time close_time interval open high low close volume closed")
+    KlineEvent = namedtuple("KlineEvent", "symbol event_ms kline")
+    TradeEvent = namedtuple("TradeEvent", "symbol price quantity event_ms trade_ms")
+    AggTradeEvent = namedtuple("AggTradeEvent", "symbol price quantity event_ms trade_ms")
+    BookTickerEvent = namedtuple("BookTickerEvent", "symbol bid ask bid_qty ask_qty event_ms")
+
+
+# dict из json/orjson → те же типы, что отдаёт msgspec
+def _kline(d):
+    k = d["k"]
+    return KlineEvent(symbol=d["s"], event_ms=int(d.get("E", 0)), kline=KlineBar(
+        open_time=int(k["t"]), close_time=int(k["T"]), interval=k.get("i", ""),
+        open=float(k["o"]), high=float(k["h"]), low=float(k["l"]), close=float(k["c"]),
+        volume=float(k.get("v", 0)), closed=bool(k["x"]),
+    ))
+
+
+def _trade(cls):
+    def convert(d):
+        return cls(symbol=d["s"], price=float(d["p"]), quantity=float(d.get("q", 0)),
+                   event_ms=int(d.get("E", 0)), trade_ms=int(d.get("T", 0)))
+    return convert
+
+
+def _book_ticker(d):
+    return BookTickerEvent(symbol=d["s"], bid=float(d["b"]), ask=float(d["a"]),
+                           bid_qty=float(d.get("B", 0)), ask_qty=float(d.get("A", 0)),
+                           event_ms=int(d.get("E", 0)))
+
+
+CONVERTERS = {
+    "kline": _kline,
+    "trade": _trade(TradeEvent),
+    "aggTrade": _trade(AggTradeEvent),
+    "bookTicker": _book_ticker,
+}
+
+EVENT_KINDS = {KlineEvent: "kline", TradeEvent: "trade", AggTradeEvent: "aggTrade", BookTickerEvent: "bookTicker"}
+
+
+# Событие кадра как dict; None — служебный кадр без data (или вовсе не объект).
+# data не объектом — ошибка разбора (ValueError), как и у msgspec.
+def _payload(frame):
+    payload = frame.get("data") if isinstance(frame, dict) else None
+    if not payload:
+        return None
+    if not isinstance(payload, dict):
+        raise ValueError(f"data не объект: {type(payload).__name__}")
+    return payload
+
+
+# Общая часть json/orjson: loads → dict → типизированное событие
+class DictDecoder:
+    def __init__(self, name, loads):
+        self.name = name
+        self.loads = loads
+
+    # → (тип, событие) или None для служебных кадров ({"result": null, "id": 1})
+    def decode(self, raw):
+        payload = _payload(self.loads(raw))
+        if payload is None:
+            return None
+        kind = payload.get("e")
+        convert = CONVERTERS.get(kind)
+        if convert is None:
+            return kind, payload
+        try:
+            return kind, convert(payload)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"неполное событие {kind}: {e}") from e
+
+
+class MsgspecDecoder:
+    name = "msgspec"
+
+    def __init__(self):
+        # strict=False — строковые цены Binance ("65000.10") сразу в float
+        self._frames = msgspec.json.Decoder(Frame, strict=False)
+        self._generic = msgspec.json.Decoder()
+
+    def decode(self, raw):
+        try:
+            event = self._frames.decode(raw).data
+        except msgspec.ValidationError as e:
+            # событие вне известных типов — как есть
+            payload = _payload(self._generic.decode(raw))
+            if payload is None:
+                return None
+            kind = payload.get("e")
+            if kind in CONVERTERS:
+                raise ValueError(f"неполное событие {kind}: {e}") from e
+            return kind, payload
+        if event is None:
+            return None
+        return EVENT_KINDS[type(event)], event
+
+
+def available_decoders():
+    names = []
+    if msgspec is not None:
+        names.append("msgspec")
+    if orjson is not None:
+        names.append("orjson")
+    names.append("json")
+    return names
+
+
+# Ошибки разбора у всех бэкендов — подклассы ValueError
+def make_decoder(name=STREAM_DECODER):
+    if name == "auto":
+        name = available_decoders()[0]
+    if name == "msgspec" and msgspec is not None:
+        return MsgspecDecoder()
+    if name == "orjson" and orjson is not None:
+        return DictDecoder("orjson", orjson.loads)
+    if name != "json":
+        print(f"⚠️ Декодер {name} недоступен, используется json", flush=True)
+    return DictDecoder("json", json.loads)
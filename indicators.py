@@ -0,0 +1,153 @@
+# === Индикаторы на NumPy: канал регрессии, угол, ширина, ATR ===
+#
+# Все функции принимают последовательности (список, array, np.ndarray) и
+# считают целый ряд за один вызов, без цикла Python по свечам: канал по ряду —
+# через накопленные суммы, канал по матрице окон (live) — матричными операциями.
+#
+#     lower, mid, upper = regression_bands(closes, 50, 2.0)
+#     atr_series = atr(highs, lows, closes, 14, method="rma")
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+ATR_METHODS = ("sma", "rma", "ema")
+# Свечей в блоке накопленных сумм regression_bands
+BANDS_BLOCK = 512
+
+
+# Регрессия y = intercept + slope·x (x = 0..n-1) по каждой строке windows (m × n).
+# Возвращает массивы (slope, intercept, std) длины m; std — по остаткам, /n.
+def linreg(windows):
+    windows = np.atleast_2d(np.asarray(windows, dtype=float))
+    n = windows.shape[1]
+    x = np.arange(n) - (n - 1) / 2
+    var_x = (x * x).sum()
+
+    mean = windows.mean(axis=1)
+    dev = windows - mean[:, None]
+    slope = dev @ x / var_x if var_x else np.zeros(len(windows))
+    resid = dev - slope[:, None] * x
+    std = np.sqrt((resid * resid).mean(axis=1))
+    intercept = mean - slope * (n - 1) / 2
+    return slope, intercept, std
+
+
+# Канал на каждую свечу (логика /api/candles): окно растёт до `length`,
+# граница — по последней точке линии регрессии. Возвращает (lower, mid, upper).
+#
+# Суммы y, k·y и y² по каждому окну — разности накопленных сумм, O(N) без
+# матрицы N × length. Накопленные суммы считаются блоками по BANDS_BLOCK свечей
+# относительно первой цены блока: так их величина и ошибка округления
+# при вычитании не растут с длиной ряда.
+def regression_bands(closes, length, deviation):
+    y = np.asarray(closes, dtype=float)
+    length = max(1, int(length))
+    mid = np.empty(len(y))
+    std = np.empty(len(y))
+
+    for first in range(0, len(y), BANDS_BLOCK):
+        last = min(first + BANDS_BLOCK, len(y))
+        origin = max(0, first - length + 1)
+        ref = y[origin]
+        block = y[origin:last] - ref
+        k = np.arange(len(block), dtype=float)
+        sum_y, sum_ky, sum_yy = (
+            np.concatenate(([0.0], np.cumsum(values))) for values in (block, k * block, block * block)
+        )
+
+        end = np.arange(first, last) - origin + 1  # окно свечи i — block[start:end]
+        start = np.maximum(end - length, 0)
+        n = (end - start).astype(float)
+        sy = sum_y[end] - sum_y[start]
+        syy = sum_yy[end] - sum_yy[start]
+        # Σ (j - (n-1)/2)·y по позиции j внутри окна
+        sxy = sum_ky[end] - sum_ky[start] - (start + (n - 1) / 2) * sy
+        var_x = n * (n * n - 1) / 12
+
+        slope = np.divide(sxy, var_x, out=np.zeros(len(n)), where=var_x > 0)
+        mean = sy / n
+        resid = syy - sy * mean - slope * sxy
+        resid[n <= 2] = 0.0  # через одну-две точки линия проходит точно
+        mid[first:last] = ref + mean + slope * (n - 1) / 2
+        std[first:last] = np.sqrt(np.maximum(resid, 0.0) / n)
+
+    return mid - deviation * std, mid, mid + deviation * std
+
+
+# Угол наклона в градусах по ценам, нормализованным к base (y / base)
+def normalized_angle(slope, base):
+    base = np.where(np.asarray(base) == 0, 1, base)
+    return np.degrees(np.arctan(np.asarray(slope) / base))
+
+
+def width_percent(upper, lower, center):
+    return (np.asarray(upper) - np.asarray(lower)) / np.asarray(center) * 100
+
+
+# Канал по логике TradingView: последние `length - 1` закрытий + текущая цена.
+# Центр — середина линии регрессии, угол — по нормализованным к первой цене данным.
+def live_channel(closes, current_price, length, deviation):
+    window = np.append(np.asarray(closes, dtype=float), float(current_price))[-max(1, int(length)):]
+    result = {key: float(value[0]) for key, value in live_channels(window, deviation).items()}
+    result["width_percent"] = round(result["width_percent"], 2)
+    result["angle"] = round(result["angle"], 2)
+    return result
+
+
+# То же для многих символов сразу: windows — матрица (символы × окно),
+# каждая строка — закрытия с текущей ценой в конце. Значения — массивы по строкам,
+# width_percent и angle без округления.
+def live_channels(windows, deviation):
+    windows = np.atleast_2d(np.asarray(windows, dtype=float))
+    n = windows.shape[1]
+    slope, intercept, std = linreg(windows)
+
+    center = intercept + slope * (n - 1) / 2
+    upper = center + deviation * std
+    lower = center - deviation * std
+
+    return {
+        "slope": slope,
+        "intercept": intercept,
+        "std": std,
+        "center": center,
+        "upper": upper,
+        "lower": lower,
+        "width_percent": width_percent(upper, lower, center),
+        "angle": normalized_angle(slope, windows[:, 0]),
+    }
+
+
+# True Range начиная со второй свечи (нужно предыдущее закрытие): длина n-1
+def true_range(highs, lows, closes):
+    high = np.asarray(highs, dtype=float)[1:]
+    low = np.asarray(lows, dtype=float)[1:]
+    prev_close = np.asarray(closes, dtype=float)[:-1]
+    return np.maximum.reduce([high - low, np.abs(high - prev_close), np.abs(low - prev_close)])
+
+
+# Сглаживание с затравкой SMA(period): y = y_prev + alpha·(x - y_prev).
+# Рекурсия последовательна по природе, поэтому здесь один проход Python по ряду.
+def _smooth(values, period, alpha):
+    out = np.empty(len(values) - period + 1)
+    prev = float(values[:period].mean())
+    out[0] = prev
+    for i, x in enumerate(values[period:].tolist(), 1):
+        prev += alpha * (x - prev)
+        out[i] = prev
+    return out
+
+
+# ATR по ряду свечей. method: "sma" — скользящее среднее TR,
+# "rma" — сглаживание Уайлдера (alpha = 1/period), "ema" — alpha = 2/(period+1).
+# Значение i относится к свече period+i (первое — после period значений TR).
+def atr(highs, lows, closes, period, method="sma"):
+    if method not in ATR_METHODS:
+        raise ValueError(f"неизвестный метод ATR: {method}")
+    tr = true_range(highs, lows, closes)
+    if period <= 0 or len(tr) < period:
+        return np.empty(0)
+    if method == "sma":
+        return sliding_window_view(tr, period).mean(axis=1)
+    alpha = 1 / period if method == "rma" else 2 / (period + 1)
+    return _smooth(tr, period, alpha)
@@ -1,33 +1,27 @@
 
-import os
 import time
-import json
-import threading
-import psycopg2
-import websocket
-
-# === Подключение к PostgreSQL через переменные окружения ===
-PG_HOST = os.environ.get("PG_HOST")
-PG_PORT = os.environ.get("PG_PORT", 5432)
-PG_NAME = os.environ.get("PG_NAME")
-PG_USER = os.environ.get("PG_USER")
-PG_PASSWORD = os.environ.get("PG_PASSWORD")
+
+from backfill import MINUTE_MS, GapFiller, kline_symbols
+from binance_stream import BinanceStreamClient
+
+# Подключение к PostgreSQL — общий пул (PG_* и PG_POOL_* в окружении)
+from pg_pool import pg_connection
+from pg_writer import PGBatchWriter
+from pg_partitions import PGPartitions
+
+# M1-свечи всех символов пишутся одной пачкой на минуту
+prices_writer = PGBatchWriter("prices_pg", ("symbol", "timestamp", "open", "high", "low", "close"))
+# Дневные партиции prices_pg и удаление дней старше PRICES_RETENTION_DAYS
+prices_partitions = PGPartitions("prices_pg")
 
 # === Получение списка символов из PostgreSQL ===
 def load_symbols():
     try:
         print("🔎 Загружаем список символов из PostgreSQL...")
-        conn = psycopg2.connect(
-            dbname=PG_NAME,
-            user=PG_USER,
-            password=PG_PASSWORD,
-            host=PG_HOST,
-            port=PG_PORT
-        )
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM symbols")
-        symbols = [row[0].lower() for row in cur.fetchall()]
-        conn.close()
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT name FROM symbols")
+            symbols = [row[0].lower() for row in cur.fetchall()]
         print(f"✅ Загружено {len(symbols)} символов: {symbols}")
         return symbols
     except Exception as e:
@@ -35,62 +29,64 @@ def load_symbols():
         return []
 
 # === Обработка потока 1-минутных свечей с Binance ===
+def on_kline(event):
+    try:
+        kline = event.kline
+        if not kline.closed:
+            return
+
+        symbol = event.symbol.lower()
+        ts = kline.open_time
+        o = kline.open
+        h = kline.high
+        l = kline.low
+        c_ = kline.close
+
+        ts_iso = save_kline(symbol, ts, o, h, l, c_)
+
+        print(f"📝 {symbol} [{ts_iso}] {o} / {h} / {l} / {c_}")
+    except Exception as e:
+        print("❌ Ошибка в on_message:", e)
+
+def save_kline(symbol, ts, o, h, l, c_):
+    ts_iso = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ts / 1000))
+    prices_writer.add((symbol, ts_iso, o, h, l, c_))
+    return ts_iso
+
+# === Дозаполнение минут, пропущенных за время обрыва (backfill.py) ===
+def last_open_time(symbol):
+    with pg_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT EXTRACT(EPOCH FROM MAX(timestamp)) FROM prices_pg WHERE symbol = %s", (symbol.lower(),))
+        row = cur.fetchone()
+    if not row or row[0] is None:
+        return None
+    return int(float(row[0]) * 1000) // MINUTE_MS * MINUTE_MS
+
+def store_backfill(symbol, rows):
+    for open_time, _close_time, o, h, l, c_ in rows:
+        save_kline(symbol.lower(), open_time, o, h, l, c_)
+
+gap_filler = GapFiller(last_open_time, store_backfill)
+
+def load_stream_names():
+    symbols = load_symbols()
+    if not symbols:
+        print("⚠️ Нет символов для подписки. Ждём...")
+    return [f"{s}@kline_1m" for s in symbols]
+
+binance = BinanceStreamClient(
+    streams_provider=load_stream_names,
+    on_connect=lambda streams: gap_filler.fill(kline_symbols(streams)),
+)
+binance.on("kline", on_kline)
+
 def run_kline_stream():
     print("🚀 KLINE_STREAM_POSTGRES ЗАПУЩЕН")
-
-    def on_message(ws, message):
-        try:
-            data = json.loads(message)
-            kline = data['data']['k']
-            if not kline['x']:
-                return
-
-            symbol = data['data']['s'].lower()
-            ts = kline['t']
-            o = float(kline['o'])
-            h = float(kline['h'])
-            l = float(kline['l'])
-            c_ = float(kline['c'])
-
-            ts_iso = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ts / 1000))
-
-            conn = psycopg2.connect(
-                dbname=PG_NAME,
-                user=PG_USER,
-                password=PG_PASSWORD,
-                host=PG_HOST,
-                port=PG_PORT
-            )
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO prices_pg (symbol, timestamp, open, high, low, close) VALUES (%s, %s, %s, %s, %s, %s)",
-                (symbol, ts_iso, o, h, l, c_)
-            )
-            conn.commit()
-            conn.close()
-
-            print(f"✅ {symbol} [{ts_iso}] {o} / {h} / {l} / {c_}")
-        except Exception as e:
-            print("❌ Ошибка в on_message:", e)
-
-    def stream_loop():
-        while True:
-            try:
-                symbols = load_symbols()
-                if not symbols:
-                    print("⚠️ Нет символов для подписки. Ждём...")
-                    time.sleep(10)
-                    continue
-                streams = [f"{s}@kline_1m" for s in symbols]
-                url = "wss://fstream.binance.com/stream?streams=" + "/".join(streams)
-                print("🔌 Подключение к WebSocket:", url)
-                ws = websocket.WebSocketApp(url, on_message=on_message)
-                ws.run_forever()
-            except Exception as e:
-                print("❌ Ошибка WebSocket:", e)
-                time.sleep(10)
-
-    threading.Thread(target=stream_loop, daemon=True).start()
+    # дневные партиции — до уникального индекса под ON CONFLICT (см. pg_partitions.py)
+    prices_partitions.ensure_partitioned().start()
+    prices_writer.ensure_unique().start()
+    binance.start_in_thread()
 
 if __name__ == "__main__":
     run_kline_stream()
@@ -0,0 +1,125 @@
+# === Раздача live-канала подписчикам (SSE) ===
+#
+# Канал пересчитывается один раз на символ при изменении цены — не чаще, чем
+# раз в LIVE_PUSH_INTERVAL, — и одним и тем же результатом расходится по всем
+# открытым вкладкам. Закрытие свечи рассылается отдельным событием; его данные
+# тоже строятся в потоке хаба (defer), а не в потоке, который сообщил о закрытии.
+
+import os
+import queue
+import threading
+import time
+
+LIVE_PUSH_INTERVAL = float(os.environ.get("LIVE_PUSH_INTERVAL", 0.25))
+# Очередь на одного подписчика; у медленного клиента старые события выбрасываются
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class LiveHub:
+    def __init__(self, compute, interval=LIVE_PUSH_INTERVAL):
+        # compute(symbol) -> dict с live-каналом
+        self.compute = compute
+        self.interval = interval
+        self._subscribers = {}
+        self._last_price = {}
+        self._snapshot = {}
+        self._dirty = set()
+        self._deferred = []  # (symbol, event, build) — построить и разослать в _run
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"computations": 0, "events_sent": 0, "events_dropped": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def subscribe(self, symbol):
+        symbol = symbol.lower()
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(symbol, []).append(q)
+            self._dirty.add(symbol)  # первое значение — сразу после подключения
+        return q
+
+    def unsubscribe(self, symbol, q):
+        symbol = symbol.lower()
+        with self._lock:
+            subs = self._subscribers.get(symbol, [])
+            if q in subs:
+                subs.remove(q)
+            if not subs:
+                self._subscribers.pop(symbol, None)
+                self._snapshot.pop(symbol, None)
+                self._last_price.pop(symbol, None)
+
+    def has_subscribers(self, symbol):
+        return symbol.lower() in self._subscribers
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    # Вызывается на каждой сделке: только отметка, без расчётов
+    def price_changed(self, symbol, price):
+        if symbol not in self._subscribers or self._last_price.get(symbol) == price:
+            return
+        self._last_price[symbol] = price
+        with self._lock:
+            self._dirty.add(symbol)
+
+    def snapshot(self, symbol):
+        return self._snapshot.get(symbol.lower())
+
+    def publish(self, symbol, event, data):
+        with self._lock:
+            subs = list(self._subscribers.get(symbol.lower(), ()))
+        for q in subs:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait((event, data))
+                except (queue.Empty, queue.Full):
+                    pass
+                self.stats["events_dropped"] += 1
+            self.stats["events_sent"] += 1
+
+    # Событие, данные которого build() строит уже в потоке хаба.
+    # build() может вернуть None — тогда ничего не рассылается.
+    def defer(self, symbol, event, build):
+        with self._lock:
+            self._deferred.append((symbol.lower(), event, build))
+
+    def _run_deferred(self, jobs):
+        for symbol, event, build in jobs:
+            if symbol not in self._subscribers:
+                continue
+            try:
+                data = build()
+            except Exception as e:
+                print(f"❌ Ошибка события {event} для {symbol}:", e)
+                continue
+            if data is not None:
+                self.publish(symbol, event, data)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                jobs, self._deferred = self._deferred, []
+            self._run_deferred(jobs)
+            for symbol in dirty:
+                if symbol not in self._subscribers:
+                    continue
+                try:
+                    data = self.compute(symbol)
+                except Exception as e:
+                    print(f"❌ Ошибка расчёта live-канала {symbol}:", e)
+                    continue
+                self.stats["computations"] += 1
+                self._snapshot[symbol] = data
+                self.publish(symbol, "live", data)
@@ -0,0 +1,93 @@
+# === Миграция схемы SQLite: время в epoch ms + индексы (symbol, ts) ===
+#
+# К таблицам prices и signals добавляется колонка ts INTEGER (epoch ms, UTC).
+# Старая колонка timestamp TEXT остаётся для совместимости (db.html, ручные выборки).
+# Существующие строки заполняются фоновым потоком пачками, приложение не останавливается.
+
+import sqlite3
+import threading
+import time
+
+BACKFILL_BATCH = 5000
+BACKFILL_PAUSE = 0.05  # пауза между пачками, чтобы не держать блокировку записи
+
+# ISO-строка → epoch ms средствами SQLite (формат с 'T' и с пробелом)
+TS_FROM_TEXT = "CAST(strftime('%s', timestamp) AS INTEGER) * 1000"
+
+TABLES = ("prices", "signals")
+
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in c.fetchall()}
+
+
+# Синхронная часть: колонки и индексы (быстро, без перезаписи строк)
+def migrate(db_path):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    for table in TABLES:
+        if "ts" not in _columns(c, table):
+            c.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER")
+    # покрывающие индексы: выборка по символу и времени без обращения к таблице
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prices_symbol_ts ON prices (symbol, ts, open, high, low, close)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_signals_symbol_ts ON signals (symbol, ts, action)")
+    # частичные индексы по ещё не заполненным строкам — ими ходит backfill;
+    # после миграции они пустые и ничего не стоят
+    for table in TABLES:
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts_null ON {table} (id) WHERE ts IS NULL")
+    conn.commit()
+    conn.close()
+
+
+# Заполнены ли ts во всех строках таблицы (по частичному индексу — мгновенно)
+def backfill_done(conn, table="prices"):
+    c = conn.cursor()
+    c.execute(f"SELECT 1 FROM {table} WHERE ts IS NULL LIMIT 1")
+    return c.fetchone() is None
+
+
+# Пачками по id. Строки с нечитаемым timestamp не получают выдуманное время:
+# свечи без времени удаляются (их не положить ни в одну партицию, а без этого
+# миграция prices не закончится), сигналы остаются с ts = NULL.
+def _backfill_table(db_path, table):
+    total = 0
+    last_id = 0
+    while True:
+        conn = sqlite3.connect(db_path, timeout=30)
+        c = conn.cursor()
+        c.execute(f"SELECT id FROM {table} WHERE ts IS NULL AND id > ? ORDER BY id LIMIT ?", (last_id, BACKFILL_BATCH))
+        ids = [row[0] for row in c.fetchall()]
+        if not ids:
+            conn.close()
+            break
+        bounds = (ids[0], ids[-1])
+        c.execute(f"""
+            UPDATE {table} SET ts = {TS_FROM_TEXT}
+            WHERE id BETWEEN ? AND ? AND ts IS NULL AND {TS_FROM_TEXT} IS NOT NULL
+        """, bounds)
+        total += c.rowcount
+        if table == "prices":
+            c.execute(f"DELETE FROM {table} WHERE id BETWEEN ? AND ? AND ts IS NULL", bounds)
+            if c.rowcount:
+                print(f"⚠️ Миграция {table}.ts: удалено строк с нечитаемым timestamp: {c.rowcount}")
+        conn.commit()
+        conn.close()
+        last_id = ids[-1]
+        time.sleep(BACKFILL_PAUSE)
+    return total
+
+
+def run_backfill(db_path):
+    for table in TABLES:
+        try:
+            started = time.time()
+            total = _backfill_table(db_path, table)
+            print(f"🗂 Миграция {table}.ts завершена: {total} строк за {time.time() - started:.1f} с")
+        except Exception as e:
+            print(f"❌ Ошибка миграции {table}.ts:", e)
+
+
+# Фоновое заполнение ts для старых строк
+def start_backfill(db_path):
+    threading.Thread(target=run_backfill, args=(db_path,), daemon=True).start()
@@ -0,0 +1,255 @@
+# === Дневные партиции M1-свечей в SQLite ===
+#
+# Новые свечи пишутся в таблицы prices_YYYYMMDD (день UTC по open_time) с той же
+# схемой, что prices, и покрывающим индексом (symbol, ts). Прежняя таблица prices
+# остаётся «наследной»: retention.py переносит её строки в дневные партиции
+# пачками и затем удаляет старые дни целиком через DROP TABLE.
+#
+# Читать M1 из SQLite — через функции модуля: они обходят только партиции,
+# пересекающие нужный диапазон, и наследную таблицу, пока в ней есть строки.
+#
+#     rows = read_tail(conn, "btcusdt", 1440)            # последние сутки
+#     rows = read_range(conn, "btcusdt", start_ms, end_ms)
+
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+DAY_MS = 24 * 60 * 60 * 1000
+LEGACY_TABLE = "prices"
+PARTITION_PREFIX = "prices_"
+PARTITION_RE = re.compile(r"^prices_(\d{8})$")
+# На сколько дней вперёд заводить партиции заранее (запись не ждёт DDL)
+PARTITION_PREMAKE_DAYS = 2
+
+COLUMNS = "symbol, timestamp, ts, open, high, low, close"
+
+
+def partition_name(ts_ms):
+    return PARTITION_PREFIX + datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+# Начало дня партиции, epoch ms
+def partition_start(name):
+    day = datetime.strptime(PARTITION_RE.match(name).group(1), "%Y%m%d")
+    return int(day.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def create_partition(c, name):
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT,
+            timestamp TEXT,
+            ts INTEGER,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL
+        )
+    """)
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_symbol_ts ON {name} (symbol, ts, open, high, low, close)")
+    # просмотр всех символов подряд от новых к старым (/api/db/prices)
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_ts ON {name} (ts)")
+
+
+# [(начало дня ms, имя)] по возрастанию
+def list_partitions(conn):
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'prices%'")
+    return sorted((partition_start(name), name) for (name,) in c.fetchall() if PARTITION_RE.match(name))
+
+
+def _legacy_used(conn):
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (LEGACY_TABLE,))
+    if c.fetchone() is None:
+        return False
+    c.execute(f"SELECT 1 FROM {LEGACY_TABLE} LIMIT 1")
+    return c.fetchone() is not None
+
+
+# Таблицы, где могут быть строки из [lower, upper): партиции от новых к старым + наследная
+def _sources(conn, lower=None, upper=None):
+    names = [
+        name for start, name in reversed(list_partitions(conn))
+        if (upper is None or start < upper) and (lower is None or start + DAY_MS > lower)
+    ]
+    if _legacy_used(conn):
+        names.append(LEGACY_TABLE)
+    return names
+
+
+# Свечи символа с lower <= ts < upper: [(ts, open, high, low, close)] по возрастанию
+def read_range(conn, symbol, lower, upper):
+    c = conn.cursor()
+    rows = []
+    for table in _sources(conn, lower, upper):
+        c.execute(
+            f"SELECT ts, open, high, low, close FROM {table} WHERE symbol = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (symbol.lower(), lower, upper)
+        )
+        rows.extend(c.fetchall())
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+# Время последней свечи символа раньше before (или вообще последней), ms или None
+def last_before(conn, symbol, before=None):
+    c = conn.cursor()
+    symbol = symbol.lower()
+    bound = before if before is not None else 2 ** 62
+    found = None
+    for table in _sources(conn, upper=before):
+        if found is not None and table != LEGACY_TABLE:
+            continue  # партиции не пересекаются и идут от новых к старым
+        c.execute(f"SELECT MAX(ts) FROM {table} WHERE symbol = ? AND ts < ?", (symbol, bound))
+        ts = c.fetchone()[0]
+        if ts is not None and (found is None or ts > found):
+            found = ts
+    return found
+
+
+# Последние limit свечей символа по возрастанию ts. Партиции читаются от новых
+# к старым, каждая — ORDER BY ts DESC LIMIT по индексу; партиции, целиком
+# старше уже набранных строк, пропускаются без запроса. Наследные строки
+# с ещё не заполненным ts не возвращаются (их читают по timestamp).
+def read_tail(conn, symbol, limit):
+    c = conn.cursor()
+    symbol = symbol.lower()
+    rows = []
+    for table in _sources(conn):
+        if table != LEGACY_TABLE and len(rows) >= limit and partition_start(table) + DAY_MS <= rows[-1][0]:
+            continue  # партиция целиком старше уже набранных строк
+        c.execute(
+            f"SELECT ts, open, high, low, close FROM {table} WHERE symbol = ? AND ts IS NOT NULL ORDER BY ts DESC LIMIT ?",
+            (symbol, limit)
+        )
+        rows = sorted(rows + c.fetchall(), key=lambda row: row[0], reverse=True)[:limit]
+    return rows[::-1]
+
+
+# Удаление свечей символа во всех таблицах — по индексу (symbol, ts) в каждой
+def delete_symbol_rows(conn, symbol):
+    c = conn.cursor()
+    deleted = 0
+    for table in _sources(conn):
+        c.execute(f"DELETE FROM {table} WHERE symbol = ?", (symbol.lower(),))
+        deleted += c.rowcount
+    return deleted
+
+
+# Наследная таблица и все партиции
+def table_names(conn):
+    return [LEGACY_TABLE] + [name for _start, name in list_partitions(conn)]
+
+
+# Все M1-строки одним подзапросом (для ручных выборок)
+def union_sql(conn):
+    return " UNION ALL ".join(f"SELECT id, {COLUMNS} FROM {table}" for table in table_names(conn))
+
+
+# Страница строк всех таблиц от новых к старым по (ts, id) для /db.
+# before — курсор (ts, id) последней строки прошлой страницы, where/params —
+# фильтр без WHERE. Партиции читаются по индексу ts от новых к старым, пока
+# страница не набрана; наследная — целиком по фильтру, пока в ней есть строки.
+# id свой в каждой таблице: курсор однозначен, так как день задаёт партицию.
+# Нужен conn.row_factory = sqlite3.Row; строки без ts (миграция) не видны.
+def read_page(conn, where, params, before, limit):
+    c = conn.cursor()
+    conditions = [where] if where else []
+    params = list(params)
+    if before is not None:
+        conditions.append("(ts, id) < (?, ?)")
+        params.extend(before)
+    else:
+        conditions.append("ts IS NOT NULL")
+    sql_where = " AND ".join(conditions)
+    rows = []
+    for table in _sources(conn, upper=before[0] + 1 if before else None):
+        if table != LEGACY_TABLE and len(rows) >= limit and partition_start(table) + DAY_MS <= rows[-1]["ts"]:
+            continue  # партиция целиком старше уже набранных строк
+        c.execute(
+            f"SELECT id, {COLUMNS} FROM {table} WHERE {sql_where} ORDER BY ts DESC, id DESC LIMIT ?",
+            params + [limit]
+        )
+        rows = sorted(rows + c.fetchall(), key=lambda row: (row["ts"], row["id"]), reverse=True)[:limit]
+    return rows
+
+
+class PricePartitions:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._known = set()
+        self._insert_sql = {}
+        # INSERT-запросы в партиции, которых ещё нет: их заводит prepare()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # Известные партиции; заодно индексы, добавленные после их создания
+    def load(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        names = {name for _start, name in list_partitions(conn)}
+        c = conn.cursor()
+        for name in names:
+            create_partition(c, name)
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._known = names
+        return self
+
+    def ensure(self, name):
+        with self._lock:
+            if name in self._known:
+                return
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        create_partition(conn.cursor(), name)
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._known.add(name)
+
+    # Партиции на сегодня и PARTITION_PREMAKE_DAYS вперёд
+    def premake(self, now_ms, days=PARTITION_PREMAKE_DAYS):
+        for day in range(days + 1):
+            self.ensure(partition_name(now_ms + day * DAY_MS))
+
+    def forget(self, name):
+        with self._lock:
+            self._known.discard(name)
+            self._pending.pop(self._insert_sql.pop(name, None), None)
+
+    def names(self):
+        with self._lock:
+            return sorted(self._known)
+
+    # INSERT в партицию дня свечи. Партиция обычно уже заведена premake();
+    # если нет (дозаполнение старого дня) — её создаст prepare() в потоке
+    # писателя: вызывающий поток (цикл событий Binance) DDL не ждёт.
+    def insert_sql(self, ts_ms):
+        name = partition_name(ts_ms)
+        sql = self._insert_sql.get(name)
+        if sql is None:
+            sql = f"INSERT INTO {name} ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+            with self._lock:
+                if name not in self._known:
+                    self._pending[sql] = name
+                self._insert_sql[name] = sql
+        return sql
+
+    # Хук SQLiteWriter(prepare=...): перед записью пачки заводит партиции
+    # для её INSERT-запросов на соединении писателя
+    def prepare(self, conn, sqls):
+        with self._lock:
+            names = {self._pending[sql] for sql in sqls if sql in self._pending} - self._known
+        if not names:
+            return
+        c = conn.cursor()
+        for name in sorted(names):
+            create_partition(c, name)
+        conn.commit()
+        with self._lock:
+            self._known |= names
+            self._pending = {sql: name for sql, name in self._pending.items() if name not in self._known}
@@ -0,0 +1,195 @@
+# === Дневные партиции prices_pg в PostgreSQL и удаление старых дней ===
+#
+# prices_pg один раз превращается в таблицу с PARTITION BY RANGE (timestamp):
+# прежние строки целиком становятся партицией prices_pg_legacy (до конца
+# текущего дня), дальше — партиции prices_pg_pYYYYMMDD, заводимые заранее, и
+# prices_pg_default на случай записи вне заведённых дней.
+#
+# Раз в COMPACT_INTERVAL секунд PGPartitions заводит партиции на ближайшие
+# дни и удаляет (DROP TABLE) те, что целиком старше PRICES_RETENTION_DAYS.
+# Бары старших таймфреймов (candles_5m / 15m / 1h / 4h) не трогаются —
+# за пределами срока хранения остаются только они.
+#
+# Оба воркера могут запускать обслуживание одновременно: каждое действие
+# выполняется под pg_advisory_xact_lock.
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from partitions import DAY_MS, PARTITION_PREMAKE_DAYS
+from pg_pool import pg_connection
+from retention import COMPACT_INTERVAL, PRICES_RETENTION_DAYS, now_ms, retention_cutoff
+
+# Ключ advisory-блокировки обслуживания партиций
+PARTITION_LOCK_KEY = 72_160_422
+PARTITION_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def day_start(ts_ms):
+    return datetime.fromtimestamp(ts_ms // DAY_MS * DAY_MS / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+class PGPartitions:
+    def __init__(self, table="prices_pg", column="timestamp",
+                 retention_days=PRICES_RETENTION_DAYS, interval=COMPACT_INTERVAL):
+        self.table = table
+        self.column = column
+        self.legacy = f"{table}_legacy"
+        self.retention_days = retention_days
+        self.interval = interval
+        self.partitioned = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "created": 0, "dropped": 0, "errors": 0, "last_run_at": None}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, partitioned=self.partitioned)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _partition(self, day):
+        return f"{self.table}_p{day:%Y%m%d}"
+
+    # Обычная таблица → секционированная. Строки не переписываются: старая
+    # таблица подключается партицией (MINVALUE, завтра), проверка границы —
+    # один проход по ней. Индекс под ON CONFLICT переименовывается, чтобы
+    # PGBatchWriter.ensure_unique создал такой же на родителе, — поэтому
+    # вызывать до ensure_unique. При ошибке запись идёт в таблицу как есть.
+    def ensure_partitioned(self):
+        try:
+            with pg_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+                cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (self.table,))
+                row = cur.fetchone()
+                if row and row[0] == "p":
+                    self.partitioned = True
+                    return self
+                bound = day_start(now_ms()) + timedelta(days=1)
+                if row is None:
+                    cur.execute(f"""
+                        CREATE TABLE {self.table} (
+                            symbol TEXT,
+                            {self.column} TIMESTAMP,
+                            open DOUBLE PRECISION,
+                            high DOUBLE PRECISION,
+                            low DOUBLE PRECISION,
+                            close DOUBLE PRECISION
+                        ) PARTITION BY RANGE ({self.column})
+                    """)
+                else:
+                    cur.execute(f"LOCK TABLE {self.table} IN ACCESS EXCLUSIVE MODE")
+                    # граница — конец текущего дня или дня самой поздней строки
+                    cur.execute(f"SELECT (date_trunc('day', MAX({self.column})) + interval '1 day')::timestamp FROM {self.table}")
+                    latest = cur.fetchone()[0]
+                    if latest is not None and latest > bound:
+                        bound = latest
+                    cur.execute(f"ALTER TABLE {self.table} RENAME TO {self.legacy}")
+                    unique = f"uq_{self.table}_symbol_{self.column}"
+                    cur.execute(f"ALTER INDEX IF EXISTS {unique} RENAME TO uq_{self.legacy}_symbol_{self.column}")
+                    cur.execute(f"CREATE TABLE {self.table} (LIKE {self.legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({self.column})")
+                    cur.execute(
+                        f"ALTER TABLE {self.table} ATTACH PARTITION {self.legacy} FOR VALUES FROM (MINVALUE) TO (%s)",
+                        (bound,)
+                    )
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {self.table}_default PARTITION OF {self.table} DEFAULT")
+            self.partitioned = True
+            print(f"🗂 {self.table} секционирована по дням ({self.column})", flush=True)
+            return self
+        except Exception as e:
+            print(f"⚠️ {self.table}: не удалось секционировать ({e}), пишем в обычную таблицу", flush=True)
+            return self
+
+    # Верхняя граница наследной партиции (None — её нет или уже удалена)
+    def _legacy_bound(self, cur):
+        cur.execute("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = to_regclass(%s)", (self.legacy,))
+        row = cur.fetchone()
+        match = PARTITION_BOUND_RE.search(row[0] or "") if row else None
+        return datetime.fromisoformat(match.group(1)) if match else None
+
+    def premake(self, now=None, days=PARTITION_PREMAKE_DAYS):
+        today = day_start(now or now_ms())
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+            legacy_bound = self._legacy_bound(cur)
+            # вчерашний день — для дозаполнения пропусков после простоя
+            for offset in range(-1, days + 1):
+                day = today + timedelta(days=offset)
+                if legacy_bound is not None and day < legacy_bound:
+                    continue
+                cur.execute("SELECT to_regclass(%s)", (self._partition(day),))
+                if cur.fetchone()[0] is not None:
+                    continue
+                cur.execute(
+                    f"CREATE TABLE {self._partition(day)} PARTITION OF {self.table} FOR VALUES FROM (%s) TO (%s)",
+                    (day, day + timedelta(days=1))
+                )
+                self._count("created")
+
+    # Партиции, целиком старше срока хранения, — DROP TABLE
+    def drop_expired(self, now=None):
+        if self.retention_days <= 0:
+            return 0
+        cutoff = day_start(retention_cutoff(now or now_ms(), self.retention_days))
+        dropped = 0
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+            cur.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(%s)
+            """, (self.table,))
+            names = [row[0] for row in cur.fetchall()]
+            prefix = f"{self.table}_p"
+            for name in names:
+                if name.startswith(prefix):
+                    day = datetime.strptime(name[len(prefix):], "%Y%m%d")
+                    expired = day + timedelta(days=1) <= cutoff
+                elif name == self.legacy:
+                    bound = self._legacy_bound(cur)
+                    expired = bound is not None and bound <= cutoff
+                else:
+                    continue
+                if expired:
+                    cur.execute(f"DROP TABLE IF EXISTS {name}")
+                    dropped += 1
+        if dropped:
+            self._count("dropped", dropped)
+            print(f"🗜 [{self.table}] удалено партиций старше {self.retention_days} дн.: {dropped}", flush=True)
+        return dropped
+
+    def run_once(self):
+        if not self.partitioned:
+            return  # таблица не секционирована — обслуживать нечего
+        self.premake()
+        self.drop_expired()
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_run_at"] = now_ms()
+
+    # Первое обслуживание — сразу, до начала записи; дальше — в фоне
+    def start(self):
+        if self._thread is None:
+            self._maintain()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _maintain(self):
+        try:
+            self.run_once()
+        except Exception as e:
+            self._count("errors")
+            print(f"❌ [{self.table}] ошибка обслуживания партиций:", e, flush=True)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._maintain()
@@ -0,0 +1,144 @@
+# === Общий пул соединений PostgreSQL (app.py и воркеры) ===
+#
+# Вместо psycopg2.connect на каждое сообщение/запрос:
+#
+#     with pg_connection() as conn:
+#         cur = conn.cursor()
+#         cur.execute(...)
+#
+# При выходе из блока — commit (или rollback при исключении), соединение
+# возвращается в пул. Оборванные соединения выбрасываются и пересоздаются.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", 10))
+# Сколько ждать свободного соединения, секунд
+PG_POOL_TIMEOUT = float(os.environ.get("PG_POOL_TIMEOUT", 10))
+# Соединение, простоявшее дольше этого, перед выдачей проверяется SELECT 1
+PG_POOL_CHECK_IDLE = float(os.environ.get("PG_POOL_CHECK_IDLE", 30))
+
+
+def pg_params():
+    return {
+        "dbname": os.environ.get("PG_NAME"),
+        "user": os.environ.get("PG_USER"),
+        "password": os.environ.get("PG_PASSWORD"),
+        "host": os.environ.get("PG_HOST"),
+        "port": os.environ.get("PG_PORT", 5432),
+    }
+
+
+class PGPool:
+    def __init__(self, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX, **params):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.params = params or pg_params()
+        self._pool = None
+        self._init_lock = threading.Lock()
+        # ThreadedConnectionPool не ждёт, а падает при исчерпании — ограничиваем сами
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {"borrowed": 0, "reconnects": 0, "health_failures": 0, "timeouts": 0}
+
+    # Пул создаётся при первом обращении: импорт модуля не требует доступной БД
+    def _get_pool(self):
+        if self._pool is None:
+            with self._init_lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self.params)
+        return self._pool
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < PG_POOL_CHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._count("health_failures")
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=PG_POOL_TIMEOUT):
+            self._count("timeouts")
+            raise pg_pool.PoolError("нет свободных соединений PostgreSQL")
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            # один повтор: битое соединение закрываем, пул откроет новое
+            if not self._healthy(conn):
+                self._discard(conn)
+                self._count("reconnects")
+                conn = pool.getconn()
+            self._count("borrowed")
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            self._get_pool().putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._get_pool().putconn(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def stats(self):
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["min"] = self.minconn
+        result["max"] = self.maxconn
+        return result
+
+
+# Общий пул процесса
+pg = PGPool()
+
+
+def pg_connection():
+    return pg.connection()
@@ -0,0 +1,190 @@
+# === Пакетная запись в PostgreSQL для воркеров ===
+#
+# Свечи всех символов закрываются в одну и ту же минуту. Вместо INSERT на каждую
+# строка попадает в буфер таблицы, а фоновый поток через FLUSH_DELAY секунд после
+# первой строки пишет всю пачку одним execute_values. ON CONFLICT (symbol, timestamp)
+# DO NOTHING делает повторы после переподключения безопасными. Уникальный индекс
+# под него заводит ensure_unique(), удаляя дубли, накопленные до него; если индекс
+# так и не создан, в stats() on_conflict = False и повтор пачки может дать дубли.
+#
+# dedupe=True отбрасывает строку ещё в add(), если строка с тем же ключом
+# conflict уже была за последние DEDUPE_WINDOW секунд, — без уникального
+# индекса в таблице и без лишних строк в пачке. В stats() — задержка
+# от add() до COMMIT по последним LATENCY_SAMPLES строкам.
+
+import threading
+import time
+from collections import deque
+
+from psycopg2.extras import execute_values
+
+from pg_pool import pg_connection
+
+# Сколько ждать остальные свечи той же минуты после первой
+FLUSH_DELAY = 2.0
+FLUSH_MAX_ROWS = 5000
+# Предел буфера, пока PostgreSQL недоступен; старые строки сверх него отбрасываются
+BUFFER_LIMIT = FLUSH_MAX_ROWS * 10
+DEDUPE_WINDOW = 120.0
+LATENCY_SAMPLES = 1000
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class PGBatchWriter:
+    def __init__(self, table, columns, template=None, conflict=("symbol", "timestamp"),
+                 flush_delay=FLUSH_DELAY, max_rows=FLUSH_MAX_ROWS, dedupe=False):
+        self.table = table
+        self.columns = columns
+        self.template = template
+        self.conflict = conflict
+        self.flush_delay = flush_delay
+        self.max_rows = max_rows
+        # до проверки уникального индекса ON CONFLICT не используем
+        self._on_conflict = False
+        self._rows = []
+        self._enqueued = []  # время add() каждой строки буфера
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._thread = None
+        # ключ conflict → время последней строки с ним (только при dedupe)
+        self._key_index = [columns.index(column) for column in conflict] if dedupe else None
+        self._seen = {}
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {"rows": 0, "batches": 0, "errors": 0, "dropped": 0, "duplicates": 0, "last_batch_rows": 0, "last_flush_ms": 0.0}
+
+    # Уникальный индекс под ON CONFLICT. Таблица, писавшаяся без него, обычно уже
+    # содержит дубли: они удаляются (остаётся первая физически строка) в той же
+    # транзакции, запись в таблицу на это время блокируется. Если индекс всё же
+    # не создан — пишем обычным INSERT, без гарантии от дублей при повторе.
+    def ensure_unique(self):
+        name = f"uq_{self.table}_{'_'.join(self.conflict)}"
+        keys = ", ".join(self.conflict)
+        # строки с NULL в ключе уникальный индекс не сравнивает — их не трогаем
+        not_null = " AND ".join(f"{column} IS NOT NULL" for column in self.conflict)
+        try:
+            with pg_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s", (self.table, name))
+                if cur.fetchone() is None:
+                    cur.execute(f"LOCK TABLE {self.table} IN SHARE ROW EXCLUSIVE MODE")
+                    cur.execute(f"""
+                        DELETE FROM {self.table} WHERE (tableoid, ctid) IN (
+                            SELECT tableoid, ctid FROM (
+                                SELECT tableoid, ctid, row_number() OVER (PARTITION BY {keys} ORDER BY tableoid, ctid) AS n
+                                FROM {self.table} WHERE {not_null}
+                            ) ranked WHERE n > 1
+                        )
+                    """)
+                    if cur.rowcount:
+                        print(f"🧹 {self.table}: удалено дублей по ({keys}): {cur.rowcount}", flush=True)
+                    cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {self.table} ({keys})")
+            self._on_conflict = True
+        except Exception as e:
+            self._on_conflict = False
+            print(f"⚠️ {self.table}: нет уникального индекса ({e}), пишем без ON CONFLICT — повторы могут дать дубли", flush=True)
+        return self
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    # False — строка отброшена как повтор (dedupe)
+    def add(self, row):
+        now = time.monotonic()
+        with self._cond:
+            if self._key_index is not None:
+                key = tuple(row[i] for i in self._key_index)
+                seen = self._seen.get(key)
+                if seen is not None and now - seen < DEDUPE_WINDOW:
+                    self._stats["duplicates"] += 1
+                    return False
+                self._seen[key] = now
+            if not self._rows:
+                self._first_at = now
+                self._cond.notify()  # поток сброса начинает отсчёт FLUSH_DELAY
+            self._rows.append(row)
+            self._enqueued.append(now)
+            if len(self._rows) >= self.max_rows:
+                self._cond.notify()
+        return True
+
+    def stats(self):
+        with self._cond:
+            result = dict(self._stats)
+            result["buffered"] = len(self._rows)
+            result["on_conflict"] = self._on_conflict
+            latencies = list(self._latencies)
+        if latencies:
+            result["latency_ms"] = {
+                "p50": round(percentile(latencies, 0.5), 1),
+                "p99": round(percentile(latencies, 0.99), 1),
+                "max": round(max(latencies), 1),
+            }
+        return result
+
+    def _sql(self):
+        sql = f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES %s"
+        if self._on_conflict:
+            sql += f" ON CONFLICT ({', '.join(self.conflict)}) DO NOTHING"
+        return sql
+
+    def flush(self, rows):
+        started = time.perf_counter()
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            execute_values(cur, self._sql(), rows, template=self.template, page_size=len(rows))
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self._stats["rows"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["last_batch_rows"] = len(rows)
+            self._stats["last_flush_ms"] = round(elapsed, 2)
+        print(f"💾 [{self.table}] записано {len(rows)} строк за {elapsed:.0f} ms", flush=True)
+
+    def _take(self):
+        with self._cond:
+            while True:
+                if self._rows:
+                    wait = self._first_at + self.flush_delay - time.monotonic()
+                    if wait <= 0 or len(self._rows) >= self.max_rows:
+                        rows, self._rows = self._rows, []
+                        enqueued, self._enqueued = self._enqueued, []
+                        return rows, enqueued
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    # Ключи dedupe старше окна больше не нужны
+    def _forget_seen(self, now):
+        if self._seen:
+            self._seen = {key: at for key, at in self._seen.items() if now - at < DEDUPE_WINDOW}
+
+    def _run(self):
+        while True:
+            rows, enqueued = self._take()
+            try:
+                self.flush(rows)
+                now = time.monotonic()
+                with self._cond:
+                    self._latencies.extend((now - at) * 1000 for at in enqueued)
+                    self._forget_seen(now)
+            except Exception as e:
+                with self._cond:
+                    self._stats["errors"] += 1
+                    # возвращаем пачку в начало буфера; повтор без дублей только
+                    # при ON CONFLICT (см. ensure_unique и stats()["on_conflict"])
+                    self._rows = rows + self._rows
+                    self._enqueued = enqueued + self._enqueued
+                    if len(self._rows) > BUFFER_LIMIT:
+                        self._stats["dropped"] += len(self._rows) - BUFFER_LIMIT
+                        self._rows = self._rows[-BUFFER_LIMIT:]
+                        self._enqueued = self._enqueued[-BUFFER_LIMIT:]
+                    self._first_at = time.monotonic()
+                print(f"❌ [{self.table}] ошибка пакетной записи ({len(rows)} строк):", e, flush=True)
+                time.sleep(1)
@@ -0,0 +1,145 @@
+# === Табло текущих цен: цена, время события, время приёма, число сделок ===
+#
+# Пишет один поток (обработчик @trade), читают потоки Flask. Запись по символу —
+# неизменяемый кортеж PriceQuote, который заменяется целиком одним присваиванием
+# в dict, поэтому читатель без блокировок видит либо старую, либо новую запись,
+# но никогда не смесь полей. snapshot() — копия всего табло одним dict.copy().
+#
+#     board.update("btcusdt", 65000.5, payload["E"])
+#     board.price("btcusdt", max_age=PRICE_STALE_AFTER)  # None, если цена устарела
+#
+# PriceConflator стоит перед табло: из потока сделок в табло уходит не больше
+# одной цены на символ за PRICE_CONFLATE_MS (или сразу — при сдвиге цены на
+# PRICE_CONFLATE_PCT процентов). Промежуточные сделки схлопываются в последнюю.
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+# Цена старше стольких секунд (по времени приёма) считается устаревшей
+PRICE_STALE_AFTER = float(os.environ.get("PRICE_STALE_AFTER", 10))
+# Не чаще одной публикации на символ за столько миллисекунд (0 — каждая сделка)
+PRICE_CONFLATE_MS = float(os.environ.get("PRICE_CONFLATE_MS", 100))
+# Сдвиг цены в процентах, публикуемый сразу, без ожидания (0 — выключено)
+PRICE_CONFLATE_PCT = float(os.environ.get("PRICE_CONFLATE_PCT", 0))
+
+# event_ms — время события Binance, recv_ms — время приёма у нас (epoch ms)
+PriceQuote = namedtuple("PriceQuote", "price event_ms recv_ms ticks")
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def quote_age(quote, now=None):
+    return ((now or now_ms()) - quote.recv_ms) / 1000
+
+
+def is_stale(quote, max_age=PRICE_STALE_AFTER, now=None):
+    return quote is None or quote_age(quote, now) > max_age
+
+
+class PriceBoard:
+    def __init__(self):
+        self._quotes = {}
+
+    # ticks — сколько сделок представляет эта цена (больше 1 после схлопывания)
+    def update(self, symbol, price, event_ms=None, ticks=1):
+        recv = now_ms()
+        prev = self._quotes.get(symbol)
+        if prev:
+            ticks += prev.ticks
+        self._quotes[symbol] = PriceQuote(price, event_ms or recv, recv, ticks)
+
+    def quote(self, symbol):
+        return self._quotes.get(symbol)
+
+    # Только цена; с max_age устаревшая цена не отдаётся (None)
+    def price(self, symbol, max_age=None):
+        quote = self._quotes.get(symbol)
+        if quote is None or (max_age is not None and is_stale(quote, max_age)):
+            return None
+        return quote.price
+
+    # Согласованная копия всего табло для массовых эндпоинтов
+    def snapshot(self):
+        return self._quotes.copy()
+
+    def drop(self, symbol):
+        self._quotes.pop(symbol, None)
+
+    def __contains__(self, symbol):
+        return symbol in self._quotes
+
+    def __len__(self):
+        return len(self._quotes)
+
+
+class PriceConflator:
+    def __init__(self, publish, interval_ms=PRICE_CONFLATE_MS, threshold_pct=PRICE_CONFLATE_PCT):
+        # publish(symbol, price, event_ms, ticks)
+        self.publish = publish
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_pct / 100
+        self._last = {}  # symbol -> (опубликованная цена, monotonic-время публикации)
+        self._pending = {}  # symbol -> [price, event_ms, ticks]
+        self._lock = threading.Lock()
+        self._thread = None
+        # ticks = published + coalesced + ещё не досланные
+        self.stats = {"ticks": 0, "published": 0, "coalesced": 0}
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _due(self, symbol, price, now):
+        last = self._last.get(symbol)
+        if last is None or now - last[1] >= self.interval:
+            return True
+        return self.threshold > 0 and abs(price - last[0]) >= abs(last[0]) * self.threshold
+
+    def _emit(self, symbol, price, event_ms, ticks, now):
+        self._last[symbol] = (price, now)
+        self.stats["published"] += 1
+        self.publish(symbol, price, event_ms, ticks)
+
+    # Вызывается на каждую сделку. Публикация — под блокировкой, чтобы более
+    # старая цена из flush() не перезаписала более новую.
+    def tick(self, symbol, price, event_ms=None):
+        now = time.monotonic()
+        with self._lock:
+            self.stats["ticks"] += 1
+            pending = self._pending.pop(symbol, None)
+            ticks = 1
+            if pending:
+                # отложенная цена вытеснена более свежей — схлопнута
+                ticks += pending[2]
+                self.stats["coalesced"] += 1
+            if self._due(symbol, price, now):
+                self._emit(symbol, price, event_ms, ticks, now)
+            else:
+                self._pending[symbol] = [price, event_ms, ticks]
+
+    # Дослать отложенные цены, чей интервал истёк (после пачки сделок наступила тишина)
+    def flush(self):
+        now = time.monotonic()
+        with self._lock:
+            for symbol in [s for s in self._pending if now - self._last[s][1] >= self.interval]:
+                price, event_ms, ticks = self._pending.pop(symbol)
+                self._emit(symbol, price, event_ms, ticks, now)
+
+    def drop(self, symbol):
+        with self._lock:
+            self._pending.pop(symbol, None)
+            self._last.pop(symbol, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval / 2)
+            try:
+                self.flush()
+            except Exception as e:
+                print("❌ Ошибка публикации цен:", e, flush=True)
@@ -0,0 +1,214 @@
+# === Запись и воспроизведение потоков Binance ===
+#
+# Запись: сырые кадры combined stream в сжатый файл, по строке на кадр:
+#     <время приёма, epoch ms>\t<кадр JSON>
+#
+#     python replay.py record --symbols btcusdt,ethusdt --duration 600 -o frames.jsonl.gz
+#
+# Воспроизведение: локальный WebSocket-сервер с протоколом Binance (/stream +
+# SUBSCRIBE/UNSUBSCRIBE). Каждое соединение получает только свои потоки, с
+# исходными интервалами, ускоренными в --speed раз (0 — без пауз, максимум).
+#
+#     python replay.py serve frames.jsonl.gz --speed 10 --port 9443
+#     BINANCE_WS_URL=ws://127.0.0.1:9443 python app.py
+#
+# Пропускная способность и задержка записи свечей — python bench.py ingest.
+
+import argparse
+import asyncio
+import gzip
+import json
+import threading
+import time
+
+import websockets
+
+from binance_stream import BINANCE_WS_URL, MAX_STREAMS_PER_CONNECTION, RECONNECT_DELAY
+
+REPLAY_HOST = "127.0.0.1"
+REPLAY_PORT = 9443
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+# Строки записи → [(время приёма ms, поток, кадр)]. Понимает и файлы из одних
+# кадров без времени (тогда время — номер кадра).
+def load_recording(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    frames = []
+    with opener(path, "rt") as f:
+        for i, line in enumerate(f):
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            ts, sep, raw = line.partition("\t")
+            if not sep:
+                ts, raw = i, line
+            stream = json.loads(raw).get("stream")
+            if stream:
+                frames.append((int(ts), stream, raw))
+    return frames
+
+
+def write_recording(path, frames):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt") as f:
+        for ts, _stream, raw in frames:
+            f.write(f"{ts}\t{raw}\n")
+
+
+# === Запись ===
+
+async def _record_connection(base_url, streams, out, counter, stop_at):
+    url = base_url.rstrip("/") + "/stream"
+    while stop_at is None or time.monotonic() < stop_at:
+        try:
+            # короткий close_timeout: на потоке без пауз закрытие не ждёт хвост кадров
+            async with websockets.connect(url, max_queue=1024, ping_interval=None, close_timeout=1) as ws:
+                await ws.send(json.dumps({"method": "SUBSCRIBE", "params": sorted(streams), "id": 1}))
+                while True:
+                    timeout = None if stop_at is None else stop_at - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        return
+                    raw = await asyncio.wait_for(ws.recv(), timeout)
+                    if isinstance(raw, bytes):
+                        raw = raw.decode()
+                    if '"stream"' not in raw:
+                        continue  # ответы на SUBSCRIBE
+                    out.write(f"{now_ms()}\t{raw}\n")
+                    counter[0] += 1
+        except asyncio.TimeoutError:
+            return
+        except Exception as e:
+            print("❌ Ошибка записи потока:", e, flush=True)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def record(streams, path, duration=None, base_url=BINANCE_WS_URL):
+    streams = sorted(streams)
+    stop_at = time.monotonic() + duration if duration else None
+    counter = [0]
+    with gzip.open(path, "wt") as out:
+        shards = [streams[i:i + MAX_STREAMS_PER_CONNECTION] for i in range(0, len(streams), MAX_STREAMS_PER_CONNECTION)]
+        tasks = [asyncio.create_task(_record_connection(base_url, shard, out, counter, stop_at)) for shard in shards]
+        started = time.monotonic()
+        try:
+            while not all(task.done() for task in tasks):
+                await asyncio.wait(tasks, timeout=5)
+                print(f"⏺ записано кадров: {counter[0]} за {time.monotonic() - started:.0f} с", flush=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+    print(f"✅ {counter[0]} кадров → {path}", flush=True)
+
+
+# === Воспроизведение ===
+
+class ReplayServer:
+    def __init__(self, frames, speed=1.0, host=REPLAY_HOST, port=REPLAY_PORT, repeat=False, on_send=None):
+        # frames — список из load_recording или путь к файлу записи
+        self.frames = load_recording(frames) if isinstance(frames, str) else frames
+        self.speed = speed
+        self.host = host
+        self.port = port
+        self.repeat = repeat
+        # on_send(raw) — перед отправкой каждого кадра (замеры в bench.py)
+        self.on_send = on_send
+        self._ready = threading.Event()
+        self.stats = {"connections": 0, "sent": 0}
+
+    async def _control(self, ws, streams, subscribed):
+        async for message in ws:
+            try:
+                request = json.loads(message)
+            except ValueError:
+                continue
+            params = set(request.get("params") or ())
+            if request.get("method") == "SUBSCRIBE":
+                streams |= params
+                subscribed.set()
+            elif request.get("method") == "UNSUBSCRIBE":
+                streams -= params
+            await ws.send(json.dumps({"result": None, "id": request.get("id")}))
+
+    async def _play(self, ws, streams):
+        while True:
+            started = time.monotonic()
+            first_ts = self.frames[0][0] if self.frames else 0
+            for ts, stream, raw in self.frames:
+                if stream not in streams:
+                    continue
+                if self.speed > 0:
+                    delay = (ts - first_ts) / 1000 / self.speed - (time.monotonic() - started)
+                    if delay > 0.001:
+                        await asyncio.sleep(delay)
+                if self.on_send is not None:
+                    self.on_send(raw)
+                await ws.send(raw)
+                self.stats["sent"] += 1
+            if not self.repeat:
+                return
+
+    async def _handler(self, ws):
+        self.stats["connections"] += 1
+        streams = set()
+        subscribed = asyncio.Event()
+        control = asyncio.create_task(self._control(ws, streams, subscribed))
+        try:
+            await subscribed.wait()
+            await self._play(ws, streams)
+            await control  # после записи соединение живёт, пока клиент не закроет
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            control.cancel()
+
+    async def serve(self):
+        async with websockets.serve(self._handler, self.host, self.port, max_size=None) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await asyncio.Future()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=lambda: asyncio.run(self.serve()), daemon=True)
+        thread.start()
+        self._ready.wait()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись и воспроизведение потоков Binance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="записать кадры в сжатый файл")
+    p.add_argument("--symbols", required=True, help="btcusdt,ethusdt,...")
+    p.add_argument("--streams", default="kline_1m,trade", help="типы потоков через запятую")
+    p.add_argument("--duration", type=float, help="секунд записи (по умолчанию — до Ctrl+C)")
+    p.add_argument("-o", "--output", default="frames.jsonl.gz")
+    p.add_argument("--url", default=BINANCE_WS_URL)
+
+    p = sub.add_parser("serve", help="воспроизвести запись локальным WebSocket-сервером")
+    p.add_argument("recording")
+    p.add_argument("--speed", type=float, default=1.0, help="ускорение; 0 — без пауз")
+    p.add_argument("--host", default=REPLAY_HOST)
+    p.add_argument("--port", type=int, default=REPLAY_PORT)
+    p.add_argument("--repeat", action="store_true", help="проигрывать по кругу")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        streams = [f"{s.strip().lower()}@{kind.strip()}" for s in args.symbols.split(",") for kind in args.streams.split(",")]
+        asyncio.run(record(streams, args.output, args.duration, args.url))
+    else:
+        server = ReplayServer(args.recording, args.speed, args.host, args.port, args.repeat)
+        print(f"▶️ {len(server.frames)} кадров, скорость x{args.speed or 'max'}: BINANCE_WS_URL={server.url}", flush=True)
+        asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    main()
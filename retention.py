@@ -0,0 +1,192 @@
+# === Хранение M1: срок жизни сырых свечей, даунсэмплинг и компакция ===
+#
+# Сырые M1-свечи живут в дневных партициях (partitions.py) PRICES_RETENTION_DAYS
+# дней. Дальше остаются только бары rollups (5m / 15m / 1h / 4h). Фоновый
+# Compactor раз в COMPACT_INTERVAL секунд:
+#   1. заводит партиции на ближайшие дни;
+#   2. переносит строки наследной таблицы prices в дневные партиции пачками;
+#   3. выгружает закрытые дни в колоночный архив (archive.py), если он задан;
+#   4. для каждой истёкшей партиции досчитывает в rollups недостающие бары
+#      из её M1-свечей и удаляет партицию одним DROP TABLE. С архивом партиция
+#      удаляется только после выгрузки.
+# Бары всех таймфреймов укладываются в сутки без остатка, поэтому каждая
+# партиция содержит свои бары целиком.
+
+import os
+import sqlite3
+import threading
+import time
+
+from archive import ARCHIVE_AFTER_DAYS
+from migrations import backfill_done
+from partitions import COLUMNS, DAY_MS, LEGACY_TABLE, PricePartitions, create_partition, list_partitions, partition_name
+from rollups import TIMEFRAMES, aggregate, init_rollup_table
+
+# Сколько дней хранить сырые M1 (0 — бессрочно)
+PRICES_RETENTION_DAYS = int(os.environ.get("PRICES_RETENTION_DAYS", 30))
+# Период фоновой компакции, секунд
+COMPACT_INTERVAL = float(os.environ.get("COMPACT_INTERVAL", 3600))
+COMPACT_BATCH = 5000
+COMPACT_PAUSE = 0.05  # пауза между пачками переноса, чтобы не держать блокировку записи
+
+# Даунсэмплинг не перезаписывает бары, уже сохранённые живым потоком
+ROLLUP_INSERT_MISSING = "INSERT OR IGNORE INTO rollups (symbol, interval, timestamp, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+# Начало первого дня, который ещё хранится: партиции раньше него удаляются
+def retention_cutoff(now, days=PRICES_RETENTION_DAYS):
+    return (now // DAY_MS - days) * DAY_MS
+
+
+class Compactor:
+    def __init__(self, db_path, partitions=None, timeframes=None,
+                 retention_days=PRICES_RETENTION_DAYS, interval=COMPACT_INTERVAL, archive=None):
+        self.db_path = db_path
+        self.partitions = partitions or PricePartitions(db_path).load()
+        # CandleArchive или None — без выгрузки, старые дни просто удаляются
+        self.archive = archive
+        self.timeframes = {
+            tf: tf_ms for tf, tf_ms in (timeframes or TIMEFRAMES).items() if DAY_MS % tf_ms == 0
+        }
+        self.retention_days = retention_days
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0, "moved_rows": 0, "dropped_partitions": 0, "dropped_rows": 0,
+            "downsampled_bars": 0, "archived_partitions": 0, "archived_rows": 0, "errors": 0, "last_duration_ms": 0.0, "last_run_at": None,
+        }
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+        result["partitions"] = len(self.partitions.names())
+        result["retention_days"] = self.retention_days
+        return result
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] += value
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def run_once(self, now=None):
+        now = now or now_ms()
+        started = time.perf_counter()
+        self.partitions.premake(now)
+        moved = self.move_legacy()
+        if self.archive is not None:
+            self.export_closed(now)
+        dropped = self.drop_expired(now) if self.retention_days > 0 else 0
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_duration_ms"] = round(elapsed, 1)
+            self._stats["last_run_at"] = now_ms()
+        if moved or dropped:
+            print(f"🗜 Компакция: перенесено {moved} строк, удалено партиций {dropped} за {elapsed:.0f} ms", flush=True)
+
+    # Строки наследной prices → дневные партиции, пачками по id.
+    # Ждёт окончания миграции ts: без ts не понять, в какой день строка.
+    def move_legacy(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        c = conn.cursor()
+        moved = 0
+        try:
+            if not backfill_done(conn):
+                return 0
+            while True:
+                c.execute(f"SELECT id, {COLUMNS} FROM {LEGACY_TABLE} WHERE ts IS NOT NULL ORDER BY id LIMIT ?", (COMPACT_BATCH,))
+                rows = c.fetchall()
+                if not rows:
+                    break
+                by_day = {}
+                for row in rows:
+                    by_day.setdefault(partition_name(row[3]), []).append(row[1:])
+                with conn:
+                    for name, day_rows in by_day.items():
+                        create_partition(c, name)
+                        c.executemany(f"INSERT INTO {name} ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", day_rows)
+                    c.execute(f"DELETE FROM {LEGACY_TABLE} WHERE id <= ?", (rows[-1][0],))
+                for name in by_day:
+                    self.partitions.ensure(name)
+                moved += len(rows)
+                self._count(moved_rows=len(rows))
+                time.sleep(COMPACT_PAUSE)
+        finally:
+            conn.close()
+        return moved
+
+    # Закрытые дни → архив. День закрыт, когда после него прошло ещё
+    # ARCHIVE_AFTER_DAYS полных дней и дозаполнение его уже не тронет.
+    def export_closed(self, now):
+        today = now // DAY_MS * DAY_MS
+        done = self.archive.exported()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            for start, name in list_partitions(conn):
+                if start + DAY_MS * (1 + ARCHIVE_AFTER_DAYS) > today:
+                    break
+                if name in done:
+                    continue
+                written = self.archive.export_partition(conn, name, start)
+                self._count(archived_partitions=1, archived_rows=written)
+        finally:
+            conn.close()
+
+    # Истёкшие партиции: недостающие бары rollups из M1, затем DROP TABLE
+    def drop_expired(self, now):
+        cutoff = retention_cutoff(now, self.retention_days)
+        exported = self.archive.exported() if self.archive is not None else None
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        c = conn.cursor()
+        init_rollup_table(c)
+        dropped = 0
+        try:
+            for start, name in list_partitions(conn):
+                if start + DAY_MS > cutoff:
+                    break
+                if exported is not None and name not in exported:
+                    continue  # ещё не в архиве — удалим после выгрузки
+                c.execute(f"SELECT symbol, ts, open, high, low, close FROM {name} ORDER BY symbol, ts")
+                by_symbol = {}
+                for symbol, *row in c.fetchall():
+                    by_symbol.setdefault(symbol, []).append(row)
+                bars = [
+                    (symbol, tf, *bar)
+                    for symbol, rows in by_symbol.items()
+                    for tf, tf_ms in self.timeframes.items()
+                    for bar in aggregate(rows, tf_ms)
+                ]
+                with conn:
+                    c.executemany(ROLLUP_INSERT_MISSING, bars)
+                    added = c.rowcount
+                    c.execute(f"DROP TABLE {name}")
+                self.partitions.forget(name)
+                dropped += 1
+                self._count(
+                    dropped_partitions=1,
+                    dropped_rows=sum(map(len, by_symbol.values())),
+                    downsampled_bars=max(added, 0),
+                )
+        finally:
+            conn.close()
+        return dropped
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self._count(errors=1)
+                print("❌ Ошибка компакции:", e, flush=True)
+            time.sleep(self.interval)
@@ -0,0 +1,185 @@
+# === Агрегация M1 → 5m / 15m / 1h / 4h по мере поступления свечей ===
+#
+# Текущий (незакрытый) бар каждого таймфрейма живёт в CandleStore: новая M1-свеча
+# либо дополняет последний бар (max/min/close), либо открывает новый.
+# Пересчитывать всю историю при запросе больше не нужно.
+
+import sqlite3
+import threading
+
+from candle_store import CandleStore
+from partitions import last_before, read_range
+
+MINUTE_MS = 60 * 1000
+
+# Таймфреймы старше M1: название → длительность в мс
+TIMEFRAMES = {
+    "5m": 5 * MINUTE_MS,
+    "15m": 15 * MINUTE_MS,
+    "1h": 60 * MINUTE_MS,
+    "4h": 240 * MINUTE_MS,
+}
+
+
+# Начало интервала, к которому относится время ts_ms
+def bucket_start(ts_ms, tf_ms):
+    return ts_ms - ts_ms % tf_ms
+
+
+# Разовая агрегация готового ряда M1 в бары таймфрейма (для прогрева)
+def aggregate(rows, tf_ms):
+    bars = []
+    for ts, o, h, l, c in rows:
+        start = bucket_start(ts, tf_ms)
+        if bars and bars[-1][0] == start:
+            b = bars[-1]
+            if h > b[2]:
+                b[2] = h
+            if l < b[3]:
+                b[3] = l
+            b[4] = c
+        else:
+            bars.append([start, o, h, l, c])
+    return [tuple(b) for b in bars]
+
+
+# Таблица баров старших таймфреймов в SQLite
+def init_rollup_table(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS rollups (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            PRIMARY KEY (symbol, interval, timestamp)
+        ) WITHOUT ROWID
+    """)
+
+
+# Последние `count` баров таймфрейма прямо из M1 в SQLite, без кэша в памяти.
+# Обратный проход по индексу (symbol, ts): читаются только M1-свечи последних
+# `count` интервалов, границы окна кратны tf_ms, поэтому бары не режутся.
+# На пропуске в истории — переход к предыдущей свече через MAX(ts) по индексу.
+# Стоимость зависит от `count`, а не от длины истории символа.
+# Строки без ts (миграция не закончена) не видны.
+def tail_bars(conn, symbol, tf_ms, count):
+    bars = []
+    upper = None
+    while len(bars) < count:
+        last = last_before(conn, symbol, upper)
+        if last is None:
+            break
+        upper = bucket_start(last, tf_ms) + tf_ms
+        lower = upper - (count - len(bars)) * tf_ms
+        bars = aggregate(read_range(conn, symbol, lower, upper), tf_ms) + bars
+        upper = lower
+    return bars[-count:] if count > 0 else []
+
+
+ROLLUP_UPSERT = "INSERT OR REPLACE INTO rollups (symbol, interval, timestamp, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+
+# Строки для ROLLUP_UPSERT из событий Rollups.update (текущие и закрытые бары)
+def rollup_rows(symbol, events):
+    return [(symbol.lower(), tf, *bar) for tf, bar, closed, complete in events]
+
+
+class Rollups:
+    def __init__(self, timeframes=None, retention=None):
+        self.timeframes = dict(timeframes or TIMEFRAMES)
+        self.stores = {
+            tf: CandleStore(retention) if retention else CandleStore()
+            for tf in self.timeframes
+        }
+        # (symbol, tf) → [начало бара, сколько M1 в нём, закрыт ли уже]
+        self._state = {}
+        self._lock = threading.Lock()
+
+    # Обновление всех таймфреймов одной закрытой M1-свечой.
+    # Возвращает список (tf, bar, closed, complete):
+    #   bar      — (ts, open, high, low, close) текущего бара после обновления
+    #              или только что закрытого бара;
+    #   closed   — бар закрыт (набраны все минуты или начался следующий интервал);
+    #   complete — в закрытом баре есть все M1-свечи интервала.
+    def update(self, symbol, ts, o, h, l, c):
+        symbol = symbol.lower()
+        ts, o, h, l, c = int(ts), float(o), float(h), float(l), float(c)
+        events = []
+        with self._lock:
+            for tf, tf_ms in self.timeframes.items():
+                store = self.stores[tf]
+                start = bucket_start(ts, tf_ms)
+                key = (symbol, tf)
+                state = self._state.get(key)
+                last = store.rows(symbol, limit=1)
+                last = last[0] if last else None
+
+                if last and start < last[0]:
+                    # опоздавшая свеча — дополняем уже сохранённый бар без закрытий
+                    old = store.rows(symbol, since=start)
+                    if old and old[0][0] == start:
+                        old = old[0]
+                        bar = (start, old[1], max(old[2], h), min(old[3], l), old[4])
+                    else:
+                        bar = (start, o, h, l, c)
+                    store.append(symbol, *bar)
+                    events.append((tf, bar, False, False))
+                    continue
+
+                if last and last[0] == start:
+                    bar = (start, last[1], max(last[2], h), min(last[3], l), c)
+                    count = (state[1] if state and state[0] == start else 0) + 1
+                else:
+                    # новый интервал — предыдущий бар закрывается, если ещё не был
+                    if last and last[0] < start and not (state and state[0] == last[0] and state[2]):
+                        prev_count = state[1] if state and state[0] == last[0] else 0
+                        events.append((tf, last, True, prev_count * MINUTE_MS >= tf_ms))
+                    bar = (start, o, h, l, c)
+                    count = 1
+
+                store.append(symbol, *bar)
+                complete = count * MINUTE_MS >= tf_ms
+                self._state[key] = [start, count, complete]
+                events.append((tf, bar, complete, complete))
+        return events
+
+    # Бары таймфрейма в формате CandleStore.rows
+    def rows(self, tf, symbol, since=None, limit=None, pad=0):
+        return self.stores[tf].rows(symbol, since=since, limit=limit, pad=pad)
+
+    def version(self, tf, symbol):
+        return self.stores[tf].version(symbol)
+
+    # Прогрев из таблицы rollups. Символы, для которых баров ещё нет
+    # (первый запуск после обновления), агрегируются из M1-кэша и сохраняются.
+    def warm_from_sqlite(self, db_path, m1_store):
+        conn = sqlite3.connect(db_path)
+        c = conn.cursor()
+        init_rollup_table(c)
+        rebuilt = 0
+        for symbol in m1_store.symbols():
+            for tf, tf_ms in self.timeframes.items():
+                store = self.stores[tf]
+                c.execute(
+                    "SELECT timestamp, open, high, low, close FROM rollups WHERE symbol = ? AND interval = ? ORDER BY timestamp DESC LIMIT ?",
+                    (symbol, tf, store.retention)
+                )
+                bars = c.fetchall()[::-1]
+                if not bars:
+                    bars = aggregate(m1_store.rows(symbol), tf_ms)
+                    c.executemany(ROLLUP_UPSERT, [(symbol, tf, *bar) for bar in bars])
+                    rebuilt += len(bars)
+                store.load(symbol, bars)
+        conn.commit()
+        conn.close()
+        print(f"🧮 Таймфреймы {', '.join(self.timeframes)} прогреты, пересобрано баров: {rebuilt}")
+
+    def drop(self, symbol):
+        symbol = symbol.lower()
+        with self._lock:
+            for tf, store in self.stores.items():
+                store.drop(symbol)
+                self._state.pop((symbol, tf), None)
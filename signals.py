@@ -0,0 +1,73 @@
+# === Сигналы на свечах: раскладка по интервалам и приоритет ORDER/ZONE ===
+#
+# Сигналы раскладываются по началу своего интервала один раз (порядок внутри
+# корзины — как в выборке), дальше на свечу — один поиск в словаре:
+#
+#     signal_rows = read_signals(conn, "btcusdt")
+#     buckets = bucket_signals(signal_rows, 5)
+#     orders, zones = buckets.get(candle_start, ((), ()))
+#     signal_text, signal_type = candle_signal(orders, zones)
+
+from datetime import datetime, timedelta
+
+from candle_store import ms_to_dt
+
+SIGNALS_EPOCH = datetime(1970, 1, 1)
+
+
+# Время сигнала: ts (epoch ms) после миграции, иначе исходная ISO-строка;
+# None, если время не прочитать (миграция оставляет такие строки без ts)
+def signal_time(ts_str, ts):
+    if ts is not None:
+        return ms_to_dt(ts)
+    try:
+        return datetime.fromisoformat(ts_str)
+    except (TypeError, ValueError):
+        return None
+
+
+# [(время, ACTION)] сигналов символа в порядке поступления. ORDER BY id
+# обязателен: без него SQLite идёт по idx_signals_symbol_ts и отдаёт строки
+# в порядке (ts, action), а от порядка внутри свечи зависит приоритет.
+def read_signals(conn, symbol):
+    c = conn.cursor()
+    c.execute("SELECT timestamp, ts, action FROM signals WHERE symbol = ? ORDER BY id", (symbol.upper(),))
+    rows = [(signal_time(ts_str, ts), action.upper()) for ts_str, ts, action in c.fetchall()]
+    return [(st, action) for st, action in rows if st is not None]
+
+
+# Начало интервала (кратно group_minutes от эпохи — так же выровнены бары rollups)
+def bucket_key(st, group_minutes):
+    step = timedelta(minutes=group_minutes)
+    return SIGNALS_EPOCH + (st - SIGNALS_EPOCH) // step * step
+
+
+# {начало интервала: (orders, zones)}, где orders/zones — списки (время, действие)
+def bucket_signals(signal_rows, group_minutes):
+    buckets = {}
+    for st, act in signal_rows:
+        if "ORDER" in act:
+            kind = 0
+        elif "ZONE" in act:
+            kind = 1
+        else:
+            continue
+        buckets.setdefault(bucket_key(st, group_minutes), ([], []))[kind].append((st, act))
+    return buckets
+
+
+# Приоритет ORDER/ZONE внутри одной свечи → (signal_text, signal_type)
+def candle_signal(orders, zones):
+    signal_text = ""
+    signal_type = ""
+
+    if orders and (not zones or orders[0][0] < zones[0][0]):
+        signal_text = orders[0][1] + " (-)"
+    elif zones and (not orders or zones[0][0] < orders[0][0]):
+        signal_text = orders[0][1] if orders else ""
+        signal_type = zones[-1][1]
+    elif zones and orders:
+        signal_text = orders[0][1] + " (-)"
+        signal_type = zones[-1][1]
+
+    return signal_text, signal_type
@@ -0,0 +1,202 @@
+# === Единственный писатель SQLite: очередь + пакетные транзакции ===
+#
+# Потоки приёма данных не открывают соединение на каждую свечу, а кладут
+# (sql, params) в ограниченную очередь. Поток-писатель собирает пачку по размеру
+# или по времени и пишет её одной транзакцией через executemany (WAL-режим).
+#
+# put() не ждёт места в очереди: его вызывают из цикла событий потока Binance,
+# и медленный диск не должен останавливать чтение сокета. При переполнении
+# строка отбрасывается и считается в stats()["dropped"]. Пачка, не записанная
+# из-за ошибки, повторяется на новом соединении по видам запросов — каждый своей
+# транзакцией, а не прошедший вид — построчно: одна плохая строка (INSERT в
+# только что удалённую партицию) не уносит свечи и цены остальных символов.
+# Строки, не записанные и построчно, считаются в stats()["failed_rows"].
+
+import queue
+import sqlite3
+import threading
+import time
+
+# Пачка сбрасывается, когда набралось столько строк...
+WRITER_BATCH_SIZE = 1000
+# ...или прошло столько секунд с первой строки в пачке
+WRITER_MAX_DELAY = 0.5
+WRITER_QUEUE_SIZE = 50000
+
+
+# Соединение в WAL: читатели не блокируют писателя и наоборот
+def connect_wal(db_path, timeout=30):
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteWriter:
+    def __init__(self, db_path, batch_size=WRITER_BATCH_SIZE, max_delay=WRITER_MAX_DELAY,
+                 queue_size=WRITER_QUEUE_SIZE, on_flush=None, prepare=None):
+        self.db_path = db_path
+        # prepare(conn, sqls) — перед транзакцией пачки, в потоке писателя
+        # (DDL для новых дневных партиций, см. PricePartitions.prepare)
+        self.prepare = prepare
+        # on_flush(batch) — после фиксации транзакции (замеры задержки в bench.py)
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "rows_written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "failed_rows": 0,
+            "errors": 0,
+            "last_batch_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "avg_flush_ms": 0.0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    # Поставить одну строку в очередь на запись (без ожидания)
+    def put(self, sql, params):
+        try:
+            self._queue.put_nowait((sql, params))
+        except queue.Full:
+            self._drop(1)
+
+    def _drop(self, rows):
+        with self._lock:
+            before = self._stats["dropped"]
+            self._stats["dropped"] += rows
+        # не чаще раза на тысячу строк — переполнение не должно забивать лог
+        if before // 1000 != (before + rows) // 1000 or before == 0:
+            print(f"⚠️ Очередь записи SQLite переполнена, отброшено строк: {before + rows}")
+
+    def put_many(self, sql, rows):
+        for params in rows:
+            self.put(sql, params)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+        result["queue_depth"] = self._queue.qsize()
+        return result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # {sql: [params]} — один executemany на каждый вид запроса;
+    # порядок строк внутри вида сохраняется
+    def _groups(self, batch):
+        groups = {}
+        for sql, params in batch:
+            groups.setdefault(sql, []).append(params)
+        return groups
+
+    def _flush(self, conn, batch):
+        groups = self._groups(batch)
+        if self.prepare is not None:
+            self.prepare(conn, groups)
+        started = time.perf_counter()
+        with conn:
+            for sql, rows in groups.items():
+                conn.executemany(sql, rows)
+        self._written(batch, started)
+
+    # Повтор пачки после ошибки: вид запроса — отдельной транзакцией,
+    # не прошедший вид — по строке
+    def _flush_split(self, conn, batch):
+        groups = self._groups(batch)
+        if self.prepare is not None:
+            try:
+                self.prepare(conn, groups)
+            except Exception as e:
+                self._error("подготовка пачки", e)
+
+        started = time.perf_counter()
+        written = []
+        failed = 0
+        for sql, rows in groups.items():
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+                written.extend((sql, params) for params in rows)
+                continue
+            except Exception as e:
+                self._error(f"{len(rows)} строк «{sql[:60]}»", e)
+            lost = 0
+            for params in rows:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                    written.append((sql, params))
+                except Exception:
+                    lost += 1
+            if lost:
+                print(f"❌ SQLite: не записано {lost} из {len(rows)} строк «{sql[:60]}»")
+            failed += lost
+
+        with self._lock:
+            self._stats["failed_rows"] += failed
+        if written:
+            self._written(written, started)
+
+    def _written(self, batch, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            s = self._stats
+            s["batches"] += 1
+            s["rows_written"] += len(batch)
+            s["last_batch_rows"] = len(batch)
+            s["last_flush_ms"] = round(elapsed, 2)
+            s["max_flush_ms"] = round(max(s["max_flush_ms"], elapsed), 2)
+            s["avg_flush_ms"] = round(s["avg_flush_ms"] + (elapsed - s["avg_flush_ms"]) / s["batches"], 2)
+
+        if self.on_flush is not None:
+            self.on_flush(batch)
+
+    def _error(self, what, e):
+        with self._lock:
+            self._stats["errors"] += 1
+        print(f"❌ Ошибка пакетной записи SQLite ({what}):", e)
+
+    # Новое соединение вместо сломанного; пока SQLite недоступен — ждём
+    def _reconnect(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        while True:
+            try:
+                return connect_wal(self.db_path)
+            except Exception as e:
+                print("❌ Не удалось переподключиться к SQLite:", e)
+                time.sleep(1)
+
+    def _run(self):
+        conn = connect_wal(self.db_path)
+        while True:
+            batch = self._collect()
+            try:
+                self._flush(conn, batch)
+            except Exception as e:
+                self._error(f"{len(batch)} строк", e)
+                conn = self._reconnect(conn)
+                self._flush_split(conn, batch)
@@ -0,0 +1,5 @@
+# Модули приложения лежат в корне репозитория, без пакета
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from archive import CandleArchive
+
+
+def write(archive, symbol, n=10):
+    ts = np.arange(n, dtype="<i8") * 60_000
+    prices = np.arange(n, dtype="<f8")
+    archive.append(symbol, 0, ts, prices, prices + 1, prices - 1, prices)
+
+
+@pytest.mark.parametrize("symbol", ["../etc", "btc/usdt", "..", ""])
+def test_rejects_path_like_symbols(tmp_path, symbol):
+    with pytest.raises(ValueError):
+        CandleArchive(str(tmp_path)).open(symbol)
+
+
+def test_open_cache_is_bounded_lru(tmp_path):
+    archive = CandleArchive(str(tmp_path), max_open=2)
+    for symbol in ("aaa", "bbb", "ccc"):
+        write(archive, symbol)
+
+    a = archive.open("aaa")
+    view = a.range(0, 5 * 60_000)  # срез, отданный читателю до вытеснения
+    archive.open("bbb")
+    assert archive.open("aaa") is a  # недавно прочитан — остаётся
+    archive.open("ccc")  # вытесняет bbb
+    assert list(archive._open) == ["aaa", "ccc"]
+
+    archive.open("bbb")  # вытесняет aaa
+    assert list(archive._open) == ["ccc", "bbb"]
+    assert len(a) == 0
+    assert view.close.tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]  # отданные срезы остаются читаемыми
+    assert len(archive.open("aaa")) == 10
@@ -0,0 +1,82 @@
+import pytest
+
+import backfill
+from backfill import KLINES_LIMIT, MINUTE_MS, GapFiller, MockKlinesServer
+
+# open_time текущей (незакрытой) минуты
+NOW = 1_700_000_000_000 // MINUTE_MS * MINUTE_MS
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [NOW + 30_000]  # середина минуты
+    monkeypatch.setattr(backfill, "now_ms", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def server():
+    server = MockKlinesServer().start_in_thread()
+    yield server
+    server.stop()
+
+
+def filler_for(last, **kwargs):
+    return GapFiller(last_open_time=last.get, on_candles=lambda symbol, rows: None, **kwargs)
+
+
+def test_plan_caps_depth_at_max_minutes():
+    filler = filler_for({"btcusdt": NOW - 5 * 24 * 60 * MINUTE_MS}, max_minutes=60)
+    assert filler._plan(["btcusdt"], NOW, {}) == [("btcusdt", NOW - 60 * MINUTE_MS, NOW - 1)]
+
+
+def test_plan_chunks_by_klines_limit():
+    gap = 2 * KLINES_LIMIT + 100
+    filler = filler_for({"btcusdt": NOW - (gap + 1) * MINUTE_MS}, max_minutes=10_000)
+    plan = filler._plan(["btcusdt"], NOW, {})
+    assert [(end + 1 - start) // MINUTE_MS for _s, start, end in plan] == [KLINES_LIMIT, KLINES_LIMIT, 100]
+    assert plan[0][1] == NOW - gap * MINUTE_MS
+    assert all(a[2] + 1 == b[1] for a, b in zip(plan, plan[1:]))  # без дыр и перекрытий
+    assert plan[-1][2] == NOW - 1
+
+
+def test_plan_skips_stored_and_already_filled_minutes():
+    filler = filler_for({"btcusdt": NOW - 10 * MINUTE_MS, "ethusdt": NOW - MINUTE_MS, "solusdt": None})
+    plan = filler._plan(["btcusdt", "ethusdt", "solusdt"], NOW, {})
+    assert plan == [("btcusdt", NOW - 9 * MINUTE_MS, NOW - 1)]  # ethusdt актуален, у solusdt нет истории
+    # отданное в этом же запуске, но ещё не записанное — не запрашивается снова
+    assert filler._plan(["btcusdt"], NOW, {"btcusdt": NOW - 3 * MINUTE_MS}) == [("btcusdt", NOW - 2 * MINUTE_MS, NOW - 1)]
+
+
+def test_fill_from_mock_server(clock, server):
+    gap = KLINES_LIMIT + 200
+    stored = {"btcusdt": NOW - (gap + 1) * MINUTE_MS, "ethusdt": NOW - 5 * MINUTE_MS}
+    received = {}
+    filler = GapFiller(last_open_time=stored.get, rest_url=server.url, max_minutes=10_000,
+                       on_candles=lambda symbol, rows: received.setdefault(symbol, []).extend(rows))
+
+    assert filler.fill(["btcusdt", "ethusdt"]) == gap + 4
+    times = [row[0] for row in received["btcusdt"]]
+    assert times == list(range(NOW - gap * MINUTE_MS, NOW, MINUTE_MS))
+    assert [row[0] for row in received["ethusdt"]] == list(range(NOW - 4 * MINUTE_MS, NOW, MINUTE_MS))
+    assert server.requests == 3
+    assert filler.stats()["errors"] == 0
+
+
+# Минута закрылась, пока шло дозаполнение: второй проход берёт только её
+def test_fill_reruns_for_minute_closed_during_fill(clock, server):
+    stored = {"btcusdt": NOW - 5 * MINUTE_MS}
+    batches = []
+
+    def on_candles(symbol, rows):
+        batches.append([row[0] for row in rows])
+        if len(batches) == 1:
+            clock[0] += MINUTE_MS
+
+    filler = GapFiller(last_open_time=stored.get, on_candles=on_candles, rest_url=server.url)
+    assert filler.fill(["btcusdt"]) == 5
+    assert batches == [
+        list(range(NOW - 4 * MINUTE_MS, NOW, MINUTE_MS)),
+        [NOW],
+    ]
+    assert server.requests == 2
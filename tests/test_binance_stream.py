@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+from binance_stream import BinanceStreamClient
+
+
+class FlakyDecoder:
+    name = "flaky"
+
+    def decode(self, raw):
+        if raw == "boom":
+            raise AttributeError("'list' object has no attribute 'get'")
+        return "kline", raw
+
+
+def test_dispatcher_survives_unexpected_errors():
+    client = BinanceStreamClient(decoder=FlakyDecoder())
+    seen = []
+    client.on("kline", seen.append)
+
+    async def scenario():
+        client._queue = asyncio.Queue()
+        for raw in ("a", "boom", "b"):
+            client._queue.put_nowait(raw)
+        task = asyncio.ensure_future(client._dispatcher())
+        for _ in range(100):
+            await asyncio.sleep(0)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert seen == ["a", "b"]
+    assert client.stats["dispatch_errors"] == 1
+
+
+def test_refresh_during_reload_is_not_lost():
+    symbols = ["btcusdt"]
+    calls = []
+
+    def provider():
+        calls.append(list(symbols))
+        if len(calls) == 1:
+            symbols.append("ethusdt")  # символ добавлен, пока идёт первое чтение
+            client.refresh()
+            handled = threading.Event()  # refresh уже обработан в loop
+            client._loop.call_soon_threadsafe(handled.set)
+            handled.wait(1)
+        return [f"{s}@kline_1m" for s in calls[-1]]
+
+    client = BinanceStreamClient(streams_provider=provider)
+    applied = []
+    client._apply_streams = applied.append
+
+    async def scenario():
+        client._loop = asyncio.get_running_loop()
+        client._on_reconnect()
+        for _ in range(200):
+            await asyncio.sleep(0.005)
+            if len(applied) == 2 and not client._reload_pending:
+                break
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert applied[-1] == {"btcusdt@kline_1m", "ethusdt@kline_1m"}
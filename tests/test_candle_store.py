@@ -0,0 +1,44 @@
+import sqlite3
+from datetime import datetime, timezone
+
+from candle_store import CandleStore
+from migrations import TS_FROM_TEXT, migrate
+
+BASE = 1_700_000_040_000 // 60_000 * 60_000
+
+
+def iso(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+# Наследная БД до миграции: prices без ts
+def legacy_db(tmp_path, minutes):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE symbols (name TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, action TEXT, timestamp TEXT)")
+    conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, open REAL, high REAL, low REAL, close REAL)")
+    conn.execute("INSERT INTO symbols VALUES ('btcusdt')")
+    conn.executemany(
+        "INSERT INTO prices (symbol, timestamp, open, high, low, close) VALUES ('btcusdt', ?, ?, ?, ?, ?)",
+        [(iso(BASE + m * 60_000), m, m + 1, m - 1, m) for m in range(minutes)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_warm_from_partly_migrated_legacy_table(tmp_path):
+    path = legacy_db(tmp_path, 10)
+    migrate(path)
+    conn = sqlite3.connect(path)
+    # фоновая миграция успела заполнить ts только у первых строк
+    conn.execute(f"UPDATE prices SET ts = {TS_FROM_TEXT} WHERE id <= 4")
+    conn.commit()
+    conn.close()
+
+    store = CandleStore(retention=100)
+    store.warm_from_sqlite(path)
+    rows = store.rows("btcusdt")
+    assert [row[0] for row in rows] == [BASE + m * 60_000 for m in range(10)]
+    assert [row[4] for row in rows] == [float(m) for m in range(10)]
@@ -0,0 +1,31 @@
+import pytest
+
+from decoder import available_decoders, make_decoder
+
+TRADE = b'{"stream":"btcusdt@trade","data":{"e":"trade","E":1,"T":2,"s":"BTCUSDT","p":"65000.5","q":"0.1"}}'
+
+
+@pytest.fixture(params=available_decoders())
+def decoder(request):
+    return make_decoder(request.param)
+
+
+def test_trade(decoder):
+    kind, event = decoder.decode(TRADE)
+    assert kind == "trade"
+    assert (event.symbol, event.price, event.quantity, event.event_ms, event.trade_ms) == ("BTCUSDT", 65000.5, 0.1, 1, 2)
+
+
+@pytest.mark.parametrize("raw", [b'{"result":null,"id":1}', b'[1,2]', b'"text"', b'{"stream":"x"}'])
+def test_service_and_non_object_frames(decoder, raw):
+    assert decoder.decode(raw) is None
+
+
+@pytest.mark.parametrize("raw", [b'{"data":[1]}', b'{"data":"x"}', b'{"data":{"e":"trade","s":"BTCUSDT"}}', b'not json'])
+def test_malformed_frames_raise_value_error(decoder, raw):
+    with pytest.raises(ValueError):
+        decoder.decode(raw)
+
+
+def test_unknown_event_passed_as_dict(decoder):
+    assert decoder.decode(b'{"data":{"e":"depthUpdate","s":"BTCUSDT"}}') == ("depthUpdate", {"e": "depthUpdate", "s": "BTCUSDT"})
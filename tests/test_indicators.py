@@ -0,0 +1,139 @@
+# Паритет indicators.py с исходными формулами канала из app.py (до переноса в NumPy):
+# канал на каждую свечу из /api/candles и live-канал из /api/live-channel.
+
+import random
+from math import atan, degrees, sqrt
+
+import pytest
+
+import indicators
+from indicators import live_channel, regression_bands
+
+
+# Исходный расчёт /api/candles: окно растёт до length, граница — по последней точке
+def reference_bands(closes, length, deviation):
+    result = []
+    for i in range(len(closes)):
+        window = closes[max(0, i - length + 1): i + 1]
+        avg_x = sum(range(len(window))) / len(window)
+        avg_y = sum(window) / len(window)
+        cov_xy = sum((j - avg_x) * (y - avg_y) for j, y in enumerate(window))
+        var_x = sum((j - avg_x) ** 2 for j in range(len(window)))
+        slope = cov_xy / var_x if var_x else 0
+        intercept = avg_y - slope * avg_x
+        expected = [intercept + slope * j for j in range(len(window))]
+        std = (sum((window[j] - expected[j]) ** 2 for j in range(len(window))) / len(window)) ** 0.5
+        mid = expected[-1]
+        result.append((mid - deviation * std, mid, mid + deviation * std))
+    return result
+
+
+# Исходный расчёт /api/live-channel: length - 1 закрытий + текущая цена
+def reference_live(closes, current_price, length, deviation):
+    closes = list(closes[-(length - 1):]) + [current_price]
+    x = list(range(length))
+    avg_x = sum(x) / length
+    mid = sum(closes) / length
+    slope = sum((x[i] - avg_x) * (closes[i] - mid) for i in range(length)) / sum((x[i] - avg_x) ** 2 for i in range(length))
+    intercept = mid - slope * avg_x
+    std = sqrt(sum((closes[i] - (slope * i + intercept)) ** 2 for i in range(length)) / length)
+    center = (intercept + intercept + slope * (length - 1)) / 2
+    upper = center + deviation * std
+    lower = center - deviation * std
+
+    base = closes[0] if closes[0] != 0 else 1
+    norm = [c / base for c in closes]
+    norm_mid = sum(norm) / length
+    norm_slope = sum((x[i] - avg_x) * (norm[i] - norm_mid) for i in range(length)) / sum((x[i] - avg_x) ** 2 for i in range(length))
+    return {
+        "center": center,
+        "upper": upper,
+        "lower": lower,
+        "width_percent": round((upper - lower) / center * 100, 2),
+        "angle": round(degrees(atan(norm_slope)), 2),
+    }
+
+
+def random_walk(n, seed=1, start=100.0):
+    rnd = random.Random(seed)
+    closes = [start]
+    for _ in range(n - 1):
+        closes.append(closes[-1] * (1 + rnd.gauss(0, 0.002)))
+    return closes
+
+
+def assert_bands(closes, length, deviation):
+    lower, mid, upper = regression_bands(closes, length, deviation)
+    expected = reference_bands(closes, length, deviation)
+    assert len(mid) == len(expected)
+    for i, (lo, m, up) in enumerate(expected):
+        assert lower[i] == pytest.approx(lo, rel=1e-9, abs=1e-9)
+        assert mid[i] == pytest.approx(m, rel=1e-9, abs=1e-9)
+        assert upper[i] == pytest.approx(up, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("length", [1, 2, 20, 50])
+def test_bands_match_per_candle_formula(length):
+    assert_bands(random_walk(300), length, 2.0)
+
+
+def test_bands_length_longer_than_series():
+    closes = random_walk(12, seed=7)
+    assert_bands(closes, 50, 2.0)
+
+
+def test_bands_constant_series():
+    closes = [42.5] * 80
+    assert_bands(closes, 50, 2.0)
+    lower, mid, upper = regression_bands(closes, 50, 2.0)
+    assert list(lower) == list(mid) == list(upper) == [42.5] * 80
+
+
+def test_bands_empty():
+    lower, mid, upper = regression_bands([], 50, 2.0)
+    assert len(lower) == len(mid) == len(upper) == 0
+
+
+# 5-значное представление, как в поле "channel" ответа /api/candles
+def test_bands_channel_strings_identical():
+    closes = random_walk(500, seed=3)
+    lower, mid, upper = regression_bands(closes, 50, 2.0)
+    got = [f"{lo:.5f} / {m:.5f} / {up:.5f}" for lo, m, up in zip(lower, mid, upper)]
+    want = [f"{lo:.5f} / {m:.5f} / {up:.5f}" for lo, m, up in reference_bands(closes, 50, 2.0)]
+    assert got == want
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_live_channel_matches_formula(seed):
+    closes = random_walk(120, seed=seed)
+    current = closes[-1] * 1.001
+    got = live_channel(closes, current, 50, 2.0)
+    want = reference_live(closes, current, 50, 2.0)
+    for key in ("center", "upper", "lower"):
+        assert got[key] == pytest.approx(want[key], rel=1e-9)
+    assert got["width_percent"] == want["width_percent"]
+    assert got["angle"] == want["angle"]
+
+
+def test_live_channel_constant_series():
+    got = live_channel([10.0] * 60, 10.0, 50, 2.0)
+    assert got["center"] == got["upper"] == got["lower"] == 10.0
+    assert got["width_percent"] == 0
+    assert got["angle"] == 0
+
+
+# Блоки накопленных сумм: окна на стыке блоков берут хвост предыдущего
+@pytest.mark.parametrize("length", [2, 50, 130])
+def test_bands_across_blocks(monkeypatch, length):
+    monkeypatch.setattr(indicators, "BANDS_BLOCK", 64)
+    assert_bands(random_walk(1000, seed=5), length, 2.0)
+
+
+# Длинный ряд с ценами уровня BTC: ошибка округления не копится по ряду
+def test_bands_long_series_at_btc_prices():
+    closes = random_walk(10_000, seed=11, start=30_000.0)
+    lower, mid, upper = regression_bands(closes, 50, 2.0)
+    for i, (lo, m, up) in enumerate(reference_bands(closes, 50, 2.0)):
+        assert lower[i] == pytest.approx(lo, rel=1e-12)
+        assert mid[i] == pytest.approx(m, rel=1e-12)
+        assert upper[i] == pytest.approx(up, rel=1e-12)
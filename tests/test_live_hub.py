@@ -0,0 +1,36 @@
+import threading
+
+from live_hub import LiveHub
+
+
+def test_deferred_event_built_in_hub_thread():
+    hub = LiveHub(compute=lambda symbol: {"symbol": symbol})
+    q = hub.subscribe("BTCUSDT")
+    hub._dirty.clear()
+    built_in = []
+
+    def build():
+        built_in.append(threading.current_thread())
+        return {"time": "2024-01-01 00:05"}
+
+    hub.defer("btcusdt", "candle", build)
+    hub.defer("ethusdt", "candle", build)  # без подписчиков — не строится
+    hub.defer("btcusdt", "candle", lambda: None)
+    assert not built_in  # defer только ставит в очередь
+
+    with hub._lock:
+        jobs, hub._deferred = hub._deferred, []
+    worker = threading.Thread(target=hub._run_deferred, args=(jobs,))
+    worker.start()
+    worker.join()
+
+    assert built_in == [worker]
+    assert q.get_nowait() == ("candle", {"time": "2024-01-01 00:05"})
+    assert q.empty()
+
+
+def test_deferred_build_error_does_not_stop_others():
+    hub = LiveHub(compute=lambda symbol: {})
+    q = hub.subscribe("btcusdt")
+    hub._run_deferred([("btcusdt", "candle", lambda: 1 / 0), ("btcusdt", "candle", lambda: {"ok": 1})])
+    assert q.get_nowait() == ("candle", {"ok": 1})
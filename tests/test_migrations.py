@@ -0,0 +1,45 @@
+import sqlite3
+
+import migrations
+from migrations import backfill_done, migrate, run_backfill
+from partitions import read_tail
+from signals import read_signals
+
+
+def legacy_db(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, action TEXT, timestamp TEXT)")
+    conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, open REAL, high REAL, low REAL, close REAL)")
+    conn.executemany(
+        "INSERT INTO prices (symbol, timestamp, open, high, low, close) VALUES ('btcusdt', ?, 1, 1, 1, ?)",
+        [("2024-03-01T10:00:00", 1.0), ("мусор", 2.0), ("2024-03-01 10:01:00", 3.0), (None, 4.0)]
+    )
+    conn.executemany(
+        "INSERT INTO signals (symbol, action, timestamp) VALUES ('BTCUSDT', ?, ?)",
+        [("BUYORDER", "2024-03-01T10:00:30"), ("SELLZONE", "не время")]
+    )
+    conn.commit()
+    conn.close()
+    migrate(path)
+    return path
+
+
+# Нечитаемый timestamp не превращается в свечу/сигнал 1970 года
+def test_backfill_leaves_no_epoch_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "BACKFILL_BATCH", 2)
+    monkeypatch.setattr(migrations, "BACKFILL_PAUSE", 0)
+    path = legacy_db(tmp_path)
+    run_backfill(path)
+
+    conn = sqlite3.connect(path)
+    assert backfill_done(conn)
+    assert conn.execute("SELECT close, ts FROM prices ORDER BY id").fetchall() == [
+        (1.0, 1_709_287_200_000), (3.0, 1_709_287_260_000)
+    ]
+    assert conn.execute("SELECT action, ts FROM signals ORDER BY id").fetchall() == [
+        ("BUYORDER", 1_709_287_230_000), ("SELLZONE", None)
+    ]
+    assert [row[0] for row in read_tail(conn, "btcusdt", 10)] == [1_709_287_200_000, 1_709_287_260_000]
+    assert [action for _st, action in read_signals(conn, "btcusdt")] == ["BUYORDER"]
+    conn.close()
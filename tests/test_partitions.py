@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from partitions import DAY_MS, PricePartitions, list_partitions, partition_name, read_range
+from sqlite_writer import SQLiteWriter
+
+NOW = 1_700_000_000_000
+
+
+def tables(path):
+    conn = sqlite3.connect(path)
+    names = [name for _start, name in list_partitions(conn)]
+    conn.close()
+    return names
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_insert_sql_does_no_ddl_on_caller_thread(tmp_path):
+    path = str(tmp_path / "p.db")
+    partitions = PricePartitions(path).load()
+    partitions.premake(NOW)
+    before = tables(path)
+    old_day = NOW - 10 * DAY_MS
+    assert partition_name(old_day) in partitions.insert_sql(old_day)
+    assert tables(path) == before
+    assert partition_name(old_day) not in partitions.names()
+
+
+def test_writer_creates_missing_partition_before_batch(tmp_path):
+    path = str(tmp_path / "p.db")
+    partitions = PricePartitions(path).load()
+    partitions.premake(NOW)
+    writer = SQLiteWriter(path, max_delay=0.01, prepare=partitions.prepare).start()
+    old_day = NOW - 10 * DAY_MS
+    for ts in (old_day, old_day + 60_000, NOW):
+        writer.put(partitions.insert_sql(ts), ("btcusdt", "", ts, 1.0, 2.0, 0.5, 1.5))
+
+    assert wait_for(lambda: writer.stats()["rows_written"] == 3)
+    assert writer.stats()["errors"] == 0
+    assert partition_name(old_day) in partitions.names()
+    conn = sqlite3.connect(path)
+    assert [row[0] for row in read_range(conn, "btcusdt", old_day, NOW + 1)] == [old_day, old_day + 60_000, NOW]
+    conn.close()
@@ -0,0 +1,118 @@
+# Приоритет ORDER/ZONE на свече: раскладка по корзинам (signals.py) против
+# исходного вложенного прохода по всем сигналам на каждую свечу.
+
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from migrations import migrate
+from signals import bucket_signals, candle_signal, read_signals
+
+START = datetime(2024, 3, 1, 10, 0)
+
+
+# Исходный расчёт из /api/candles: сигналы интервала [key, key + group) в порядке выборки
+def reference_signal(signal_rows, key, group_minutes):
+    orders = []
+    zones = []
+    for st, act in signal_rows:
+        if key <= st < key + timedelta(minutes=group_minutes):
+            if "ORDER" in act:
+                orders.append((st, act))
+            elif "ZONE" in act:
+                zones.append((st, act))
+
+    signal_text = ""
+    signal_type = ""
+    if orders and (not zones or orders[0][0] < zones[0][0]):
+        signal_text = orders[0][1] + " (-)"
+    elif zones and (not orders or zones[0][0] < orders[0][0]):
+        signal_text = orders[0][1] if orders else ""
+        signal_type = zones[-1][1]
+    elif zones and orders:
+        signal_text = orders[0][1] + " (-)"
+        signal_type = zones[-1][1]
+    return signal_text or signal_type
+
+
+def bucketed_signal(signal_rows, key, group_minutes):
+    orders, zones = bucket_signals(signal_rows, group_minutes).get(key, ((), ()))
+    signal_text, signal_type = candle_signal(orders, zones)
+    return signal_text or signal_type
+
+
+def at(minutes, seconds=0):
+    return START + timedelta(minutes=minutes, seconds=seconds)
+
+
+CASES = {
+    "order_before_zone": [(at(1), "BUYORDER"), (at(2), "SELLZONE")],
+    "zone_before_order": [(at(1), "BUYZONE"), (at(3), "SELLORDER")],
+    "equal_timestamps": [(at(2), "BUYZONE"), (at(2), "BUYORDER")],
+    "several_zones_last_wins": [(at(0, 5), "BUYZONE"), (at(1), "SELLZONE"), (at(4, 30), "BUYZONE")],
+    "zones_only_then_order": [(at(1), "SELLZONE"), (at(2), "BUYZONE"), (at(3), "BUYORDER"), (at(4), "SELLORDER")],
+    "orders_only": [(at(3), "SELLORDER"), (at(1), "BUYORDER")],
+    "info_ignored": [(at(1), "BUY"), (at(2), "INFO")],
+}
+
+
+@pytest.mark.parametrize("group_minutes", [5, 15])
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_precedence_matches_nested_scan(name, group_minutes):
+    rows = CASES[name]
+    assert bucketed_signal(rows, START, group_minutes) == reference_signal(rows, START, group_minutes)
+
+
+def test_expected_precedence():
+    assert bucketed_signal(CASES["order_before_zone"], START, 5) == "BUYORDER (-)"
+    assert bucketed_signal(CASES["zone_before_order"], START, 5) == "SELLORDER"
+    assert bucketed_signal(CASES["equal_timestamps"], START, 5) == "BUYORDER (-)"
+    assert bucketed_signal(CASES["several_zones_last_wins"], START, 5) == "BUYZONE"
+    assert bucketed_signal(CASES["several_zones_last_wins"], START, 15) == "BUYZONE"
+    assert bucketed_signal(CASES["info_ignored"], START, 5) == ""
+
+
+# Сигнал на границе интервала относится к следующей свече
+def test_bucket_boundaries():
+    rows = [(at(4, 59), "BUYORDER"), (at(5), "SELLORDER")]
+    assert bucketed_signal(rows, START, 5) == "BUYORDER (-)"
+    assert bucketed_signal(rows, at(5), 5) == "SELLORDER (-)"
+    assert bucketed_signal(rows, START, 15) == "BUYORDER (-)"
+
+
+@pytest.mark.parametrize("group_minutes", [5, 15])
+def test_random_signals_match_nested_scan(group_minutes):
+    rnd = random.Random(group_minutes)
+    actions = ["BUYORDER", "SELLORDER", "BUYZONE", "SELLZONE", "BUY", "SELL"]
+    rows = [(at(rnd.randrange(600), rnd.randrange(60)), rnd.choice(actions)) for _ in range(800)]
+    for i in range(600 // group_minutes):
+        key = at(i * group_minutes)
+        assert bucketed_signal(rows, key, group_minutes) == reference_signal(rows, key, group_minutes)
+
+
+# Сигналы одной минуты из БД: после миграции выборка идёт по индексу
+# (symbol, ts, action), но порядок должен остаться порядком поступления
+def test_same_minute_signals_from_db_keep_insert_order(tmp_path):
+    path = str(tmp_path / "signals.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, action TEXT, timestamp TEXT)")
+    conn.execute("CREATE TABLE prices (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, timestamp TEXT, open REAL, high REAL, low REAL, close REAL)")
+    conn.commit()
+    migrate(path)
+    ts = int((at(1) - datetime(1970, 1, 1)).total_seconds() * 1000)
+    inserted = ["SELLZONE", "SELLORDER", "BUYZONE", "BUYORDER"]  # не по алфавиту
+    conn.executemany(
+        "INSERT INTO signals (symbol, action, timestamp, ts) VALUES ('BTCUSDT', ?, ?, ?)",
+        [(action, at(1).isoformat(), ts) for action in inserted]
+    )
+    conn.commit()
+
+    rows = read_signals(conn, "btcusdt")
+    conn.close()
+    assert [act for _st, act in rows] == inserted
+    for group_minutes in (5, 15):
+        assert bucketed_signal(rows, START, group_minutes) == "SELLORDER (-)"
+        orders, zones = bucket_signals(rows, group_minutes)[START]
+        assert zones[-1][1] == "BUYZONE"
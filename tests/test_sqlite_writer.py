@@ -0,0 +1,99 @@
+import sqlite3
+import time
+
+from sqlite_writer import SQLiteWriter
+
+INSERT = "INSERT INTO t (v) VALUES (?)"
+
+
+def make_db(tmp_path):
+    path = str(tmp_path / "w.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (v INTEGER)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count(path):
+    conn = sqlite3.connect(path)
+    n = conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    conn.close()
+    return n
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_full_queue_drops_without_blocking(tmp_path):
+    writer = SQLiteWriter(make_db(tmp_path), queue_size=3)  # не запущен — очередь не разбирается
+    started = time.perf_counter()
+    writer.put_many(INSERT, [(i,) for i in range(10)])
+    assert time.perf_counter() - started < 0.5
+    assert writer.stats()["dropped"] == 7
+    assert writer.stats()["queue_depth"] == 3
+
+
+def test_failed_batch_is_retried_once(tmp_path):
+    path = make_db(tmp_path)
+    writer = SQLiteWriter(path, max_delay=0.01)
+    flush = writer._flush
+    failures = []
+
+    def flaky(conn, batch):
+        if not failures:
+            failures.append(len(batch))
+            raise sqlite3.OperationalError("disk I/O error")
+        flush(conn, batch)
+
+    writer._flush = flaky
+    writer.put_many(INSERT, [(i,) for i in range(5)])
+    writer.start()
+    assert wait_for(lambda: writer.stats()["rows_written"] == 5)
+    assert count(path) == 5
+    stats = writer.stats()
+    assert stats["errors"] == 1 and stats["dropped"] == 0
+
+
+def test_failed_statement_is_counted_and_writer_keeps_going(tmp_path):
+    path = make_db(tmp_path)
+    writer = SQLiteWriter(path, max_delay=0.01)
+    writer.put_many("INSERT INTO missing (v) VALUES (?)", [(1,), (2,)])
+    writer.start()
+    assert wait_for(lambda: writer.stats()["failed_rows"] == 2)
+    assert writer.stats()["errors"] == 2 and writer.stats()["dropped"] == 0
+    writer.put(INSERT, (1,))
+    assert wait_for(lambda: count(path) == 1)
+
+
+# Плохой вид запроса в пачке не уносит строки других видов
+def test_bad_statement_does_not_lose_other_rows(tmp_path):
+    path = make_db(tmp_path)
+    writer = SQLiteWriter(path, max_delay=0.5)
+    writer.put(INSERT, (1,))
+    writer.put("INSERT INTO missing (v) VALUES (?)", (2,))
+    writer.put(INSERT, (3,))
+    writer.start()
+    assert wait_for(lambda: writer.stats()["failed_rows"] == 1)
+    assert wait_for(lambda: count(path) == 2)
+    assert writer.stats()["rows_written"] == 2
+
+
+# Внутри не прошедшего вида запроса теряется только плохая строка
+def test_bad_row_is_skipped_row_by_row(tmp_path):
+    path = str(tmp_path / "w.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (v INTEGER CHECK (v >= 0))")
+    conn.commit()
+    conn.close()
+    writer = SQLiteWriter(path, max_delay=0.5)
+    writer.put_many(INSERT, [(1,), (-1,), (2,)])
+    writer.start()
+    assert wait_for(lambda: writer.stats()["failed_rows"] == 1)
+    assert wait_for(lambda: count(path) == 2)
@@ -1,226 +1,198 @@
 
 # === МОДУЛЬ IMPORT ===
-import os
 import time
-import json
-import threading
-import psycopg2
-import websocket
-
-# Подключение к PostgreSQL
-PG_HOST = os.environ.get("PG_HOST")
-PG_PORT = os.environ.get("PG_PORT", 5432)
-PG_NAME = os.environ.get("PG_NAME")
-PG_USER = os.environ.get("PG_USER")
-PG_PASSWORD = os.environ.get("PG_PASSWORD")
+
+from backfill import MINUTE_MS, GapFiller, kline_symbols
+from binance_stream import BinanceStreamClient
+
+# Подключение к PostgreSQL — общий пул (PG_* и PG_POOL_* в окружении)
+from pg_pool import pg_connection
+from pg_writer import PGBatchWriter
+from pg_partitions import PGPartitions
+from price_board import PriceBoard
 
 # === МОДУЛЬ 1: Загрузка списка символов из таблицы symbols ===
 def load_symbols():
     try:
         print("🔎 Загружаем символы...")
-        conn = psycopg2.connect(
-            dbname=PG_NAME,
-            user=PG_USER,
-            password=PG_PASSWORD,
-            host=PG_HOST,
-            port=PG_PORT
-        )
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM symbols")
-        symbols = [row[0].lower() for row in cur.fetchall()]
-        conn.close()
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT name FROM symbols")
+            symbols = [row[0].lower() for row in cur.fetchall()]
         print(f"✅ {len(symbols)} символов загружено")
         return symbols
     except Exception as e:
         print("❌ Ошибка при загрузке symbols:", e)
         return []
 
-# === МОДУЛЬ 2: Поток @trade — запись в словарь latest_price ===
-latest_price = {}
-
-def run_trade_stream():
-    def on_message(ws, msg):
-        try:
-            data = json.loads(msg)
-            trade = data['data']
-            symbol = trade['s'].lower()
-            price = float(trade['p'])
-            latest_price[symbol] = price
-            
-        except Exception as e:
-            print("❌ Ошибка обработки TRADE:", e)
-
-    def run():
-        while True:
-            try:
-                symbols = load_symbols()
-                if not symbols:
-                    print("⚠️ Нет символов для подписки на @trade")
-                    time.sleep(10)
-                    continue
-                streams = [f"{s}@trade" for s in symbols]
-                url = "wss://fstream.binance.com/stream?streams=" + "/".join(streams)
-                print("🔁 Подписка на TRADE:", url)
-                ws = websocket.WebSocketApp(url, on_message=on_message)
-                ws.run_forever()
-            except Exception as e:
-                print("❌ Ошибка WebSocket TRADE:", e)
-                time.sleep(10)
-
-    threading.Thread(target=run, daemon=True).start()
+# === МОДУЛЬ 2: Поток @trade — запись в табло latest_price ===
+latest_price = PriceBoard()
+
+# Обработчик события "trade"
+def on_trade(trade):
+    try:
+        latest_price.update(trade.symbol.lower(), trade.price, trade.event_ms)
+    except Exception as e:
+        print("❌ Ошибка обработки TRADE:", e)
+
 # === МОДУЛЬ 3: Поток @kline_1m — запись в таблицу prices_pg + агрегация M5 ===
 
-def fetch_kline_stream():
-    print("🚀 Запуск потока @kline_1m...", flush=True)
-
-    # Формируем словарь подключения к PostgreSQL один раз
-    conn_params = {
-        "dbname": PG_NAME,
-        "user": PG_USER,
-        "password": PG_PASSWORD,
-        "host": PG_HOST,
-        "port": PG_PORT
-    }
-
-    def on_message(ws, message):
-        try:
-            data = json.loads(message)
-            stream = data.get("stream")
-            payload = data.get("data")
-
-            if not stream or not payload:
-                return
-
-            symbol = stream.split("@")[0].upper()
-            kline = payload.get("k")
-            if not kline or not kline.get("x"):
-                return  # Только закрытые свечи
-
-            kline_data = {
-                "timestamp": int(kline["T"]),
-                "open": kline["o"],
-                "high": kline["h"],
-                "low": kline["l"],
-                "close": kline["c"]
-            }
-
-            # Сохраняем M1-свечу в базу
-            conn = psycopg2.connect(**conn_params)
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO prices_pg (symbol, timestamp, open, high, low, close)
-                VALUES (%s, to_timestamp(%s / 1000), %s, %s, %s, %s)
-            """, (
-                symbol,
-                kline_data["timestamp"],
-                kline_data["open"],
-                kline_data["high"],
-                kline_data["low"],
-                kline_data["close"]
-            ))
-            conn.commit()
-            conn.close()
-
-            print(f"📉 [{symbol}] M1: {kline_data['timestamp']} | {kline_data['close']}", flush=True)
-
-            # ➕ Вызываем агрегацию 5m-свечей
-            process_kline_for_5m(symbol, kline_data, conn_params)
-
-        except Exception as e:
-            print("❌ Ошибка потока @kline_1m:", e, flush=True)
-
-    def on_error(ws, error):
-        print("❌ WebSocket ошибка:", error, flush=True)
-
-    def on_close(ws, close_status_code, close_msg):
-        print("🔌 WebSocket закрыт", flush=True)
-
-    def on_open(ws):
-        print("🟢 Подключено к Binance WebSocket", flush=True)
-        params = [f"{symbol}@kline_1m" for symbol in load_symbols()]
-        payload = {
-            "method": "SUBSCRIBE",
-            "params": params,
-            "id": 1
+# M1-свечи копятся и пишутся одной пачкой на минуту (см. pg_writer.py)
+prices_writer = PGBatchWriter(
+    "prices_pg",
+    ("symbol", "timestamp", "open", "high", "low", "close"),
+    template="(%s, to_timestamp(%s / 1000), %s, %s, %s, %s)"
+)
+# Дневные партиции prices_pg и удаление дней старше PRICES_RETENTION_DAYS
+prices_partitions = PGPartitions("prices_pg")
+
+# Обработчик события "kline": только закрытые M1-свечи
+def on_kline(event):
+    try:
+        symbol = event.symbol.upper()
+        kline = event.kline
+        if not kline.closed:
+            return  # Только закрытые свечи
+
+        kline_data = {
+            "timestamp": kline.close_time,
+            "open_time": kline.open_time,
+            "open": kline.open,
+            "high": kline.high,
+            "low": kline.low,
+            "close": kline.close
         }
-        ws.send(json.dumps(payload))
-
-    ws = websocket.WebSocketApp(
-        "wss://fstream.binance.com/stream",
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close
-    )
 
-    threading.Thread(target=ws.run_forever).start()
+        save_kline(symbol, kline_data)
+        print(f"📉 [{symbol}] M1: {kline_data['timestamp']} | {kline_data['close']}", flush=True)
 
-# === МОДУЛЬ 4: Формирование и сохранение 5-минутных свечей (candles_5m) ===
+    except Exception as e:
+        print("❌ Ошибка потока @kline_1m:", e, flush=True)
 
-from datetime import datetime, timedelta
+def save_kline(symbol, kline_data):
+    # Сохраняем M1-свечу в базу (пакетом вместе с остальными символами)
+    prices_writer.add((
+        symbol,
+        kline_data["timestamp"],
+        kline_data["open"],
+        kline_data["high"],
+        kline_data["low"],
+        kline_data["close"]
+    ))
 
-# Временный буфер по 5 свечей на каждый символ
-buffers_5m = {}
+    # ➕ Обновляем бары 5m/15m/1h/4h
+    process_kline_rollups(symbol, kline_data)
 
-# Агрегация и сохранение одной 5m-свечи
-def aggregate_and_save_5m(symbol, buffer, conn_params):
-    try:
-        if len(buffer) < 5:
-            return  # Недостаточно данных
+# === МОДУЛЬ 4: Старшие таймфреймы (candles_5m / 15m / 1h / 4h) через общий rollups.py ===
 
-        opens = [row['open'] for row in buffer]
-        highs = [row['high'] for row in buffer]
-        lows = [row['low'] for row in buffer]
-        closes = [row['close'] for row in buffer]
-        timestamp = buffer[0]['timestamp']  # время первой свечи (начало интервала)
+from datetime import datetime
+from rollups import Rollups, TIMEFRAMES
 
-        o = opens[0]
-        h = max(highs)
-        l = min(lows)
-        c = closes[-1]
+# Держим в памяти только текущий и предыдущий бар каждого таймфрейма
+rollups = Rollups(retention=2)
 
-        conn = psycopg2.connect(**conn_params)
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO candles_5m (symbol, timestamp, open, high, low, close) VALUES (%s, %s, %s, %s, %s, %s)",
-            (symbol, timestamp, o, h, l, c)
-        )
-        conn.commit()
-        conn.close()
-        print(f"🕔 [candles_5m] {symbol} | {timestamp} | {o}-{h}-{l}-{c}", flush=True)
+# Таблица PostgreSQL для таймфрейма
+def rollup_table(tf):
+    return f"candles_{tf}"
+
+# Создание таблиц 15m/1h/4h (по образцу candles_5m) и индексов (symbol, timestamp)
+def init_rollup_tables():
+    try:
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            for tf in TIMEFRAMES:
+                table = rollup_table(tf)
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        symbol TEXT,
+                        timestamp TIMESTAMP,
+                        open DOUBLE PRECISION,
+                        high DOUBLE PRECISION,
+                        low DOUBLE PRECISION,
+                        close DOUBLE PRECISION
+                    )
+                """)
+                cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_symbol_ts ON {table} (symbol, timestamp)")
     except Exception as e:
-        print(f"❌ Ошибка при сохранении свечи 5m: {e}", flush=True)
-
-# Добавление новой M1-свечи в буфер и проверка на завершение пятиминутки
-def process_kline_for_5m(symbol, kline, conn_params):
-    ts = datetime.fromtimestamp(kline['timestamp'] / 1000).replace(second=0, microsecond=0)
-    ts_5m = ts.replace(minute=(ts.minute // 5) * 5)
-
-    candle = {
-        'timestamp': ts_5m,
-        'open': float(kline['open']),
-        'high': float(kline['high']),
-        'low': float(kline['low']),
-        'close': float(kline['close'])
-    }
-
-    if symbol not in buffers_5m:
-        buffers_5m[symbol] = []
-
-    buf = buffers_5m[symbol]
-
-    # Если новая свеча в пределах текущего интервала — добавляем
-    if not buf or buf[-1]['timestamp'] == candle['timestamp']:
-        buf.append(candle)
-    else:
-        # Интервал сменился → агрегируем старые, сохраняем, сбрасываем
-        aggregate_and_save_5m(symbol, buf, conn_params)
-        buffers_5m[symbol] = [candle]
+        print(f"❌ Ошибка при создании таблиц таймфреймов: {e}", flush=True)
+
+# Пакетные писатели закрытых баров, по одному на таблицу
+rollup_writers = {
+    tf: PGBatchWriter(rollup_table(tf), ("symbol", "timestamp", "open", "high", "low", "close"))
+    for tf in TIMEFRAMES
+}
+
+# Постановка одного закрытого бара в пакет
+def save_rollup_bar(tf, symbol, bar):
+    ts, o, h, l, c = bar
+    timestamp = datetime.fromtimestamp(ts / 1000)  # начало интервала
+    rollup_writers[tf].add((symbol, timestamp, o, h, l, c))
+    print(f"🕔 [{rollup_table(tf)}] {symbol} | {timestamp} | {o}-{h}-{l}-{c}", flush=True)
+
+# Обновление всех таймфреймов новой M1-свечой; пишем только полные закрытые бары
+def process_kline_rollups(symbol, kline):
+    events = rollups.update(
+        symbol, kline["open_time"],
+        kline["open"], kline["high"], kline["low"], kline["close"]
+    )
+    for tf, bar, closed, complete in events:
+        if closed and complete:
+            save_rollup_bar(tf, symbol, bar)
+
+# === МОДУЛЬ 5: Дозаполнение минут, пропущенных за время обрыва (backfill.py) ===
+
+# open_time последней M1-свечи символа в prices_pg (timestamp там — время закрытия)
+def last_open_time(symbol):
+    with pg_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT EXTRACT(EPOCH FROM MAX(timestamp)) FROM prices_pg WHERE symbol = %s", (symbol.upper(),))
+        row = cur.fetchone()
+    if not row or row[0] is None:
+        return None
+    return int(float(row[0]) * 1000) // MINUTE_MS * MINUTE_MS
+
+def store_backfill(symbol, rows):
+    for open_time, close_time, o, h, l, c in rows:
+        save_kline(symbol.upper(), {
+            "timestamp": close_time,
+            "open_time": open_time,
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c
+        })
+
+gap_filler = GapFiller(last_open_time, store_backfill)
+
+# === МОДУЛЬ 6: Один asyncio-клиент Binance на @trade и @kline_1m (binance_stream.py) ===
+
+def load_stream_names():
+    symbols = load_symbols()
+    if not symbols:
+        print("⚠️ Нет символов для подписки")
+    return [f"{s}@kline_1m" for s in symbols] + [f"{s}@trade" for s in symbols]
+
+# перед подпиской каждого шарда — дозаполнение пропусков по его символам
+binance = BinanceStreamClient(
+    streams_provider=load_stream_names,
+    on_connect=lambda streams: gap_filler.fill(kline_symbols(streams)),
+)
+binance.on("trade", on_trade)
+binance.on("kline", on_kline)
+
+def start_streams():
+    print("🚀 Запуск потоков @trade + @kline_1m...", flush=True)
+    init_rollup_tables()
+    # дневные партиции — до уникального индекса под ON CONFLICT (см. pg_partitions.py)
+    prices_partitions.ensure_partitioned().start()
+    prices_writer.ensure_unique().start()
+    for writer in rollup_writers.values():
+        writer.ensure_unique().start()
+    binance.start_in_thread()
 
 # === МОДУЛЬ ENTRYPOINT ===
 if __name__ == "__main__":
     print("🚀 Background Worker: TRADE + KLINE PostgreSQL")
-    run_trade_stream()
-    fetch_kline_stream()
+    start_streams()
     while True:
         time.sleep(60)